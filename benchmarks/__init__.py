@@ -0,0 +1 @@
+from .synthetic_book import generate_book
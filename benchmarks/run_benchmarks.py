@@ -0,0 +1,333 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from nlp import (
+    AfinnScorer,
+    analyse_sentiments,
+    collate_relations,
+    consolidate_main_char,
+    get_main_char,
+    get_relevant_sentences_in_chapter
+)
+
+from .synthetic_book import generate_book
+
+
+STAGES = ("get_main_char", "consolidate_main_char", "get_relevant_sentences_in_chapter", "analyse_sentiments", "collate_relations")
+
+BASE_PARAMS = {
+    "num_chapters": 20,
+    "tokens_per_chapter": 5000,
+    "num_characters": 100,
+    "quote_density": 0.1
+}
+
+DEFAULT_SWEEPS = {
+    "num_chapters": [10, 40, 160],
+    "tokens_per_chapter": [2000, 8000, 32000],
+    "num_characters": [25, 100, 400],
+    "quote_density": [0.0, 0.1, 0.3]
+}
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+def measure(func: Callable[[], any], repeat: int = 3, trace_memory: bool = True) -> dict[str, any]:
+    """Runs `func` `repeat` times and returns its wall and CPU times in seconds. With `trace_memory`, it is run once more
+    under `tracemalloc` for the peak memory allocated by Python and numpy, which is left out of the timings as tracing
+    slows it down. Output printed by `func` is discarded."""
+
+    wall_times, cpu_times = [], []
+
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        for _ in range(repeat):
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            func()
+            wall_times.append(time.perf_counter() - wall_start)
+            cpu_times.append(time.process_time() - cpu_start)
+
+        peak_memory_mb = None
+        if trace_memory:
+            tracemalloc.start()
+            try:
+                func()
+                peak_memory_mb = tracemalloc.get_traced_memory()[1] / 2**20
+            finally:
+                tracemalloc.stop()
+
+    return {
+        "wall_s": wall_times,
+        "cpu_s": cpu_times,
+        "min_wall_s": min(wall_times),
+        "median_wall_s": statistics.median(wall_times),
+        "peak_memory_mb": peak_memory_mb
+    }
+
+
+def benchmark_book(book: dict[str, any], repeat: int = 3, trace_memory: bool = True) -> dict[str, dict[str, any]]:
+    """Benchmarks every stage in `STAGES` on a book written by `generate_book`, in pipeline order, each stage running
+    on the outputs of the previous one. `get_relevant_sentences_in_chapter` is timed over all the chapters."""
+
+    ner_coref_data_dir = book["ner_coref_data_dir"]
+    characters_data_dir = book["characters_data_dir"]
+    chapters = sorted(os.listdir(ner_coref_data_dir))
+    sentiment_scorer = AfinnScorer()
+
+    def link_chapters() -> None:
+        with open(os.path.join(characters_data_dir, 'chapters_coref.json'), 'r') as file:
+            chapters_coref = json.load(file)
+
+        with open(os.path.join(characters_data_dir, 'consolidated_indices.json'), 'r') as file:
+            consolidated_indices = json.load(file)
+
+        for chapter in chapters:
+            get_relevant_sentences_in_chapter(
+                chapter, ner_coref_data_dir, book["text_dir"], chapters_coref, consolidated_indices, verbose=False
+            )
+
+    stages = {
+        "get_main_char": lambda: get_main_char(ner_coref_data_dir, characters_data_dir),
+        "consolidate_main_char": lambda: consolidate_main_char(characters_data_dir),
+        "get_relevant_sentences_in_chapter": link_chapters,
+        "analyse_sentiments": lambda: analyse_sentiments(ner_coref_data_dir, characters_data_dir, sentiment_scorer),
+        "collate_relations": lambda: collate_relations(characters_data_dir)
+    }
+
+    results = {}
+    for stage in STAGES:
+        results[stage] = measure(stages[stage], repeat, trace_memory)
+
+        if stage == "get_relevant_sentences_in_chapter":
+            results[stage]["median_wall_s_per_chapter"] = results[stage]["median_wall_s"] / max(len(chapters), 1)
+
+    return results
+
+
+def get_sweep_params(sweeps: dict[str, list], base_params: dict[str, any]) -> list[dict[str, any]]:
+    """Varies one parameter at a time from `base_params`, without repeating a combination"""
+
+    all_params = []
+    for param, values in sweeps.items():
+        for value in values:
+            params = {**base_params, param: value}
+            if params not in all_params:
+                all_params.append(params)
+
+    return all_params
+
+
+def _get_commit() -> tuple[str | None, bool | None]:
+    repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=repo_dir, capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=repo_dir, capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+    return commit, bool(status.strip())
+
+
+def run_benchmarks(
+    output_file: str | None = None,
+    sweeps: dict[str, list] | None = None,
+    base_params: dict[str, any] | None = None,
+    repeat: int = 3,
+    data_dir: str | None = None,
+    trace_memory: bool = True,
+    seed: int = 0
+) -> dict[str, any]:
+    """Benchmarks the pipeline stages on synthetic books (see `generate_book`) across `sweeps` of the book parameters,
+    varying one parameter at a time from `base_params`, and writes the results as JSON.
+
+    The results hold the commit and environment they were measured on, and the book sizes and stage timings of every
+    run, so the files of two commits can be compared with `compare_results`. They are written to `output_file`, by
+    default `benchmarks/results/<date>-<commit>.json`. Generated books are kept in `data_dir` (by default in the
+    temporary directory) and reused by later runs with the same parameters."""
+
+    sweeps = DEFAULT_SWEEPS if sweeps is None else sweeps
+    base_params = {**BASE_PARAMS, **(base_params or {})}
+    data_dir = os.path.join(tempfile.gettempdir(), 'character-relationship-benchmarks') if data_dir is None else data_dir
+
+    commit, is_dirty = _get_commit()
+    results = {
+        "commit": commit,
+        "dirty": is_dirty,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "cpu_count": os.cpu_count()
+        },
+        "repeat": repeat,
+        "runs": []
+    }
+
+    for params in get_sweep_params(sweeps, base_params):
+        book_name = '-'.join(f"{param}={value}" for param, value in sorted(params.items())) + f"-seed={seed}"
+        book = generate_book(os.path.join(data_dir, book_name), **params, seed=seed)
+
+        print(f"Benchmarking {book_name}")
+        stages = benchmark_book(book, repeat, trace_memory)
+        for stage, stage_results in stages.items():
+            print(f"    {stage}: {stage_results['median_wall_s']:.3f}s")
+
+        results["runs"].append({"params": params, "sizes": book["sizes"], "stages": stages})
+
+    if output_file is None:
+        date = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        output_file = os.path.join(RESULTS_DIR, f"{date}-{(commit or 'unknown')[:8]}.json")
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+
+    with open(output_file, 'w') as file:
+        json.dump(results, file, indent=4)
+
+    print(f"Results written to {output_file}")
+
+    return results
+
+
+def compare_results(base_file: str, new_file: str, threshold: float = 0.1) -> list[dict[str, any]]:
+    """Compares the median wall times and peak memory of the runs with the same parameters in two results files
+    written by `run_benchmarks`. Returns a row per run and stage with the ratios of new to base, `is_regression` being
+    set when either ratio exceeds `1 + threshold`."""
+
+    with open(base_file, 'r') as file:
+        base_runs = json.load(file)["runs"]
+
+    with open(new_file, 'r') as file:
+        new_runs = json.load(file)["runs"]
+
+    rows = []
+    for new_run in new_runs:
+        base_run = next((run for run in base_runs if run["params"] == new_run["params"]), None)
+        if base_run is None:
+            continue
+
+        for stage, new_stage in new_run["stages"].items():
+            base_stage = base_run["stages"].get(stage)
+            if base_stage is None:
+                continue
+
+            time_ratio = new_stage["median_wall_s"] / max(base_stage["median_wall_s"], 1e-9)
+            memory_ratio = None
+            if new_stage["peak_memory_mb"] is not None and base_stage["peak_memory_mb"] is not None:
+                memory_ratio = new_stage["peak_memory_mb"] / max(base_stage["peak_memory_mb"], 1e-9)
+
+            rows.append({
+                "params": new_run["params"],
+                "stage": stage,
+                "base_wall_s": base_stage["median_wall_s"],
+                "new_wall_s": new_stage["median_wall_s"],
+                "time_ratio": time_ratio,
+                "memory_ratio": memory_ratio,
+                "is_regression": time_ratio > 1 + threshold or (memory_ratio is not None and memory_ratio > 1 + threshold)
+            })
+
+    return rows
+
+
+def _parse_sweep(sweep: str) -> tuple[str, list]:
+    param, values = sweep.split('=', 1)
+    if param not in BASE_PARAMS:
+        raise ValueError(f"Unknown benchmark parameter '{param}'!")
+
+    value_type = type(BASE_PARAMS[param])
+
+    return param, [value_type(value) for value in values.split(',')]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pipeline benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    # Arguments
+    run_parser = subparsers.add_parser("run", help="Benchmark the pipeline stages on synthetic books")
+    run_parser.add_argument(
+        "-s",
+        "--sweep",
+        type=str,
+        action="append",
+        help="Parameter and values to sweep, e.g. num_chapters=10,40,160 (default: sweeps of every parameter)",
+        required=False,
+        default=None
+    )
+    run_parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        help="Timed runs of every stage",
+        required=False,
+        default=3
+    )
+    run_parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        help="Results file",
+        required=False,
+        default=None
+    )
+    run_parser.add_argument(
+        "-d",
+        "--data-dir",
+        type=str,
+        help="Directory of the generated books",
+        required=False,
+        default=None
+    )
+    run_parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="Skip the traced run measuring peak memory"
+    )
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two results files")
+    compare_parser.add_argument(
+        "base",
+        type=str,
+        help="Results file of the base commit"
+    )
+    compare_parser.add_argument(
+        "new",
+        type=str,
+        help="Results file of the new commit"
+    )
+    compare_parser.add_argument(
+        "-t",
+        "--threshold",
+        type=float,
+        help="Relative slowdown or memory growth reported as a regression",
+        required=False,
+        default=0.1
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        sweeps = dict(_parse_sweep(sweep) for sweep in args.sweep) if args.sweep else None
+        run_benchmarks(args.output, sweeps, repeat=args.repeat, data_dir=args.data_dir, trace_memory=not args.no_memory)
+    else:
+        for row in compare_results(args.base, args.new, args.threshold):
+            params = ', '.join(f"{param}={value}" for param, value in row["params"].items())
+            memory = f"{row['memory_ratio']:.2f}x" if row["memory_ratio"] is not None else "-"
+            flag = "  REGRESSION" if row["is_regression"] else ""
+            print(f"{row['stage']:<36} {row['time_ratio']:.2f}x time, {memory} memory  ({params}){flag}")
@@ -0,0 +1,332 @@
+import json
+import os
+import random
+
+import numpy as np
+
+
+TOKEN_COLUMNS = (
+    "paragraph_ID", "sentence_ID", "token_ID_within_sentence", "token_ID_within_document", "word", "lemma", "byte_onset",
+    "byte_offset", "POS_tag", "fine_POS_tag", "dependency_relation", "syntactic_head_ID", "event"
+)
+ENTITY_COLUMNS = ("COREF", "start_token", "end_token", "prop", "cat", "text")
+QUOTE_COLUMNS = ("quote_start", "quote_end", "mention_start", "mention_end", "mention_phrase", "char_id", "quote")
+
+# (word, POS_tag, fine_POS_tag, relative frequency). Some of the words are in the AFINN lexicon so sentences get scores.
+VOCABULARY = (
+    ("the", "DET", "DT", 12), ("a", "DET", "DT", 6), ("and", "CCONJ", "CC", 6), ("to", "ADP", "TO", 6),
+    ("of", "ADP", "IN", 5), ("in", "ADP", "IN", 4), ("with", "ADP", "IN", 2), ("was", "AUX", "VBD", 5),
+    ("not", "PART", "RB", 2), ("it", "PRON", "PRP", 3), ("that", "SCONJ", "IN", 3), ("door", "NOUN", "NN", 1),
+    ("street", "NOUN", "NN", 1), ("hand", "NOUN", "NN", 1), ("room", "NOUN", "NN", 1), ("light", "NOUN", "NN", 1),
+    ("voice", "NOUN", "NN", 1), ("mask", "NOUN", "NN", 1), ("city", "NOUN", "NN", 1), ("window", "NOUN", "NN", 1),
+    ("moment", "NOUN", "NN", 1), ("friend", "NOUN", "NN", 1), ("enemy", "NOUN", "NN", 1), ("walked", "VERB", "VBD", 2),
+    ("looked", "VERB", "VBD", 2), ("turned", "VERB", "VBD", 2), ("saw", "VERB", "VBD", 2), ("ran", "VERB", "VBD", 1),
+    ("felt", "VERB", "VBD", 1), ("smiled", "VERB", "VBD", 1), ("hated", "VERB", "VBD", 1), ("loved", "VERB", "VBD", 1),
+    ("killed", "VERB", "VBD", 1), ("helped", "VERB", "VBD", 1), ("laughed", "VERB", "VBD", 1), ("attacked", "VERB", "VBD", 1),
+    ("dark", "ADJ", "JJ", 1), ("good", "ADJ", "JJ", 1), ("bad", "ADJ", "JJ", 1), ("happy", "ADJ", "JJ", 1),
+    ("sad", "ADJ", "JJ", 1), ("great", "ADJ", "JJ", 1), ("wrong", "ADJ", "JJ", 1), ("angry", "ADJ", "JJ", 1),
+    ("quiet", "ADJ", "JJ", 1), ("cold", "ADJ", "JJ", 1), ("terrible", "ADJ", "JJ", 1)
+)
+
+COMMON_MENTIONS = ("the girl", "the man", "the woman", "the boy", "the officer", "the villain", "the hero")
+SPEECH_VERBS = ("said", "asked", "shouted", "whispered")
+
+_SYLLABLES = (
+    "ta", "lor", "li", "sa", "bri", "an", "ra", "chel", "em", "ma", "so", "phi", "jack", "ar", "mi", "dra", "gon", "lung",
+    "ka", "tri", "na", "vel", "do", "mir", "ce", "lia", "ro", "ven", "gri", "sel", "tho", "ber", "qui", "nn"
+)
+
+_GENDER_PRONOUNS = {"he/him/his": ("he", "him", "his"), "she/her": ("she", "her", "her"), "they/them/their": ("they", "them", "their")}
+
+
+def get_chapter_name(chapter_num: int) -> str:
+    """Names chapters like `split_chapters`, so `chapter.split('-')[1]` is the chapter number"""
+
+    return f"Part-{chapter_num}-Chapter_{chapter_num}"
+
+
+def _get_character_names(rng: random.Random, num_characters: int) -> list[tuple[str, str]]:
+    """Returns unique `(first_name, surname)` pairs"""
+
+    def get_name() -> str:
+        return ''.join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 3))).capitalize()
+
+    names = []
+    first_names = set()
+
+    while len(names) < num_characters:
+        first_name = get_name()
+        if first_name in first_names:
+            continue
+
+        first_names.add(first_name)
+        names.append((first_name, get_name()))
+
+    return names
+
+
+class _ChapterWriter():
+    """Builds the text and the BookNLP tables of a chapter token by token"""
+
+    def __init__(self) -> None:
+        self.text = []
+        self.length = 0
+        self.tokens = []
+        self.entities = []
+        self.quotes = []
+
+        self.paragraph_id = 0
+        self.sentence_id = 0
+        self.sentence_start = 0
+        self.space_before = False
+
+    def add_token(self, word: str, pos: str, fine_pos: str, space_before: bool = True, dependency: str = "dep") -> int:
+        if self.space_before and space_before:
+            self.text.append(" ")
+            self.length += 1
+
+        token_id = len(self.tokens)
+        self.tokens.append([
+            self.paragraph_id, self.sentence_id, token_id - self.sentence_start, token_id, word, word.lower(), self.length,
+            self.length + len(word), pos, fine_pos, dependency, self.sentence_start, "EVENT" if pos == "VERB" else "O"
+        ])
+        self.text.append(word)
+        self.length += len(word)
+        self.space_before = True
+
+        return token_id
+
+    def add_mention(self, coref: int, text: str, prop: str) -> tuple[int, int]:
+        words = text.split()
+        pos, fine_pos = {"PROP": ("PROPN", "NNP"), "PRON": ("PRON", "PRP"), "NOM": ("NOUN", "NN")}[prop]
+
+        start = len(self.tokens)
+        for idx, word in enumerate(words):
+            is_head = idx == len(words) - 1
+            self.add_token(word, pos if is_head or prop != "NOM" else "DET", fine_pos if is_head or prop != "NOM" else "DT")
+
+        self.entities.append((coref, start, len(self.tokens) - 1, prop, "PER", text))
+
+        return start, len(self.tokens) - 1
+
+    def end_sentence(self, punctuation: str = ".") -> None:
+        self.add_token(punctuation, "PUNCT", ".", space_before=False, dependency="punct")
+        self.sentence_id += 1
+        self.sentence_start = len(self.tokens)
+
+    def end_paragraph(self) -> None:
+        self.text.append("\n\n")
+        self.length += 2
+        self.paragraph_id += 1
+        self.space_before = False
+
+
+def generate_chapter(
+    rng: random.Random,
+    num_tokens: int,
+    cast: list[dict[str, any]],
+    quote_density: float = 0.1,
+    mention_rate: float = 0.15
+) -> tuple[str, list[list], list[tuple], list[tuple], list[dict[str, any]]]:
+    """Generates the text, tokens, entities, quotes and .book characters of a chapter of about `num_tokens` tokens.
+
+    `cast` lists the characters of the chapter, as dicts with a `weight` of being mentioned, their `names` (the proper
+    mentions used for them) and `gender`. Mentions are proper names, pronouns or common nouns, taking about
+    `mention_rate` of the tokens. A `quote_density` fraction of the sentences are quotes attributed to a speaker."""
+
+    chapter = _ChapterWriter()
+    words = [word for word, *_ in VOCABULARY]
+    word_info = {word: (pos, fine_pos) for word, pos, fine_pos, _ in VOCABULARY}
+    word_weights = [weight for *_, weight in VOCABULARY]
+
+    cast_weights = [character["weight"] for character in cast]
+
+    # Coref ids of the chapter, given in order of first mention like BookNLP
+    coref_ids = {}
+    mentions = {}
+
+    def add_mention(character_idx: int) -> tuple[int, int]:
+        character = cast[character_idx]
+        coref = coref_ids.setdefault(character_idx, len(coref_ids))
+
+        prop = rng.choices(("PROP", "PRON", "NOM"), weights=(5, 4, 1))[0] if character_idx in mentions else "PROP"
+        if prop == "PROP":
+            text = rng.choices(character["names"], weights=character["name_weights"])[0]
+        elif prop == "PRON":
+            text = rng.choice(_GENDER_PRONOUNS[character["gender"]])
+        else:
+            text = character["common"]
+
+        mentions.setdefault(character_idx, []).append((prop, text, len(chapter.tokens)))
+
+        return chapter.add_mention(coref, text, prop)
+
+    def add_words(count: int) -> None:
+        for _ in range(count):
+            if cast and rng.random() < mention_rate:
+                add_mention(rng.choices(range(len(cast)), weights=cast_weights)[0])
+            else:
+                word = rng.choices(words, weights=word_weights)[0]
+                chapter.add_token(word, *word_info[word])
+
+    while len(chapter.tokens) < num_tokens:
+        for _ in range(rng.randint(1, 6)):
+            if cast and rng.random() < quote_density:
+                quote_start = chapter.add_token('"', "PUNCT", "``", dependency="punct")
+                chapter.space_before = False
+                add_words(rng.randint(3, 20))
+                chapter.add_token(",", "PUNCT", ",", space_before=False, dependency="punct")
+                quote_end = chapter.add_token('"', "PUNCT", "''", space_before=False, dependency="punct")
+
+                speaker_idx = rng.choices(range(len(cast)), weights=cast_weights)[0]
+                mention_start, mention_end = add_mention(speaker_idx)
+                chapter.add_token(rng.choice(SPEECH_VERBS), "VERB", "VBD")
+                chapter.end_sentence()
+
+                quote_text = ' '.join(token[4] for token in chapter.tokens[quote_start + 1:quote_end - 1])
+                mention_phrase = ' '.join(token[4] for token in chapter.tokens[mention_start:mention_end + 1])
+                chapter.quotes.append((quote_start, quote_end, mention_start, mention_end, mention_phrase, coref_ids[speaker_idx], quote_text))
+            else:
+                add_words(rng.randint(4, 30))
+                chapter.end_sentence(rng.choices((".", "!", "?"), weights=(8, 1, 1))[0])
+
+        chapter.end_paragraph()
+
+    characters = []
+    for character_idx, character_mentions in mentions.items():
+        character = cast[character_idx]
+        texts = {"PROP": {}, "NOM": {}, "PRON": {}}
+        agents = []
+
+        for prop, text, token_id in character_mentions:
+            texts[prop][text] = texts[prop].get(text, 0) + 1
+
+            if token_id + 1 < len(chapter.tokens) and chapter.tokens[token_id + 1][8] == "VERB":
+                agents.append({"w": chapter.tokens[token_id + 1][5], "i": token_id + 1})
+
+        characters.append({
+            "agent": agents,
+            "patient": [],
+            "mod": [],
+            "poss": [],
+            "id": coref_ids[character_idx],
+            "g": {"inference": {character["gender"]: 1.0}, "argmax": character["gender"], "max": 1.0, "total": len(character_mentions)},
+            "count": len(character_mentions),
+            "mentions": {
+                mention_type: [{"c": count, "n": text} for text, count in sorted(texts[prop].items(), key=lambda item: -item[1])]
+                for prop, mention_type in (("PROP", "proper"), ("NOM", "common"), ("PRON", "pronoun"))
+            }
+        })
+
+    characters.sort(key=lambda character: -character["count"])
+
+    return ''.join(chapter.text).rstrip(), chapter.tokens, chapter.entities, chapter.quotes, characters
+
+
+def _write_table(file_path: str, columns: tuple[str, ...], rows: list) -> None:
+    # Written unquoted like BookNLP, so quote marks stay as they are in the text
+    with open(file_path, 'w', encoding='utf-8') as file:
+        file.write('\t'.join(columns) + '\n')
+        file.writelines('\t'.join(map(str, row)) + '\n' for row in rows)
+
+
+def generate_book(
+    output_dir: str,
+    num_chapters: int = 10,
+    tokens_per_chapter: int = 5000,
+    num_characters: int = 50,
+    quote_density: float = 0.1,
+    num_main_characters: int | None = None,
+    seed: int = 0
+) -> dict[str, any]:
+    """Writes a synthetic book in the layout the pipeline expects, for benchmarks: the chapter texts to
+    `output_dir/text/`, the BookNLP outputs of every chapter (.tokens, .entities, .quotes and .book) to
+    `output_dir/booknlp_output/` and main_characters_aliases.json to `output_dir/characters/`.
+
+    Characters are mentioned with Zipf-like frequencies and every chapter features a subset of them, more prominent
+    characters being more likely to appear. Each character is named by their first name or full name, both of which
+    are aliases of the `num_main_characters` (all by default) most prominent characters. Returns the paths and sizes
+    of the book, which are also written to `output_dir/book.json`; a book already generated with the same parameters
+    is not generated again."""
+
+    params = {
+        "num_chapters": num_chapters,
+        "tokens_per_chapter": tokens_per_chapter,
+        "num_characters": num_characters,
+        "quote_density": quote_density,
+        "num_main_characters": num_main_characters,
+        "seed": seed
+    }
+
+    info_path = os.path.join(output_dir, 'book.json')
+    if os.path.exists(info_path):
+        with open(info_path, 'r') as file:
+            info = json.load(file)
+
+        if info["params"] == params:
+            return info
+
+    rng = random.Random(seed)
+
+    characters = []
+    for rank, (first_name, surname) in enumerate(_get_character_names(rng, num_characters)):
+        characters.append({
+            "weight": 1 / (rank + 1) ** 1.1,
+            "names": [first_name, f"{first_name} {surname}"],
+            "name_weights": [3, 1] if rng.random() < 0.5 else [1, 3],
+            "gender": rng.choices(list(_GENDER_PRONOUNS), weights=(10, 10, 1))[0],
+            "common": rng.choice(COMMON_MENTIONS)
+        })
+
+    text_dir = os.path.join(output_dir, 'text')
+    ner_coref_data_dir = os.path.join(output_dir, 'booknlp_output')
+    characters_data_dir = os.path.join(output_dir, 'characters')
+    for dir_path in (text_dir, ner_coref_data_dir, characters_data_dir):
+        os.makedirs(dir_path, exist_ok=True)
+
+    weights = np.array([character["weight"] for character in characters])
+    cast_size = min(num_characters, max(2, int(np.sqrt(num_characters) * 3)))
+    np_rng = np.random.default_rng(seed)
+    sizes = {"tokens": 0, "sentences": 0, "entities": 0, "quotes": 0}
+
+    for chapter_num in range(1, num_chapters + 1):
+        chapter = get_chapter_name(chapter_num)
+        cast_idx = np_rng.choice(num_characters, size=cast_size, replace=False, p=weights / weights.sum()) if num_characters else []
+        cast = [characters[idx] for idx in sorted(cast_idx)]
+
+        text, tokens, entities, quotes, book_characters = generate_chapter(rng, tokens_per_chapter, cast, quote_density)
+
+        with open(os.path.join(text_dir, f"{chapter}.txt"), 'w', encoding='utf-8') as file:
+            file.write(text)
+
+        chapter_dir = os.path.join(ner_coref_data_dir, chapter)
+        os.makedirs(chapter_dir, exist_ok=True)
+
+        _write_table(os.path.join(chapter_dir, f"{chapter}.tokens"), TOKEN_COLUMNS, tokens)
+        _write_table(os.path.join(chapter_dir, f"{chapter}.entities"), ENTITY_COLUMNS, entities)
+        _write_table(os.path.join(chapter_dir, f"{chapter}.quotes"), QUOTE_COLUMNS, quotes)
+
+        with open(os.path.join(chapter_dir, f"{chapter}.book"), 'w') as file:
+            json.dump({"characters": book_characters}, file)
+
+        sizes["tokens"] += len(tokens)
+        sizes["sentences"] += tokens[-1][1] + 1 if tokens else 0
+        sizes["entities"] += len(entities)
+        sizes["quotes"] += len(quotes)
+
+    num_main_characters = num_characters if num_main_characters is None else min(num_main_characters, num_characters)
+    with open(os.path.join(characters_data_dir, 'main_characters_aliases.json'), 'w') as file:
+        json.dump([character["names"] for character in characters[:num_main_characters]], file, indent=4)
+
+    info = {
+        "params": params,
+        "text_dir": text_dir,
+        "ner_coref_data_dir": ner_coref_data_dir,
+        "characters_data_dir": characters_data_dir,
+        "sizes": sizes
+    }
+
+    with open(info_path, 'w') as file:
+        json.dump(info, file, indent=4)
+
+    return info
@@ -1,8 +1,21 @@
-from .consolidate_main_char import consolidate_main_char
+from .booknlp_loader import load_booknlp_table, load_entities, load_quotes, load_tokens
+from .chunk_stitching import stitch_chunks
+from .consolidate_main_char import consolidate_main_char, suggest_main_char_aliases
+from .filter_rules import FilterRules
+from .frontend_export import export_frontend_data
 from .get_main_char import get_main_char
+from .graph_layout import export_layouts
 from .get_relevant_sentences import get_relevant_sentences_in_book, get_relevant_sentences_in_chapter
+from .instrumentation import RunMetrics
 from .ner_coref import run_ner_coref
-from .sentiment_analysis import analyse_sentiments, collate_relations
+from .pipeline import BuildManifest, run_pipeline
+from .relations import RelationsIndex, RelationsStore, SparseRelations, load_relations
+from .sentence_store import export_relevant_sentences_csv, read_relevant_sentences, write_relevant_sentences
+from .sentiment_analysis import analyse_sentiments, collate_relations, get_interactions
+from .stream_pipeline import stream_pipeline
 
 from .sentiment_scorer.base_scorer import BaseScorer
 from .sentiment_scorer.afinn_scorer import AfinnScorer
+from .sentiment_scorer.lexicon_scorer import LexiconScorer
+from .sentiment_scorer.parallel_scorer import ParallelScorer
+from .sentiment_scorer.score_cache import ScoreCache
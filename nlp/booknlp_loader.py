@@ -0,0 +1,178 @@
+import csv
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# Columns of the tab-separated files written by BookNLP and the dtype each is parsed as
+TABLE_DTYPES = {
+    "tokens": {
+        "paragraph_ID": np.int32,
+        "sentence_ID": np.int32,
+        "token_ID_within_sentence": np.int32,
+        "token_ID_within_document": np.int32,
+        "word": str,
+        "lemma": str,
+        "byte_onset": np.int32,
+        "byte_offset": np.int32,
+        "POS_tag": 'category',
+        "fine_POS_tag": 'category',
+        "dependency_relation": 'category',
+        "syntactic_head_ID": np.int32,
+        "event": 'category'
+    },
+    "entities": {
+        "COREF": np.int32,
+        "start_token": np.int32,
+        "end_token": np.int32,
+        "prop": 'category',
+        "cat": 'category',
+        "text": str
+    },
+    "quotes": {
+        "quote_start": np.int32,
+        "quote_end": np.int32,
+        "mention_start": np.int32,
+        "mention_end": np.int32,
+        "mention_phrase": str,
+        "char_id": np.int32,
+        "quote": str
+    }
+}
+
+# Columns that may be empty, read as -1
+NULLABLE_COLUMNS = {"COREF", "char_id"}
+
+# Columns read by `link_sentences`
+LINKING_COLUMNS = {
+    "tokens": ["paragraph_ID", "sentence_ID", "token_ID_within_document", "byte_onset", "byte_offset", "POS_tag"],
+    "entities": ["COREF", "start_token", "end_token"],
+    "quotes": ["quote_start", "quote_end", "char_id"]
+}
+
+
+def get_sidecar_dir(chapter_dir: str, chapter: str, table: str) -> str:
+    return os.path.join(chapter_dir, f"{chapter}.{table}.columns")
+
+
+def _read_tsv(file_path: str, table: str, columns: list[str]) -> pd.DataFrame:
+    dtypes = TABLE_DTYPES[table]
+
+    df = pd.read_csv(
+        file_path,
+        delimiter='\t',
+        quoting=csv.QUOTE_NONE,
+        usecols=columns,
+        # Tokens such as "null" or "NaN" are words, not missing values
+        keep_default_na=False,
+        na_values={column: [''] for column in columns if column in NULLABLE_COLUMNS},
+        dtype={column: 'Int32' if column in NULLABLE_COLUMNS else dtypes[column] for column in columns}
+    )
+
+    for column in columns:
+        if column in NULLABLE_COLUMNS:
+            df[column] = df[column].fillna(-1).astype(np.int32)
+
+    return df[columns]
+
+
+def _read_sidecar_meta(sidecar_dir: str, source_stat: os.stat_result) -> dict[str, any]:
+    meta_path = os.path.join(sidecar_dir, 'meta.json')
+
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r') as file:
+            meta = json.load(file)
+
+        if meta["size"] == source_stat.st_size and meta["mtime_ns"] == source_stat.st_mtime_ns:
+            return meta
+
+    return {"size": source_stat.st_size, "mtime_ns": source_stat.st_mtime_ns, "columns": {}}
+
+
+def _write_sidecar(sidecar_dir: str, meta: dict[str, any], df: pd.DataFrame) -> None:
+    os.makedirs(sidecar_dir, exist_ok=True)
+
+    for column in df.columns:
+        values = df[column]
+        column_path = os.path.join(sidecar_dir, f"{column}.npy")
+
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            np.save(column_path + '.tmp.npy', values.cat.codes.to_numpy())
+            meta["columns"][column] = {"categories": values.cat.categories.tolist()}
+        else:
+            np.save(column_path + '.tmp.npy', values.to_numpy())
+            meta["columns"][column] = {}
+
+        os.replace(column_path + '.tmp.npy', column_path)
+
+    # The meta file is replaced last, so it never lists a column that was not fully written
+    with open(os.path.join(sidecar_dir, 'meta.json.tmp'), 'w') as file:
+        json.dump(meta, file)
+
+    os.replace(os.path.join(sidecar_dir, 'meta.json.tmp'), os.path.join(sidecar_dir, 'meta.json'))
+
+
+def load_booknlp_table(
+    chapter_dir: str,
+    chapter: str,
+    table: str,
+    columns: list[str] | None = None,
+    use_sidecar: bool = False
+) -> pd.DataFrame:
+    """Loads the `columns` (all columns by default) of the `.tokens`, `.entities` or `.quotes` file of a chapter with compact
+    dtypes: int32 ids and offsets, and categorical tags.
+
+    With `use_sidecar`, numeric and categorical columns are converted once into `.npy` files in a `<chapter>.<table>.columns`
+    directory next to the table, and memory-mapped on later loads instead of reparsing the table. The sidecar is
+    rebuilt when the table changes."""
+
+    if table not in TABLE_DTYPES:
+        raise ValueError(f"Unknown BookNLP table '{table}'!")
+
+    dtypes = TABLE_DTYPES[table]
+    columns = list(dtypes) if columns is None else list(columns)
+    file_path = os.path.join(chapter_dir, f"{chapter}.{table}")
+
+    if not use_sidecar:
+        return _read_tsv(file_path, table, columns)
+
+    sidecar_dir = get_sidecar_dir(chapter_dir, chapter, table)
+    meta = _read_sidecar_meta(sidecar_dir, os.stat(file_path))
+
+    # Strings are not stored in the sidecar
+    missing_columns = [column for column in columns if dtypes[column] is str or column not in meta["columns"]]
+    data = {}
+
+    if missing_columns:
+        df = _read_tsv(file_path, table, missing_columns)
+        data.update(df.items())
+
+        new_columns = [column for column in missing_columns if dtypes[column] is not str]
+        if new_columns:
+            _write_sidecar(sidecar_dir, meta, df[new_columns])
+
+    for column in columns:
+        if column in data:
+            continue
+
+        values = np.load(os.path.join(sidecar_dir, f"{column}.npy"), mmap_mode='r')
+        if "categories" in meta["columns"][column]:
+            values = pd.Categorical.from_codes(values, meta["columns"][column]["categories"])
+
+        data[column] = values
+
+    return pd.DataFrame({column: data[column] for column in columns}, copy=False)
+
+
+def load_tokens(chapter_dir: str, chapter: str, columns: list[str] | None = None, use_sidecar: bool = False) -> pd.DataFrame:
+    return load_booknlp_table(chapter_dir, chapter, "tokens", columns, use_sidecar)
+
+
+def load_entities(chapter_dir: str, chapter: str, columns: list[str] | None = None, use_sidecar: bool = False) -> pd.DataFrame:
+    return load_booknlp_table(chapter_dir, chapter, "entities", columns, use_sidecar)
+
+
+def load_quotes(chapter_dir: str, chapter: str, columns: list[str] | None = None, use_sidecar: bool = False) -> pd.DataFrame:
+    return load_booknlp_table(chapter_dir, chapter, "quotes", columns, use_sidecar)
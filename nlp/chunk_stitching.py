@@ -0,0 +1,220 @@
+import csv
+import json
+import os
+
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from .booknlp_loader import load_booknlp_table
+from .get_main_char import load_book_characters
+
+
+# Lists of the .book characters whose items point at a token with "i"
+_TOKEN_LISTS = ("agent", "patient", "mod", "poss")
+
+_MENTION_TYPES = {"PROP": "proper", "NOM": "common", "PRON": "pronoun"}
+
+
+def _get_mentions(texts: list[str]) -> list[dict[str, any]]:
+    """Counts mention texts into the `{"c": count, "n": text}` lists of the .book file, most frequent first"""
+
+    return [{"c": count, "n": text} for text, count in Counter(texts).most_common()]
+
+
+def _get_merge_key(mentions: dict[str, list[dict[str, any]]]) -> tuple[str, ...] | None:
+    """Characters of the same chapter in different chunks are merged if they share a proper name, or if they are both
+    the narrator. Other characters are never merged."""
+
+    if mentions["proper"]:
+        return ("proper", mentions["proper"][0]["n"])
+
+    if mentions["pronoun"] and mentions["pronoun"][0]["n"] == "I":
+        return ("narrator",)
+
+    return None
+
+
+class _ChapterStitcher():
+    """Accumulates the pieces of a chapter, in order, into chapter-level BookNLP tables"""
+
+    def __init__(self) -> None:
+        self.tables = {"tokens": [], "entities": [], "quotes": []}
+        self.characters = {}
+
+        self.num_tokens = 0
+        self.num_sentences = 0
+        self.num_paragraphs = 0
+
+        # Chapter ids of the (chunk, coref id) pairs seen so far, as pieces of the same chunk share BookNLP's coref ids
+        self.num_ids = 0
+        self.chunk_ids = {}
+        self.merged_ids = {}
+
+    def add_piece(
+        self,
+        chunk: str,
+        piece: dict[str, any],
+        tables: dict[str, pd.DataFrame],
+        book_characters: dict[int, dict[str, any]]
+    ) -> None:
+        tokens = tables["tokens"]
+        onsets = tokens["byte_onset"].to_numpy()
+        tokens = tokens[(onsets >= piece["chunk_start"]) & (onsets < piece["chunk_end"])].copy()
+
+        if not len(tokens):
+            return None
+
+        token_ids = tokens["token_ID_within_document"].to_numpy()
+        first_token, last_token = int(token_ids.min()), int(token_ids.max())
+        token_shift = self.num_tokens - first_token
+        char_shift = piece["chapter_start"] - piece["chunk_start"]
+
+        def is_in_piece(values: pd.Series) -> np.ndarray:
+            values = values.to_numpy()
+            return (values >= first_token) & (values <= last_token)
+
+        sentence_shift = self.num_sentences - int(tokens["sentence_ID"].min())
+        paragraph_shift = self.num_paragraphs - int(tokens["paragraph_ID"].min())
+
+        tokens["token_ID_within_document"] += token_shift
+        tokens["syntactic_head_ID"] += token_shift
+        tokens["sentence_ID"] += sentence_shift
+        tokens["paragraph_ID"] += paragraph_shift
+        tokens["byte_onset"] += char_shift
+        tokens["byte_offset"] += char_shift
+
+        self.num_tokens += last_token - first_token + 1
+        self.num_sentences = int(tokens["sentence_ID"].max()) + 1
+        self.num_paragraphs = int(tokens["paragraph_ID"].max()) + 1
+
+        # Entities and quotes crossing the edge of the piece are dropped
+        entities = tables["entities"]
+        entities = entities[is_in_piece(entities["start_token"]) & is_in_piece(entities["end_token"])].copy()
+        quotes = tables["quotes"]
+        quotes = quotes[is_in_piece(quotes["quote_start"]) & is_in_piece(quotes["quote_end"])].copy()
+
+        piece_mentions = {}
+
+        for coref, group in entities.groupby("COREF", sort=False):
+            piece_mentions[coref] = {
+                mention_type: group["text"][(group["prop"] == prop).to_numpy()].tolist() for prop, mention_type in _MENTION_TYPES.items()
+            }
+
+        def get_chapter_id(coref: int) -> int:
+            if coref < 0:
+                return coref
+
+            if (chunk, coref) not in self.chunk_ids:
+                key = None
+                if coref in book_characters and coref in piece_mentions:
+                    key = _get_merge_key({mention_type: _get_mentions(texts) for mention_type, texts in piece_mentions[coref].items()})
+
+                if key is not None and key in self.merged_ids:
+                    self.chunk_ids[chunk, coref] = self.merged_ids[key]
+                else:
+                    self.chunk_ids[chunk, coref] = self.num_ids
+                    self.num_ids += 1
+
+                    if key is not None:
+                        self.merged_ids[key] = self.chunk_ids[chunk, coref]
+
+            return self.chunk_ids[chunk, coref]
+
+        entities["COREF"] = [get_chapter_id(coref) for coref in entities["COREF"].tolist()]
+        entities["start_token"] += token_shift
+        entities["end_token"] += token_shift
+
+        quotes["char_id"] = [get_chapter_id(coref) for coref in quotes["char_id"].tolist()]
+        for column in ("mention_start", "mention_end"):
+            quotes[column] = np.where(is_in_piece(quotes[column]), quotes[column] + token_shift, -1)
+        quotes["quote_start"] += token_shift
+        quotes["quote_end"] += token_shift
+
+        for table, df in (("tokens", tokens), ("entities", entities), ("quotes", quotes)):
+            self.tables[table].append(df)
+
+        for coref, character in book_characters.items():
+            if coref not in piece_mentions:
+                continue
+
+            chapter_id = get_chapter_id(coref)
+            count = sum(len(texts) for texts in piece_mentions[coref].values())
+
+            existing = self.characters.get(chapter_id)
+            if existing is None:
+                existing = {"texts": {mention_type: [] for mention_type in _MENTION_TYPES.values()}, "count": 0, "g": (-1, None)}
+                existing.update({name: [] for name in _TOKEN_LISTS})
+                self.characters[chapter_id] = existing
+
+            for name in _TOKEN_LISTS:
+                existing[name].extend(
+                    {**item, "i": item["i"] + token_shift} for item in character.get(name, []) if first_token <= item["i"] <= last_token
+                )
+
+            for mention_type, texts in piece_mentions[coref].items():
+                existing["texts"][mention_type].extend(texts)
+
+            # Gender is taken from the piece mentioning the character most
+            if count > existing["g"][0]:
+                existing["g"] = (count, character.get("g"))
+
+            existing["count"] += count
+
+    def write(self, chapter_dir: str, chapter: str, empty_tables: dict[str, pd.DataFrame]) -> None:
+        os.makedirs(chapter_dir, exist_ok=True)
+
+        for table, dfs in self.tables.items():
+            df = pd.concat(dfs, ignore_index=True) if dfs else empty_tables[table]
+            df.to_csv(os.path.join(chapter_dir, f"{chapter}.{table}"), sep='\t', quoting=csv.QUOTE_NONE, index=False)
+
+        characters = []
+        for chapter_id, character in self.characters.items():
+            characters.append({
+                **{name: character[name] for name in _TOKEN_LISTS},
+                "id": chapter_id,
+                "g": character["g"][1],
+                "count": character["count"],
+                "mentions": {mention_type: _get_mentions(texts) for mention_type, texts in character["texts"].items()}
+            })
+
+        characters.sort(key=lambda character: -character["count"])
+
+        with open(os.path.join(chapter_dir, f"{chapter}.book"), 'w') as file:
+            json.dump({"characters": characters}, file)
+
+
+def stitch_chunks(text_dir: str, book_name: str, chunks_ner_dir: str, ner_coref_data_dir: str) -> None:
+    """Maps the BookNLP outputs of the chunks written by `chunk_book` back to chapter-level outputs in
+    `ner_coref_data_dir`, as if BookNLP had been run on every chapter, so `get_main_char` and the later stages run
+    unchanged.
+
+    Tokens are assigned to chapters by their offsets in the chunk. Token, sentence and paragraph ids are renumbered
+    from 0 in every chapter and offsets are shifted to the chapter text. Coref ids are renumbered per chapter, pieces of
+    a chapter in the same chunk keeping the coref BookNLP resolved across them: when a chapter was split over several
+    chunks, its characters are merged across chunks if they share a proper name, or if they are the narrator. The .book characters are rebuilt from the mentions within each chapter."""
+
+    from utils.chunker import get_chunk_index_path
+
+    with open(get_chunk_index_path(text_dir, book_name), 'r') as file:
+        chunk_index = json.load(file)
+
+    stitchers = {}
+    empty_tables = None
+
+    for chunk in chunk_index["chunks"]:
+        chunk_dir = os.path.join(chunks_ner_dir, chunk["chunk"])
+        tables = {table: load_booknlp_table(chunk_dir, chunk["chunk"], table) for table in ("tokens", "entities", "quotes")}
+        book_characters = {character["id"]: character for character in load_book_characters(os.path.join(chunk_dir, f"{chunk['chunk']}.book"))}
+
+        if empty_tables is None:
+            empty_tables = {table: df.iloc[:0] for table, df in tables.items()}
+
+        for piece in chunk["pieces"]:
+            stitcher = stitchers.setdefault(piece["chapter"], _ChapterStitcher())
+            stitcher.add_piece(chunk["chunk"], piece, tables, book_characters)
+
+    for chapter, stitcher in stitchers.items():
+        stitcher.write(os.path.join(ner_coref_data_dir, chapter), chapter, empty_tables)
+        print(f"Stitched {chapter}")
@@ -1,5 +1,10 @@
 import json
 import os
+import re
+
+from collections import defaultdict
+
+import numpy as np
 
 
 # characters_aliases = [
@@ -7,6 +12,150 @@ import os
 #     ["Person 2 Alias 1", "Person 2 Alias 2"] # for person two
 # ]
 
+TITLES = {
+    "the", "mr", "mrs", "ms", "miss", "mister", "missus", "madam", "madame", "sir", "dame", "lady", "lord", "dr", "doctor",
+    "prof", "professor", "capt", "captain", "officer", "detective", "director", "master", "mistress", "aunt", "uncle",
+    "king", "queen", "prince", "princess"
+}
+
+
+def get_alias_index(characters_aliases: list[list[str]]) -> dict[str, int]:
+    """Maps every alias to the index of the first alias list containing it"""
+
+    alias_index = {}
+    for idx, character_aliases in enumerate(characters_aliases):
+        for alias in character_aliases:
+            alias_index.setdefault(alias, idx)
+
+    return alias_index
+
+
+def normalize_name(name: str) -> str:
+    """Lowercases a name, strips punctuation and drops titles (unless the name is only a title)"""
+
+    tokens = re.sub(r"[^\w\s]", " ", re.sub(r"['\u2019]", "", name.casefold())).split()
+    name_tokens = [token for token in tokens if token not in TITLES]
+
+    return ' '.join(name_tokens or tokens)
+
+
+def _get_ngrams(key: str, n: int) -> set[str]:
+    key = f"#{key.replace(' ', '')}#"
+    return {key[idx:idx+n] for idx in range(len(key) - n + 1)}
+
+
+def suggest_aliases(
+    main_characters_data: dict[str, dict[str, any]],
+    min_count: int = 1,
+    min_similarity: float = 0.7,
+    ngram_size: int = 3,
+    max_posting_size: int = 100
+) -> list[list[str]]:
+    """Proposes candidate alias lists from the names in main_characters.json, for review before they are added to
+    main_characters_aliases.json.
+
+    Names are grouped when they are the same after `normalize_name` (case, punctuation and title variants). A full name
+    is grouped with the single names equal to its first or last name, and names whose character n-grams overlap by at
+    least `min_similarity` (Jaccard) are grouped together. N-grams shared by more than `max_posting_size` names are too
+    common to tell names apart and are skipped. A name can appear in more than one group.
+
+    Groups are sorted by their total count, and the names within a group by count."""
+
+    names_by_key = defaultdict(list)
+    key_counts = defaultdict(int)
+
+    for name, character in main_characters_data.items():
+        if character["count"] < min_count:
+            continue
+
+        key = normalize_name(name)
+        names_by_key[key].append(name)
+        key_counts[key] += character["count"]
+
+    keys = list(names_by_key)
+    neighbours = defaultdict(set)
+
+    # Full names and the single names equal to their first or last name
+    for key in keys:
+        if ' ' not in key:
+            continue
+
+        tokens = key.split()
+        for token in (tokens[0], tokens[-1]):
+            if token in names_by_key:
+                neighbours[key].add(token)
+                neighbours[token].add(key)
+
+    # Character n-gram similarity, counting the n-grams every pair of names shares from the postings of each n-gram
+    key_ngrams = [_get_ngrams(key, ngram_size) for key in keys]
+    postings = defaultdict(list)
+    for idx, ngrams in enumerate(key_ngrams):
+        for ngram in ngrams:
+            postings[ngram].append(idx)
+
+    postings_by_size = defaultdict(list)
+    for posting in postings.values():
+        if 1 < len(posting) <= max_posting_size:
+            postings_by_size[len(posting)].append(posting)
+
+    pair_keys = [np.zeros(0, dtype=np.int64)]
+    for size, size_postings in postings_by_size.items():
+        # Postings are in ascending order, so `left` < `right`
+        posting_arr = np.array(size_postings, dtype=np.int64)
+        left, right = np.triu_indices(size, 1)
+        pair_keys.append((posting_arr[:, left] * len(keys) + posting_arr[:, right]).ravel())
+
+    pair_keys, num_shared = np.unique(np.concatenate(pair_keys), return_counts=True)
+    left, right = np.divmod(pair_keys, len(keys))
+
+    num_ngrams = np.array([len(ngrams) for ngrams in key_ngrams], dtype=np.int64)
+    is_similar = num_shared / (num_ngrams[left] + num_ngrams[right] - num_shared) >= min_similarity
+
+    for idx, other_idx in zip(left[is_similar].tolist(), right[is_similar].tolist()):
+        neighbours[keys[idx]].add(keys[other_idx])
+        neighbours[keys[other_idx]].add(keys[idx])
+
+    # Names are ranked by count once, so groups are sorted by rank
+    ranked_names = sorted(
+        (name for names in names_by_key.values() for name in names), key=lambda name: (-main_characters_data[name]["count"], name)
+    )
+    name_ranks = {name: rank for rank, name in enumerate(ranked_names)}
+
+    groups = {}
+    for key in keys:
+        # Single names are only grouped on their own if no full name takes them in
+        if ' ' not in key and any(' ' in other_key for other_key in neighbours[key]):
+            continue
+
+        group_keys = neighbours[key] | {key}
+        names = [name for group_key in group_keys for name in names_by_key[group_key]]
+        if len(names) > 1:
+            names.sort(key=name_ranks.__getitem__)
+            groups[tuple(names)] = sum(key_counts[group_key] for group_key in group_keys)
+
+    return [list(names) for names, _ in sorted(groups.items(), key=lambda group: (-group[1], name_ranks[group[0][0]]))]
+
+
+def suggest_main_char_aliases(dir_path: str, min_count: int = 1, **kwargs) -> list[list[str]]:
+    """Runs `suggest_aliases` on main_characters.json in `dir_path`, leaving out names already in main_characters_aliases.json"""
+
+    main_characters_file_path = os.path.join(dir_path, "main_characters.json")
+    if not os.path.exists(main_characters_file_path):
+        raise FileNotFoundError('Missing main_characters.json in given directory!')
+
+    with open(main_characters_file_path, 'r') as file:
+        main_characters_data = json.load(file)
+
+    characters_aliases_file_path = os.path.join(dir_path, "main_characters_aliases.json")
+    if os.path.exists(characters_aliases_file_path):
+        with open(characters_aliases_file_path, 'r') as file:
+            alias_index = get_alias_index(json.load(file))
+
+        main_characters_data = {name: character for name, character in main_characters_data.items() if name not in alias_index}
+
+    return suggest_aliases(main_characters_data, min_count, **kwargs)
+
+
 def consolidate_main_char(dir_path: str) -> None:
     if not os.path.isdir(dir_path): 
         raise NotADirectoryError('Given directory path is not valid!')
@@ -38,15 +187,14 @@ def consolidate_main_char(dir_path: str) -> None:
         # int: int # maps main_character's id from main_characters_data to their consolidated index
     }
 
+    alias_index = get_alias_index(characters_aliases)
+
     for character in main_characters_data.keys():
-        for idx, character_aliases in enumerate(characters_aliases):
-            if character in character_aliases:
-                main_characters_data[character]["consolidated_id"] = idx
-                character_id = main_characters_data[character]["id"]
-                consolidated_indices[character_id] = idx
-                break
-        else:
-            main_characters_data[character]["consolidated_id"] = None
+        idx = alias_index.get(character)
+        main_characters_data[character]["consolidated_id"] = idx
+
+        if idx is not None:
+            consolidated_indices[main_characters_data[character]["id"]] = idx
     
     with open(os.path.join(dir_path, "main_characters_consolidated.json"), 'w') as file:
         json.dump(main_characters_data, file, indent=4)
@@ -0,0 +1,52 @@
+import json
+import re
+
+
+class FilterRules():
+    """Declarative filter that can be passed as `filter_func`, excluding characters from chapters.
+
+    Each rule excludes the characters with the given `novel_ids` from every chapter whose name matches any of the
+    `chapters` regular expressions (or from all chapters if `chapters` is left out), e.g.
+
+    ```py
+    FilterRules([
+        {"novel_ids": [0], "chapters": ["Interlude", "Teneral", "Migration", "Sentinel"]}
+    ])
+    ```
+
+    Rules are evaluated once per chapter into a set of excluded ids rather than once per character."""
+
+    def __init__(self, rules: list[dict[str, list]]) -> None:
+        self.rules = rules
+
+        self._compiled_rules = []
+        for rule in rules:
+            chapter_patterns = rule.get("chapters")
+            pattern = re.compile('|'.join(f"(?:{pattern})" for pattern in chapter_patterns)) if chapter_patterns else None
+            self._compiled_rules.append((frozenset(rule["novel_ids"]), pattern))
+
+        self._excluded_ids = {}
+
+    @classmethod
+    def from_json(cls, file_path: str) -> 'FilterRules':
+        with open(file_path, 'r') as file:
+            return cls(json.load(file))
+
+    def get_excluded_ids(self, chapter: str) -> frozenset[int]:
+        """Method to get the novel ids excluded from a chapter"""
+
+        excluded_ids = self._excluded_ids.get(chapter)
+
+        if excluded_ids is None:
+            excluded_ids = frozenset().union(*(
+                novel_ids for novel_ids, pattern in self._compiled_rules if pattern is None or pattern.search(chapter)
+            ))
+            self._excluded_ids[chapter] = excluded_ids
+
+        return excluded_ids
+
+    def __call__(self, novel_id: int, chapter: str, filter_args: any = None) -> bool:
+        return novel_id not in self.get_excluded_ids(chapter)
+
+    def __repr__(self) -> str:
+        return f"FilterRules({self.rules!r})"
@@ -0,0 +1,176 @@
+import json
+import os
+import re
+
+import numpy as np
+
+from .relations import RelationsIndex, load_relations
+from .sentiment_analysis import average_interactions, get_interactions
+
+
+EXPORT_INDEX_FILE = 'graph_index.json'
+
+# Edge columns and the dtype each is stored as in binary exports (little-endian typed arrays)
+EDGE_COLUMNS = {
+    "from": '<i4',
+    "to": '<i4',
+    "count": '<f4',
+    "sentiment": '<f4',
+    "length": '<f4',
+    "percentage": '<f4'
+}
+
+
+def get_frontend_edges(
+    num_chars: int,
+    char1: np.ndarray,
+    char2: np.ndarray,
+    sentiments: np.ndarray,
+    counts: np.ndarray
+) -> tuple[dict[str, np.ndarray], dict[str, any]]:
+    """Turns the directed interactions returned by `get_interactions` into the undirected edges and node values drawn by
+    the web page.
+
+    An edge joins `i` < `j` with `count` the interactions of `i` towards `j` and `sentiment` the sum of both directions.
+    Its `length` is `100 * cbrt(T_i / n_ij + T_j / n_ij)` and its `percentage` is `n_ij / sqrt(T_i * T_j)`, `T_i` being
+    the total interactions of character `i`. Edges are sorted by count (descending). Counts are floats, as interactions
+    weighted by `decay` make them fractional.
+
+    Returns the edge columns and the node values: `total` interactions, and `max_count` and `max_percentage` of their
+    edges (a node is hidden when no edge passes the filter)."""
+
+    totals = np.bincount(char1, weights=counts, minlength=num_chars)
+
+    keys = char1 * num_chars + char2
+    is_forward = char1 < char2
+
+    # Sentiment of j towards i, looked up among the directed pairs (sorted by char1 then char2)
+    reverse_keys = char2[is_forward] * num_chars + char1[is_forward]
+    reverse_pos = np.clip(np.searchsorted(keys, reverse_keys), 0, max(len(keys) - 1, 0))
+    has_reverse = keys[reverse_pos] == reverse_keys if len(keys) else np.zeros(0, dtype=bool)
+
+    edge_from, edge_to, edge_counts = char1[is_forward], char2[is_forward], counts[is_forward]
+    edge_sentiments = sentiments[is_forward] + np.where(has_reverse, sentiments[reverse_pos], 0.0)
+
+    order = np.lexsort((edge_to, edge_from, -edge_counts))
+    edge_from, edge_to, edge_counts, edge_sentiments = edge_from[order], edge_to[order], edge_counts[order], edge_sentiments[order]
+
+    lengths = 100 * np.cbrt(totals[edge_from] / edge_counts + totals[edge_to] / edge_counts)
+    percentages = edge_counts / np.sqrt(totals[edge_from] * totals[edge_to])
+
+    node_edges = np.concatenate((edge_from, edge_to))
+
+    max_counts = np.zeros(num_chars)
+    max_percentages = np.zeros(num_chars)
+    np.maximum.at(max_counts, node_edges, np.tile(edge_counts, 2))
+    np.maximum.at(max_percentages, node_edges, np.tile(percentages, 2))
+
+    edges = {
+        "from": edge_from,
+        "to": edge_to,
+        "count": edge_counts,
+        "sentiment": edge_sentiments,
+        "length": lengths,
+        "percentage": percentages
+    }
+    nodes = {
+        "total": totals.tolist(),
+        "max_count": max_counts.tolist(),
+        "max_percentage": max_percentages.tolist()
+    }
+
+    return edges, nodes
+
+
+def _write_graph(output_dir: str, name: str, num_chars: int, edges: dict[str, np.ndarray], nodes: dict[str, any], binary: bool) -> str:
+    file_name = f"graph-{name}.json"
+    graph = {"num_characters": num_chars, "num_edges": len(edges["from"]), "nodes": nodes}
+
+    if binary:
+        bin_file_name = f"graph-{name}.bin"
+        columns = {}
+        offset = 0
+
+        with open(os.path.join(output_dir, bin_file_name), 'wb') as file:
+            for column, dtype in EDGE_COLUMNS.items():
+                data = edges[column].astype(dtype).tobytes()
+                columns[column] = {"dtype": np.dtype(dtype).name, "offset": offset, "length": len(edges[column])}
+                file.write(data)
+                offset += len(data)
+
+        graph["edges"] = {"file": bin_file_name, "columns": columns}
+    else:
+        graph["edges"] = {column: edges[column].tolist() for column in EDGE_COLUMNS}
+
+    with open(os.path.join(output_dir, file_name), 'w') as file:
+        json.dump(graph, file, separators=(',', ':'))
+
+    return file_name
+
+
+def export_frontend_data(
+    characters_data_dir: str,
+    output_dir: str,
+    deduct_opposing_avg: bool = False,
+    deduct_book_avg: bool = False,
+    arcs: dict[str, tuple[int, int | None]] | None = None,
+    binary: bool = False
+) -> dict[str, any]:
+    """Writes the interactions written by `analyse_sentiments` as compact edge lists for the web page (see `get_frontend_edges`),
+    so it no longer has to parse the dense interactions.json and recompute every edge in the browser.
+
+    The whole book is written to graph-full.json, and every arc in `arcs` (a name and a half-open range of chapter
+    numbers, `end_chapter` None for up to the last chapter) to its own graph-arc-<arc>.json, so the page only loads the
+    graphs it shows. Sentiments are averaged as in `collate_relations`, over the chapters of the graph. With `binary`,
+    the edge columns are written to a .bin file of little-endian int32 and float32 arrays next to the graph, which the
+    JSON describes by offset and length, to be read as typed arrays.
+
+    An index of the graphs is written to graph_index.json in `output_dir` and returned."""
+
+    main_characters_aliases_file_path = os.path.join(characters_data_dir, 'main_characters_aliases.json')
+
+    if not os.path.exists(main_characters_aliases_file_path):
+        raise FileNotFoundError('Missing main_characters_aliases.json in given directory!')
+
+    with open(main_characters_aliases_file_path, 'r') as file:
+        num_chars = len(json.load(file))
+
+    info = load_relations(characters_data_dir)
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    edges, nodes = get_frontend_edges(num_chars, *get_interactions(info, deduct_opposing_avg, deduct_book_avg))
+    export_index = {
+        "num_characters": num_chars,
+        "binary": binary,
+        "full": _write_graph(output_dir, 'full', num_chars, edges, nodes, binary),
+        "arcs": {}
+    }
+
+    if arcs:
+        relations_index = RelationsIndex(info['relations'], info['chapter'])
+
+        for arc_name, (start_chapter, end_chapter) in arcs.items():
+            char1, char2, sentiment_totals, counts = relations_index.get_graph(start_chapter, end_chapter)
+            char_totals = np.stack(relations_index.get_characters(start_chapter, end_chapter), axis=1)
+            book_totals = np.array(relations_index.get_book_values(start_chapter, end_chapter))
+
+            # Arcs without sentences have no pairs to average
+            with np.errstate(divide='ignore', invalid='ignore'):
+                interactions = average_interactions(
+                    char1, char2, sentiment_totals, counts, char_totals, book_totals, deduct_opposing_avg, deduct_book_avg
+                )
+
+            arc_edges, arc_nodes = get_frontend_edges(num_chars, *interactions)
+
+            file_name = re.sub(r'[^\w\-_]', '_', arc_name)
+            export_index["arcs"][arc_name] = {
+                "start_chapter": start_chapter,
+                "end_chapter": end_chapter,
+                "file": _write_graph(output_dir, f"arc-{file_name}", num_chars, arc_edges, arc_nodes, binary)
+            }
+
+    with open(os.path.join(output_dir, EXPORT_INDEX_FILE), 'w') as file:
+        json.dump(export_index, file, indent=4)
+
+    return export_index
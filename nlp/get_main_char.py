@@ -1,8 +1,136 @@
 import json
 import os
+import re
 
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import BinaryIO
+
+from .instrumentation import RunMetrics, record_chapter, record_stage
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+_CHARACTERS_KEY = re.compile(rb'\s*\{\s*"characters"\s*:\s*')
+# Strings (skipped whole, so brackets inside names are ignored), brackets, or the quote of a string cut off by the end of what was read
+_JSON_TOKENS = re.compile(rb'"(?:[^"\\]|\\.)*"|[\[\]{}]|"', re.DOTALL)
+
+_READ_SIZE = 1 << 20
+
+
+def _read_characters_section(file: BinaryIO) -> bytes | None:
+    """Reads `file` only up to the end of the `characters` section and returns that section, or None if `characters`
+    is not the first key of the file"""
+
+    data = bytearray(file.read(_READ_SIZE))
+
+    # The first key ends before the first colon
+    while b':' not in data:
+        chunk = file.read(_READ_SIZE)
+        if not chunk:
+            return None
+        data += chunk
+
+    match = _CHARACTERS_KEY.match(data)
+    if match is None:
+        return None
+
+    depth = 0
+    pos = match.end()
+
+    while True:
+        for token in _JSON_TOKENS.finditer(data, pos):
+            value = token.group()
+
+            if value == b'"':
+                # The rest of the string is in the next read
+                pos = token.start()
+                break
+
+            if value in (b'[', b'{'):
+                depth += 1
+            elif value in (b']', b'}'):
+                depth -= 1
+                if depth == 0:
+                    return bytes(data[match.end():token.end()])
+        else:
+            pos = len(data)
+
+        chunk = file.read(_READ_SIZE)
+        if not chunk:
+            return None
+
+        data += chunk
+
+
+def load_book_characters(book_file: str) -> list[dict[str, any]]:
+    """Loads the `characters` section of a BookNLP .book file.
+
+    If `characters` is the first key of the file (as BookNLP writes it), the file is only read up to the end of that
+    section, and only that section is parsed. Otherwise the whole file is parsed. orjson is used if it is installed."""
+
+    loads = orjson.loads if orjson is not None else json.loads
+
+    with open(book_file, 'rb') as file:
+        section = _read_characters_section(file)
+
+        if section is None:
+            file.seek(0)
+            return loads(file.read())['characters']
+
+    return loads(section)
+
+
+def get_chapter_characters(dir_path: str, chapter: str) -> list[tuple[int, str, int]]:
+    """Returns the `(character_chapter_id, name, count)` of every character of a chapter that can be named"""
+
+    chapter_characters = []
+
+    for character in load_book_characters(os.path.join(dir_path, chapter, f"{chapter}.book")):
+        if character['mentions']['proper']:
+            name = character['mentions']['proper'][0]['n']
+        elif character['mentions']['common']:
+            if character['count'] < 5: 
+                continue
+
+            name = character['mentions']['common'][0]['n']
+        else:
+            if character['count'] < 5: 
+                continue
+
+            name = character['mentions']['pronoun'][0]['n']
+            if name == 'I': 
+                name = "NARRATOR"
+
+        chapter_characters.append((character['id'], name, character['count']))
+
+    return chapter_characters
+
+
+def get_chapter_sort_key(chapter: str) -> list[int | str]:
+    """Key to sort chapters naturally, by the numbers in their names, so Part-10 comes after Part-2"""
+
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', chapter)]
+
+
+def _get_recorded_chapter_characters(dir_path: str, metrics: RunMetrics | None, chapter: str) -> list[tuple[int, str, int]]:
+    with record_chapter(metrics, "get_main_char", chapter) as record:
+        characters = get_chapter_characters(dir_path, chapter)
+        record.add(characters=len(characters))
+
+    return characters
+
+
+def get_main_char(dir_path: str, output_dir: str, workers: int = 1, metrics: RunMetrics | None = None) -> None:
+    """Matches the characters of every chapter by name and writes main_characters.json and chapters_coref.json to `output_dir`.
+
+    Chapters are merged in book order (see `get_chapter_sort_key`), so novel ids are given in the order characters first
+    appear. With `workers` > 1, the .book files are read on a pool of that many processes, and the output does not
+    depend on `workers`. With `metrics`, the stage and every chapter are recorded (see `RunMetrics`)."""
 
-def get_main_char(dir_path: str, output_dir: str) -> None:
     main_characters = {
         # name : {
         #     "id" : int
@@ -23,48 +151,59 @@ def get_main_char(dir_path: str, output_dir: str) -> None:
     if not os.path.isdir(dir_path): 
         raise NotADirectoryError('Given directory path is not valid!')
 
-    for chapter in os.listdir(dir_path):
-        with open(os.path.join(dir_path, chapter, f"{chapter}.book"), "r") as f:
-            chap_json = json.load(f)
-
-        chapter_characters = {}
-
-        for character in chap_json['characters']:
-            if character['mentions']['proper']:
-                name = character['mentions']['proper'][0]['n']
-            elif character['mentions']['common']:
-                if character['count'] < 5: 
-                    continue
-
-                name = character['mentions']['common'][0]['n']
-            else:
-                if character['count'] < 5: 
-                    continue
-
-                name = character['mentions']['pronoun'][0]['n']
-                if name == 'I': 
-                    name = "NARRATOR"
-            
-            existing_char = main_characters.get(name, None)
-
-            if existing_char is None:
-                existing_char = {
-                    'id': len(main_characters),
-                    'count': character['count'],
-                    'appearance': [chapter]
-                }
-                main_characters[name] = existing_char
-            else:
-                existing_char['count'] += character['count']
-                existing_char['appearance'].append(chapter)
-
-            chapter_characters[character['id']] = {
-                'novel_id': existing_char['id'],
-                'count': character['count']
+    chapters = sorted(os.listdir(dir_path), key=get_chapter_sort_key)
+
+    with record_stage(metrics, "get_main_char") as stage_record:
+        if workers <= 1:
+            all_chapter_characters = [_get_recorded_chapter_characters(dir_path, metrics, chapter) for chapter in chapters]
+        else:
+            # Chapters are recorded by the workers, without adding their counts to the stage
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                all_chapter_characters = list(executor.map(
+                    partial(_get_recorded_chapter_characters, dir_path, metrics), chapters, chunksize=max(1, len(chapters) // (workers * 4))
+                ))
+
+        for chapter, characters in zip(chapters, all_chapter_characters):
+            add_chapter_characters(main_characters, chapters_coref, chapter, characters)
+
+        write_main_char(output_dir, main_characters, chapters_coref)
+        stage_record.add(main_characters=len(main_characters))
+
+
+def add_chapter_characters(
+    main_characters: dict[str, dict[str, any]],
+    chapters_coref: dict[str, dict[int, dict[str, int]]],
+    chapter: str,
+    characters: list[tuple[int, str, int]]
+) -> None:
+    """Merges the characters of a chapter (see `get_chapter_characters`) into `main_characters` by name, giving new
+    names the next novel id, and records their novel ids in `chapters_coref`"""
+
+    chapter_characters = {}
+
+    for character_id, name, count in characters:
+        existing_char = main_characters.get(name, None)
+
+        if existing_char is None:
+            existing_char = {
+                'id': len(main_characters),
+                'count': count,
+                'appearance': [chapter]
             }
+            main_characters[name] = existing_char
+        else:
+            existing_char['count'] += count
+            existing_char['appearance'].append(chapter)
+
+        chapter_characters[character_id] = {
+            'novel_id': existing_char['id'],
+            'count': count
+        }
+
+    chapters_coref[chapter] = chapter_characters
 
-        chapters_coref[chapter] = chapter_characters
 
+def write_main_char(output_dir: str, main_characters: dict[str, dict[str, any]], chapters_coref: dict[str, dict[int, dict[str, int]]]) -> None:
     os.makedirs(output_dir, exist_ok=True)
 
     with open(os.path.join(output_dir, 'main_characters.json'), 'w') as file:
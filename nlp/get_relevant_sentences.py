@@ -1,21 +1,185 @@
-import csv
 import json
 import os
 
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
 from typing import Callable
 
+import numpy as np
 import pandas as pd
+from tqdm import tqdm
+
+from .booknlp_loader import LINKING_COLUMNS, load_entities, load_quotes, load_tokens
+from .filter_rules import FilterRules
+from .instrumentation import RunMetrics, record_chapter, record_stage
+from .sentence_store import write_relevant_sentences
     
 
 def get_consolidated_id(
     consolidated_indices: dict[str, int],
     novel_id: int,
     chapter: str,
-    filter_func: Callable[[int, str, any], bool] | None = None,
+    filter_func: Callable[[int, str, any], bool] | FilterRules | None = None,
     filter_args: any = None
-) -> int | None:    
+) -> int | None:
+    """Returns the consolidated id of a character, or None if it is not a main character or `filter_func` excludes it.
+    Every character is kept if no `filter_func` is given."""
+
+    if filter_func is not None and not filter_func(novel_id, chapter, filter_args):
+        return None
+
+    return consolidated_indices.get(str(novel_id), None)
+
+
+def get_coref_lookup(
+    chapter: str,
+    chapters_coref: dict[str, dict[str, dict[str, int]]],
+    consolidated_indices: dict[str, int],
+    filter_func: Callable[[int, str, any], bool] | FilterRules | None = None,
+    filter_args: any = None
+) -> dict[int, int]:
+    """Maps the BookNLP coref ids of the main characters in a chapter to their consolidated ids.
+
+    `filter_func` is evaluated once per novel id, and a `FilterRules` once for the whole chapter."""
+
+    excluded_ids = filter_func.get_excluded_ids(chapter) if isinstance(filter_func, FilterRules) else set()
+    is_allowed = {}
+
+    coref_lookup = {}
+    for character_chapter_id, character_coref in chapters_coref[chapter].items():
+        novel_id = character_coref["novel_id"]
+        if novel_id in excluded_ids:
+            continue
+
+        consolidated_id = consolidated_indices.get(str(novel_id), None)
+        if consolidated_id is None:
+            continue
+
+        if filter_func is not None and not isinstance(filter_func, FilterRules):
+            if novel_id not in is_allowed:
+                is_allowed[novel_id] = filter_func(novel_id, chapter, filter_args)
+
+            if not is_allowed[novel_id]:
+                continue
+
+        coref_lookup[int(character_chapter_id)] = int(consolidated_id)
+
+    return coref_lookup
+
+
+def _group_by_sentence(sentence_idx: np.ndarray, values: list, num_sentences: int) -> list[list]:
+    """Splits `values` (already ordered by `sentence_idx`) into one list per sentence"""
+
+    bounds = np.searchsorted(sentence_idx, np.arange(num_sentences + 1), side='left')
+
+    return [values[start:end] for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist())]
+
+
+def _map_coref_ids(ids: pd.Series, coref_lookup: dict[int, int]) -> np.ndarray:
+    """Maps BookNLP coref ids to consolidated ids, -1 where the mention is not a main character"""
+
+    ids = pd.to_numeric(ids).fillna(-1).to_numpy(dtype=np.int64)
+    lookup_arr = np.full(max(max(coref_lookup, default=-1), int(ids.max(initial=-1))) + 1, -1, dtype=np.int64)
+    lookup_arr[list(coref_lookup.keys())] = list(coref_lookup.values())
+
+    return np.where(ids >= 0, lookup_arr[np.maximum(ids, 0)], -1)
+
+
+def link_sentences(
+    tokens_df: pd.DataFrame,
+    entities_df: pd.DataFrame,
+    quotes_df: pd.DataFrame,
+    chapter_text: str,
+    coref_lookup: dict[int, int]
+) -> dict[str, list]:
+    """Splits a chapter into sentences and links each sentence to the characters mentioned in it and the speakers quoted in it.
     
-    return consolidated_indices.get(str(novel_id), None) if filter_func and filter_func(novel_id, chapter, filter_args) else None
+    `coref_lookup` maps the BookNLP coref ids of the chapter to consolidated ids. Mentions of coref ids missing from it are ignored."""
+
+    paragraph_ids = tokens_df["paragraph_ID"].to_numpy()
+    sentence_ids = tokens_df["sentence_ID"].to_numpy()
+    token_ids = tokens_df["token_ID_within_document"].to_numpy()
+    token_onsets = tokens_df["byte_onset"].to_numpy()
+    token_offsets = tokens_df["byte_offset"].to_numpy()
+
+    # A sentence is a run of tokens sharing both paragraph_ID and sentence_ID
+    is_first_row = np.ones(len(tokens_df), dtype=bool)
+    is_first_row[1:] = (paragraph_ids[1:] != paragraph_ids[:-1]) | (sentence_ids[1:] != sentence_ids[:-1])
+    first_rows = np.flatnonzero(is_first_row)
+    last_rows = np.append(first_rows[1:] - 1, len(tokens_df) - 1)
+    num_sentences = len(first_rows)
+
+    start_token_ids = token_ids[first_rows]
+    end_token_ids = token_ids[last_rows]
+    sentence_onsets = token_onsets[first_rows]
+    sentence_offsets = token_offsets[last_rows]
+
+    # Entities are consumed in file order by the first sentence ending at or after them (never before the previous 
+    # entity is consumed) and only count if they also start inside that sentence.
+    characters = [[] for _ in range(num_sentences)]
+    if entities_df.shape[0]:
+        entity_starts = entities_df["start_token"].to_numpy()
+        entity_sentences = np.maximum.accumulate(np.searchsorted(end_token_ids, entities_df["end_token"].to_numpy(), side='left'))
+        entity_chars = _map_coref_ids(entities_df["COREF"], coref_lookup)
+
+        is_linked = (entity_sentences < num_sentences) & (entity_chars >= 0)
+        is_linked[is_linked] &= entity_starts[is_linked] >= start_token_ids[entity_sentences[is_linked]]
+
+        characters = _group_by_sentence(entity_sentences[is_linked], entity_chars[is_linked].tolist(), num_sentences)
+
+    # Quotes are walked with a single pointer. A quote is attributed to the sentence its start falls strictly inside of 
+    # and to the sentence it ends in, where the pointer moves on. A quote that cannot be closed stalls the pointer for 
+    # the rest of the chapter.
+    speakers = [[] for _ in range(num_sentences)]
+    if quotes_df.shape[0]:
+        quote_starts = quotes_df["quote_start"].to_numpy()
+        quote_ends = quotes_df["quote_end"].to_numpy()
+        quote_chars = _map_coref_ids(quotes_df["char_id"], coref_lookup)
+
+        close_sentences = np.searchsorted(end_token_ids, quote_ends, side='left')
+        open_sentences = np.searchsorted(start_token_ids, quote_starts, side='right') - 1
+        reached_sentences = np.concatenate(([0], close_sentences[:-1]))
+
+        clipped = np.minimum(close_sentences, num_sentences - 1)
+        is_closed = (close_sentences < num_sentences) & (close_sentences >= reached_sentences) & (
+            ((start_token_ids[clipped] < quote_ends) & (quote_ends <= end_token_ids[clipped])) | 
+            ((start_token_ids[clipped] <= quote_starts) & (quote_starts < end_token_ids[clipped]))
+        )
+        is_reached = np.concatenate(([True], np.logical_and.accumulate(is_closed)[:-1]))
+
+        clipped = np.maximum(open_sentences, 0)
+        is_opened = is_reached & (open_sentences >= reached_sentences) & (open_sentences < close_sentences) & (
+            quote_starts < end_token_ids[clipped]
+        )
+        is_closed &= is_reached
+
+        quote_idx = np.arange(len(quotes_df))
+        speaker_sentences = np.concatenate((open_sentences[is_opened], close_sentences[is_closed]))
+        speaker_quotes = np.concatenate((quote_idx[is_opened], quote_idx[is_closed]))
+        speaker_chars = np.concatenate((quote_chars[is_opened], quote_chars[is_closed]))
+
+        order = np.lexsort((speaker_quotes, speaker_sentences))
+        order = order[speaker_chars[order] >= 0]
+
+        speakers = _group_by_sentence(speaker_sentences[order], speaker_chars[order].tolist(), num_sentences)
+
+    propn_rows = np.flatnonzero((tokens_df["POS_tag"] == "PROPN").to_numpy())
+    propn_sentences = np.searchsorted(first_rows, propn_rows, side='right') - 1
+    propn_pos = np.stack((
+        token_onsets[propn_rows] - sentence_onsets[propn_sentences],
+        token_offsets[propn_rows] - sentence_onsets[propn_sentences]
+    ), axis=1)
+    proper_nouns_pos = _group_by_sentence(propn_sentences, propn_pos.tolist(), num_sentences)
+
+    return {
+        "words": [chapter_text[onset:offset] for onset, offset in zip(sentence_onsets.tolist(), sentence_offsets.tolist())],
+        "start_token_id": start_token_ids.tolist(),
+        "end_token_id": end_token_ids.tolist(),
+        "paragraph_id": paragraph_ids[first_rows].tolist(),
+        "speaker": [list(set(speaker)) for speaker in speakers],
+        "characters": [list(set(chars)) for chars in characters],
+        "proper_nouns_pos": proper_nouns_pos
+    }
 
 
 def get_relevant_sentences_in_chapter(
@@ -24,128 +188,75 @@ def get_relevant_sentences_in_chapter(
     text_dir: str,
     chapters_coref: dict[str, dict[str, dict[str, int]]],
     consolidated_indices: dict[str, int],
-    filter_func: Callable[[int, str, any], bool] | None = None,
-    filter_args: any = None
+    filter_func: Callable[[int, str, any], bool] | FilterRules | None = None,
+    filter_args: any = None,
+    verbose: bool = True,
+    output_format: str = 'csv',
+    use_sidecar: bool = False,
+    metrics: RunMetrics | None = None
 ) -> None:
-    
+    """Links the sentences of a chapter to the main characters in them and writes them as relevant_sentences.csv, or as
+    relevant_sentences.npz if `output_format` is 'npz' (see `sentence_store`). With `use_sidecar`, the BookNLP tables are
+    memory-mapped from binary sidecars after the first run (see `booknlp_loader`). With `metrics`, the chapter is
+    recorded (see `RunMetrics`)."""
+
     chapter_dir = os.path.join(ner_coref_data_dir, chapter)
     chapter_text_file = os.path.join(text_dir, chapter + '.txt')
 
-    tokens_df = pd.read_csv(os.path.join(chapter_dir, f"{chapter}.tokens"), delimiter='\t', quoting=csv.QUOTE_NONE)
-    entities_df = pd.read_csv(os.path.join(chapter_dir, f"{chapter}.entities"), delimiter='\t', quoting=csv.QUOTE_NONE)
-    quotes_df = pd.read_csv(os.path.join(chapter_dir, f"{chapter}.quotes"), delimiter='\t', quoting=csv.QUOTE_NONE) 
+    with record_chapter(metrics, "get_relevant_sentences", chapter) as record:
+        tokens_df = load_tokens(chapter_dir, chapter, LINKING_COLUMNS["tokens"], use_sidecar)
+        entities_df = load_entities(chapter_dir, chapter, LINKING_COLUMNS["entities"], use_sidecar)
+        quotes_df = load_quotes(chapter_dir, chapter, LINKING_COLUMNS["quotes"], use_sidecar)
 
-    # with open(os.path.join(chapter_dir, f"{chapter}.book"), "r") as f:
-    #     book_json = json.load(f)
+        with open(chapter_text_file, 'r', encoding='utf-8') as f:
+            chapter_text = f.read()
 
-    with open(chapter_text_file, 'r', encoding='utf-8') as f:
-        chapter_text = f.read()
+        coref_lookup = get_coref_lookup(chapter, chapters_coref, consolidated_indices, filter_func, filter_args)
 
-    sentence_info = {
-        "words": [],
-        "start_token_id": [],
-        "end_token_id": [],
-        "speaker": [],
-        "characters": [],
-        "proper_nouns_pos": []
-    }
+        sentence_info = link_sentences(tokens_df, entities_df, quotes_df, chapter_text, coref_lookup)
+
+        write_relevant_sentences(chapter_dir, sentence_info, output_format)
+
+        record.add(rows=len(tokens_df), sentences=len(sentence_info["words"]), mentions=len(entities_df), quotes=len(quotes_df))
+
+    if verbose:
+        print(f"Completed {chapter}")
 
-    num_paragraphs = int(tokens_df.iloc[-1]["paragraph_ID"])
-    curr_entities_row_idx = 0
-    entities_row = entities_df.iloc[curr_entities_row_idx] if entities_df.shape[0] else None
-    curr_quotes_row_idx = 0
-    quotes_row = quotes_df.iloc[curr_quotes_row_idx] if quotes_df.shape[0] else None
-
-    chapter_coref = chapters_coref[chapter]
-    main_characters_coref = [int(id) for id in chapter_coref.keys()]
-        
-
-    for paragraph_num in range(num_paragraphs+1):
-
-        paragraph_df = tokens_df[tokens_df["paragraph_ID"] == paragraph_num]
-
-        # Ensure paragraphs are also different
-        start_sentence_id = int(paragraph_df.iloc[0]["sentence_ID"])
-        end_sentence_id = int(paragraph_df.iloc[-1]["sentence_ID"])
-
-        for sentence_id in range(start_sentence_id, end_sentence_id+1):
-            sentence_df = paragraph_df[paragraph_df["sentence_ID"] == sentence_id]
-
-            byte_onset = int(sentence_df.iloc[0]["byte_onset"])
-            byte_offset = int(sentence_df.iloc[-1]["byte_offset"])
-            sentence = chapter_text[byte_onset:byte_offset]
-
-            start_token_id = int(sentence_df.iloc[0]["token_ID_within_document"])
-            end_token_id = int(sentence_df.iloc[-1]["token_ID_within_document"])
-
-            characters = set()
-            speaker = set()
-            proper_nouns_pos = []
-            
-            while entities_row is not None and entities_row['end_token'] <= end_token_id:
-                if entities_row['start_token'] >= start_token_id and entities_row['COREF'] in main_characters_coref:
-                    novel_id = chapter_coref[str(entities_row['COREF'])]["novel_id"]
-
-                    consolidated_id = get_consolidated_id(consolidated_indices, novel_id, chapter, filter_func, filter_args)
-                    if consolidated_id is not None:
-                        characters.add(int(consolidated_id))
-                
-                curr_entities_row_idx += 1
-                if curr_entities_row_idx >= len(entities_df): 
-                    entities_row = None
-                    break
-
-                entities_row = entities_df.iloc[curr_entities_row_idx]
-
-
-            while quotes_row is not None and ((
-                quotes_row['quote_end'] > start_token_id and quotes_row['quote_end'] <= end_token_id
-            ) or (
-                quotes_row['quote_start'] >= start_token_id and quotes_row['quote_start'] < end_token_id
-            )):
-                if quotes_row['char_id'] in main_characters_coref:
-                    novel_id = chapter_coref[str(int(quotes_row['char_id']))]["novel_id"]
-                    consolidated_id = get_consolidated_id(consolidated_indices, novel_id, chapter, filter_func, filter_args)
-                    if consolidated_id is not None:
-                        speaker.add(int(consolidated_id))
-
-                if quotes_row['quote_end'] > end_token_id:
-                    break
-                
-                curr_quotes_row_idx += 1
-                if curr_quotes_row_idx >= len(quotes_df):
-                    quotes_row = None
-                    break
-                
-                quotes_row = quotes_df.iloc[curr_quotes_row_idx]
-
-            for idx, row in sentence_df.iterrows():
-                if row['POS_tag'] == "PROPN":
-                    proper_nouns_pos.append([row['byte_onset']-byte_onset, row['byte_offset']-byte_onset])
-
-            speaker = list(speaker)
-
-            sentence_info['words'].append(sentence)
-            sentence_info['start_token_id'].append(start_token_id)
-            sentence_info['end_token_id'].append(end_token_id)
-            sentence_info['characters'].append(list(characters))
-            sentence_info['speaker'].append(speaker)
-            sentence_info['proper_nouns_pos'].append(proper_nouns_pos)
-
-    relevant_sentences_df = pd.DataFrame.from_dict(sentence_info)
-    relevant_sentences_csv_fp = os.path.join(chapter_dir, 'relevant_sentences.csv')
-    relevant_sentences_df.to_csv(relevant_sentences_csv_fp, index=False)
-
-    print(f"Completed {chapter}")
+
+_worker_args = {}
+
+
+def _init_worker(**kwargs) -> None:
+    """Stores the arguments shared by every chapter once per worker process"""
+
+    _worker_args.update(kwargs)
+
+
+def _run_chapter_in_worker(chapter: str) -> None:
+    get_relevant_sentences_in_chapter(chapter, **_worker_args, verbose=False)
 
 
 def get_relevant_sentences_in_book(
     ner_coref_data_dir: str,
     text_dir: str,
     characters_data_dir: str,
-    filter_func: Callable[[int, str, any], bool] | None = None,
-    filter_args: any = None
+    filter_func: Callable[[int, str, any], bool] | FilterRules | None = None,
+    filter_args: any = None,
+    workers: int = 1,
+    chapters: list[str] | None = None,
+    output_format: str = 'csv',
+    use_sidecar: bool = False,
+    metrics: RunMetrics | None = None
 ) -> None:
+    """Creates a relevant_sentences.csv (or relevant_sentences.npz, see `output_format`) file for every chapter in
+    `ner_coref_data_dir`, or only for `chapters` if given.
+    
+    With `workers` > 1, chapters are processed on a pool of that many processes. `filter_func` and `filter_args` must 
+    then be picklable (e.g. a function defined in a module) unless processes are forked. A failing chapter does not stop 
+    the others; a RuntimeError listing every failed chapter is raised once all chapters have been attempted.
+
+    With `metrics`, the stage and every chapter are recorded (see `RunMetrics`)."""
+
     chapters_coref_file_path = os.path.join(characters_data_dir, 'chapters_coref.json')
 
     if not os.path.exists(chapters_coref_file_path):
@@ -162,13 +273,54 @@ def get_relevant_sentences_in_book(
     with open(consolidated_indices_file_path) as file:
         consolidated_indices = json.load(file)
 
-    for chapter in os.listdir(ner_coref_data_dir):
-        get_relevant_sentences_in_chapter(
-            chapter,
-            ner_coref_data_dir,
-            text_dir,
-            chapters_coref,
-            consolidated_indices,
-            filter_func,
-            filter_args
-        )
+    if chapters is None:
+        chapters = os.listdir(ner_coref_data_dir)
+
+    with record_stage(metrics, "get_relevant_sentences"):
+        if workers <= 1:
+            for chapter in chapters:
+                get_relevant_sentences_in_chapter(
+                    chapter,
+                    ner_coref_data_dir,
+                    text_dir,
+                    chapters_coref,
+                    consolidated_indices,
+                    filter_func,
+                    filter_args,
+                    output_format=output_format,
+                    use_sidecar=use_sidecar,
+                    metrics=metrics
+                )
+
+            return None
+    
+        failed_chapters = {}
+
+        # The mappings are handed to each worker once through the initializer, so every task only pickles its chapter name
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=partial(
+                _init_worker,
+                ner_coref_data_dir=ner_coref_data_dir,
+                text_dir=text_dir,
+                chapters_coref=chapters_coref,
+                consolidated_indices=consolidated_indices,
+                filter_func=filter_func,
+                filter_args=filter_args,
+                output_format=output_format,
+                use_sidecar=use_sidecar,
+                metrics=metrics
+            )
+        ) as executor:
+            futures = {executor.submit(_run_chapter_in_worker, chapter): chapter for chapter in chapters}
+
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                chapter = futures[future]
+                error = future.exception()
+
+                if error is not None:
+                    failed_chapters[chapter] = error
+                    tqdm.write(f"Failed {chapter}: {error!r}")
+
+        if failed_chapters:
+            raise RuntimeError(f"Failed to get relevant sentences for {len(failed_chapters)} chapter(s): {', '.join(sorted(failed_chapters))}")
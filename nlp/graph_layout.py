@@ -0,0 +1,223 @@
+import json
+import os
+
+import numpy as np
+
+from .frontend_export import get_frontend_edges
+from .relations import load_relations
+from .sentiment_analysis import get_interactions
+
+
+LAYOUTS_FILE = 'layouts.json'
+
+# Offsets of the cells surrounding a cell, itself included
+_NEIGHBOUR_OFFSETS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+
+# Offsets of the children of the cells surrounding a parent cell, from the first child of the first of them
+_CHILD_OFFSETS = np.array([(dx, dy) for dx in range(6) for dy in range(6)])
+
+
+def _get_near_pairs(cells: np.ndarray, num_cells: int, grid_size: int) -> tuple[np.ndarray, np.ndarray]:
+    """Returns every pair of distinct nodes whose cells (`x * grid_size + y`) are neighbours"""
+
+    order = np.argsort(cells, kind='stable')
+    cell_starts = np.searchsorted(cells[order], np.arange(num_cells + 1))
+    cell_x, cell_y = np.divmod(cells, grid_size)
+
+    node_idx, other_idx = [], []
+    for dx, dy in _NEIGHBOUR_OFFSETS:
+        x, y = cell_x + dx, cell_y + dy
+        is_valid = (x >= 0) & (x < grid_size) & (y >= 0) & (y < grid_size)
+        neighbour = np.where(is_valid, x * grid_size + y, 0)
+
+        starts = cell_starts[neighbour]
+        counts = np.where(is_valid, cell_starts[neighbour + 1] - starts, 0)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+        node_idx.append(np.repeat(np.arange(len(cells)), counts))
+        other_idx.append(order[np.repeat(starts, counts) + offsets])
+
+    node_idx, other_idx = np.concatenate(node_idx), np.concatenate(other_idx)
+    is_pair = node_idx != other_idx
+
+    return node_idx[is_pair], other_idx[is_pair]
+
+
+def get_repulsion_forces(positions: np.ndarray, gravitational_constant: float, leaf_size: int = 4) -> np.ndarray:
+    """Barnes-Hut approximation of the repulsion between every pair of nodes, `gravitational_constant / d^2` for nodes at
+    distance `d` (as in the `barnesHut` solver of vis-network).
+
+    The nodes are placed in a quadtree of grids, halving the cell size at every level until the finest cells hold about
+    `leaf_size` nodes on average. Nodes in neighbouring cells of the finest grid repel each other directly. Farther
+    nodes are grouped, at the coarsest level at which they are not neighbours, into their cell's centre of mass. Those
+    are the children of the neighbours of the node's parent cell that are not neighbours of the node's own cell, at
+    most 27 cells per node and level."""
+
+    num_nodes = len(positions)
+    forces = np.zeros_like(positions)
+
+    if num_nodes < 2:
+        return forces
+
+    origin = positions.min(axis=0)
+    size = max(float((positions.max(axis=0) - origin).max()), 1e-9) * (1 + 1e-9)
+    num_levels = max(2, int(np.ceil(np.log(num_nodes / leaf_size) / np.log(4))))
+
+    finest_size = 2 ** num_levels
+    finest_cells = np.minimum(((positions - origin) / size * finest_size).astype(np.int64), finest_size - 1)
+
+    def add_forces(node_idx: np.ndarray, source_positions: np.ndarray, source_masses: np.ndarray) -> None:
+        delta = positions[node_idx] - source_positions
+        distance = np.maximum(np.hypot(delta[:, 0], delta[:, 1]), 0.1)
+        magnitude = gravitational_constant * source_masses / distance ** 3
+        forces[:, 0] += np.bincount(node_idx, weights=delta[:, 0] * magnitude, minlength=num_nodes)
+        forces[:, 1] += np.bincount(node_idx, weights=delta[:, 1] * magnitude, minlength=num_nodes)
+
+    # Far field, from level 2 (at level 1, every cell neighbours every other)
+    for level in range(2, num_levels + 1):
+        grid_size = 2 ** level
+        cell_x, cell_y = (finest_cells >> (num_levels - level)).T
+        cells = cell_x * grid_size + cell_y
+
+        masses = np.bincount(cells, minlength=grid_size ** 2).astype(np.float64)
+        centres = np.stack((
+            np.bincount(cells, weights=positions[:, 0], minlength=grid_size ** 2),
+            np.bincount(cells, weights=positions[:, 1], minlength=grid_size ** 2)
+        ), axis=1) / np.maximum(masses, 1)[:, None]
+
+        # The children of the parent's neighbours span 6 cells along each axis, starting 2 cells before the parent's first child
+        x = ((cell_x >> 1) * 2 - 2)[:, None] + _CHILD_OFFSETS[:, 0]
+        y = ((cell_y >> 1) * 2 - 2)[:, None] + _CHILD_OFFSETS[:, 1]
+        is_far = (
+            (x >= 0) & (x < grid_size) & (y >= 0) & (y < grid_size)
+            & ((np.abs(x - cell_x[:, None]) > 1) | (np.abs(y - cell_y[:, None]) > 1))
+        )
+        source = np.where(is_far, x * grid_size + y, 0)
+        is_far &= masses[source] > 0
+
+        node_idx, offset_idx = np.nonzero(is_far)
+        source_cells = source[node_idx, offset_idx]
+        add_forces(node_idx, centres[source_cells], masses[source_cells])
+
+    # Near field, node by node
+    node_idx, other_idx = _get_near_pairs(finest_cells[:, 0] * finest_size + finest_cells[:, 1], finest_size ** 2, finest_size)
+    add_forces(node_idx, positions[other_idx], np.ones(len(node_idx)))
+
+    return forces
+
+
+def compute_layout(
+    num_nodes: int,
+    edge_from: np.ndarray,
+    edge_to: np.ndarray,
+    edge_lengths: np.ndarray,
+    gravitational_constant: float = 2000,
+    central_gravity: float = 0.3,
+    spring_constant: float = 0.04,
+    damping: float = 0.09,
+    timestep: float = 0.5,
+    max_velocity: float = 50,
+    min_velocity: float = 0.1,
+    max_iterations: int = 1000,
+    seed: int = 0
+) -> np.ndarray:
+    """Computes `(num_nodes, 2)` node positions with a force-directed simulation, integrated the way vis-network
+    stabilizes a graph so the page can show the result with physics disabled.
+
+    Nodes repel each other (see `get_repulsion_forces`), edges are springs of rest length `edge_lengths` and every node
+    is pulled towards the origin by `central_gravity`. The simulation stops once no node moves faster than
+    `min_velocity`, or after `max_iterations`."""
+
+    rng = np.random.default_rng(seed)
+    radius = 100 * np.sqrt(max(num_nodes, 1))
+    angles = rng.uniform(0, 2 * np.pi, num_nodes)
+    positions = np.stack((np.cos(angles), np.sin(angles)), axis=1) * radius * np.sqrt(rng.uniform(0, 1, num_nodes))[:, None]
+    velocities = np.zeros_like(positions)
+
+    for _ in range(max_iterations):
+        forces = get_repulsion_forces(positions, gravitational_constant)
+
+        # Central gravity of constant strength
+        distance = np.maximum(np.hypot(positions[:, 0], positions[:, 1]), 1e-9)
+        forces -= positions * (central_gravity / distance)[:, None]
+
+        # Springs, pulling or pushing both ends towards the rest length
+        delta = positions[edge_from] - positions[edge_to]
+        distance = np.maximum(np.hypot(delta[:, 0], delta[:, 1]), 0.01)
+        spring_forces = delta * (spring_constant * (edge_lengths - distance) / distance)[:, None]
+        for axis in range(2):
+            forces[:, axis] += np.bincount(edge_from, weights=spring_forces[:, axis], minlength=num_nodes)
+            forces[:, axis] -= np.bincount(edge_to, weights=spring_forces[:, axis], minlength=num_nodes)
+
+        velocities += (forces - damping * velocities) * timestep
+        speed = np.hypot(velocities[:, 0], velocities[:, 1])
+        velocities *= np.minimum(1, max_velocity / np.maximum(speed, 1e-9))[:, None]
+        positions += velocities * timestep
+
+        if not num_nodes or speed.max() < min_velocity:
+            break
+
+    return positions
+
+
+def get_preset_key(preset: float) -> str:
+    """Formats a preset the way the page prints the slider value, e.g. '5' or '0.05'"""
+
+    return f"{preset:g}"
+
+
+def export_layouts(
+    characters_data_dir: str,
+    output_dir: str,
+    presets: list[float] | tuple[float, ...] = (0.05, 5),
+    **kwargs
+) -> dict[str, dict[str, list]]:
+    """Computes the layout of the graph shown by the web page for every filter preset and writes them to layouts.json
+    in `output_dir`, next to character_names.json.
+
+    As on the page, a preset below 1 is a minimum percentage of interactions and any other preset a minimum number of
+    interactions. Only the characters and edges the page shows for the preset are laid out, using the edge lengths of
+    `get_frontend_edges`. Layouts are keyed by `get_preset_key` and hold the `ids` of the characters shown and their `x`
+    and `y` positions. `kwargs` are passed to `compute_layout`."""
+
+    main_characters_aliases_file_path = os.path.join(characters_data_dir, 'main_characters_aliases.json')
+
+    if not os.path.exists(main_characters_aliases_file_path):
+        raise FileNotFoundError('Missing main_characters_aliases.json in given directory!')
+
+    with open(main_characters_aliases_file_path, 'r') as file:
+        num_chars = len(json.load(file))
+
+    info = load_relations(characters_data_dir)
+
+    edges, nodes = get_frontend_edges(num_chars, *get_interactions(info))
+    layouts = {}
+
+    for preset in presets:
+        if preset < 1:
+            is_shown = edges["percentage"] >= preset
+            ids = np.flatnonzero(np.array(nodes["max_percentage"]) >= preset)
+        else:
+            is_shown = edges["count"] >= preset
+            ids = np.flatnonzero(np.array(nodes["max_count"]) >= preset)
+
+        # Node ids are renumbered to the characters shown
+        node_idx = np.full(num_chars, -1, dtype=np.int64)
+        node_idx[ids] = np.arange(len(ids))
+
+        positions = compute_layout(
+            len(ids), node_idx[edges["from"][is_shown]], node_idx[edges["to"][is_shown]], edges["length"][is_shown], **kwargs
+        )
+
+        layouts[get_preset_key(preset)] = {
+            "ids": ids.tolist(),
+            "x": np.round(positions[:, 0], 1).tolist(),
+            "y": np.round(positions[:, 1], 1).tolist()
+        }
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    with open(os.path.join(output_dir, LAYOUTS_FILE), 'w') as file:
+        json.dump(layouts, file, separators=(',', ':'))
+
+    return layouts
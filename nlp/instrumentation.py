@@ -0,0 +1,210 @@
+import contextlib
+import cProfile
+import heapq
+import json
+import os
+import re
+import sys
+import time
+
+from typing import Iterator
+
+
+def get_memory_usage_mb() -> float:
+    """Returns the resident set size of the current process in MB"""
+
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        peak_memory_usage_mb = get_peak_memory_usage_mb()
+
+        # Peak rather than current RSS
+        return peak_memory_usage_mb if peak_memory_usage_mb is not None else 0.0
+
+
+def get_peak_memory_usage_mb() -> float | None:
+    """Returns the peak resident set size of the current process in MB, or None where it is not available (Windows)"""
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    # ru_maxrss is in bytes on macOS and KB elsewhere
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / 2**20 if sys.platform == 'darwin' else max_rss / 2**10
+
+
+def get_io_counters() -> dict[str, int] | None:
+    """Returns the bytes read and written and the read and write calls of the current process so far, page cache hits
+    included, or None where /proc/self/io is not available"""
+
+    try:
+        with open('/proc/self/io', 'r') as file:
+            counters = dict(line.split(': ') for line in file.read().splitlines())
+    except (OSError, ValueError):
+        return None
+
+    return {
+        "read_bytes": int(counters["rchar"]),
+        "write_bytes": int(counters["wchar"]),
+        "read_calls": int(counters["syscr"]),
+        "write_calls": int(counters["syscw"])
+    }
+
+
+class MetricsRecord():
+    """Counts of what a stage or chapter processed (e.g. rows, sentences or mentions), added while it runs"""
+
+    def __init__(self) -> None:
+        self.counts = {}
+
+    def add(self, **counts: int) -> None:
+        for name, count in counts.items():
+            self.counts[name] = self.counts.get(name, 0) + int(count)
+
+
+class RunMetrics():
+    """Records the wall and CPU time, memory, throughput, I/O and score cache counters of every chapter and stage of a
+    run, and appends them to `output_file` as JSON lines.
+
+    Every line has the `event` ('chapter' or 'stage'), `stage`, `chapter` (None for stages), `pid`, `wall_s`, `cpu_s`,
+    `rss_mb` and `peak_rss_mb` of the process at the end, the `counts` of what was processed and the `throughput` of
+    each of them per second, and the `io` and `score_cache` counters accumulated meanwhile (None if not available).
+    Stages also count their `chapters` and add up the counts of their chapters. Failed chapters and stages are recorded
+    with their `error`.
+
+    With `profile_slowest`, every chapter runs under cProfile and the profiles of the `profile_slowest` slowest chapters
+    of each stage are kept in `profile_dir` (by default a profiles directory next to `output_file`), to be read with
+    `pstats`. A `RunMetrics` can be passed to worker processes, which append their chapters to the same file; their
+    counts are not added to the stage of the parent process and they keep their own slowest profiles."""
+
+    def __init__(self, output_file: str, profile_slowest: int = 0, profile_dir: str | None = None) -> None:
+        self.output_file = os.path.abspath(output_file)
+        self.profile_slowest = profile_slowest
+        self.profile_dir = os.path.join(os.path.dirname(self.output_file), 'profiles') if profile_dir is None else os.path.abspath(profile_dir)
+
+        # Open stage records by stage, and the (wall_s, profile_path) heaps of the slowest chapters of every stage
+        self.open_stages = {}
+        self.slowest = {}
+        self.num_profiles = 0
+
+    def __getstate__(self) -> dict[str, any]:
+        # Worker processes start without the stages and profiles of the parent
+        return {**self.__dict__, "open_stages": {}, "slowest": {}}
+
+    def write(self, record: dict[str, any]) -> None:
+        os.makedirs(os.path.dirname(self.output_file), exist_ok=True)
+
+        # One write per line, so lines appended by several processes are not interleaved
+        with open(self.output_file, 'a') as file:
+            file.write(json.dumps(record) + '\n')
+
+    @contextlib.contextmanager
+    def _record(self, event: str, stage: str, chapter: str | None, score_cache: any, profile: bool) -> Iterator[MetricsRecord]:
+        record = MetricsRecord()
+        io_start = get_io_counters()
+        cache_start = score_cache.get_stats() if score_cache is not None else None
+        profiler = cProfile.Profile() if profile else None
+        error = None
+
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        if profiler is not None:
+            profiler.enable()
+
+        try:
+            yield record
+        except BaseException as exception:
+            error = repr(exception)
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+
+            wall_s, cpu_s = time.perf_counter() - wall_start, time.process_time() - cpu_start
+            io_end = get_io_counters()
+
+            cache_counters = None
+            if cache_start is not None:
+                cache_end = score_cache.get_stats()
+                cache_counters = {name: cache_end[name] - cache_start[name] for name in ("hits", "misses", "evictions")}
+
+            self.write({
+                "event": event,
+                "stage": stage,
+                "chapter": chapter,
+                "pid": os.getpid(),
+                "time": time.time(),
+                "wall_s": wall_s,
+                "cpu_s": cpu_s,
+                "rss_mb": get_memory_usage_mb(),
+                "peak_rss_mb": get_peak_memory_usage_mb(),
+                "counts": record.counts,
+                "throughput": {f"{name}_per_s": count / wall_s for name, count in record.counts.items() if wall_s > 0},
+                "io": {name: io_end[name] - io_start[name] for name in io_end} if io_start is not None and io_end is not None else None,
+                "score_cache": cache_counters,
+                "error": error
+            })
+
+            if profiler is not None:
+                self._keep_profile(stage, chapter, wall_s, profiler)
+
+    def _keep_profile(self, stage: str, chapter: str, wall_s: float, profiler: cProfile.Profile) -> None:
+        slowest = self.slowest.setdefault(stage, [])
+        if len(slowest) >= self.profile_slowest and wall_s <= slowest[0][0]:
+            return None
+
+        # Numbered, as a chapter may be recorded more than once
+        self.num_profiles += 1
+        os.makedirs(self.profile_dir, exist_ok=True)
+        file_name = re.sub(r'[^\w\-_]', '_', chapter)
+        profile_path = os.path.join(self.profile_dir, f"{stage}-{file_name}-{os.getpid()}-{self.num_profiles}.prof")
+        profiler.dump_stats(profile_path)
+
+        if len(slowest) < self.profile_slowest:
+            heapq.heappush(slowest, (wall_s, profile_path))
+        else:
+            _, evicted_path = heapq.heapreplace(slowest, (wall_s, profile_path))
+            if os.path.exists(evicted_path):
+                os.remove(evicted_path)
+
+    @contextlib.contextmanager
+    def stage(self, stage: str, score_cache: any = None) -> Iterator[MetricsRecord]:
+        """Records a stage. Chapters recorded in the meantime add their counts to it."""
+
+        with self._record("stage", stage, None, score_cache, False) as record:
+            self.open_stages[stage] = record
+
+            try:
+                yield record
+            finally:
+                del self.open_stages[stage]
+
+    @contextlib.contextmanager
+    def chapter(self, stage: str, chapter: str, score_cache: any = None) -> Iterator[MetricsRecord]:
+        """Records a chapter of a stage, profiling it if `profile_slowest` is set"""
+
+        with self._record("chapter", stage, chapter, score_cache, self.profile_slowest > 0) as record:
+            yield record
+
+        stage_record = self.open_stages.get(stage)
+        if stage_record is not None:
+            stage_record.add(chapters=1, **record.counts)
+
+
+def record_stage(metrics: RunMetrics | None, stage: str, score_cache: any = None) -> contextlib.AbstractContextManager[MetricsRecord]:
+    """`metrics.stage`, or a record that is discarded if `metrics` is None"""
+
+    return metrics.stage(stage, score_cache) if metrics is not None else contextlib.nullcontext(MetricsRecord())
+
+
+def record_chapter(
+    metrics: RunMetrics | None,
+    stage: str,
+    chapter: str,
+    score_cache: any = None
+) -> contextlib.AbstractContextManager[MetricsRecord]:
+    """`metrics.chapter`, or a record that is discarded if `metrics` is None"""
+
+    return metrics.chapter(stage, chapter, score_cache) if metrics is not None else contextlib.nullcontext(MetricsRecord())
@@ -1,31 +1,262 @@
 import argparse
+import json
+import multiprocessing
 import os
+import traceback
 
+from multiprocessing.connection import Connection, wait
+
+try:
+    from .instrumentation import RunMetrics, get_memory_usage_mb, record_chapter, record_stage
+except ImportError:
+    # Run as a script
+    from instrumentation import RunMetrics, get_memory_usage_mb, record_chapter, record_stage
+
+
+OUTPUT_SUFFIXES = ('.book', '.tokens', '.entities', '.quotes')
+
+MODEL_PARAMS = {
+    "pipeline":"entity,quote,coref",
+    "model":"big"
+}
+
+
+def _get_manifest_path(output_dir: str, book_id: str) -> str:
+    return os.path.join(output_dir, f"{book_id}.complete.json")
+
+
+def is_chapter_complete(input_file: str, output_dir: str, book_id: str) -> bool:
+    """Checks the completion manifest of a chapter against its input file and BookNLP outputs"""
+
+    manifest_path = _get_manifest_path(output_dir, book_id)
+    if not os.path.exists(manifest_path):
+        return False
+
+    try:
+        with open(manifest_path, 'r') as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return False
+
+    input_stat = os.stat(input_file)
+    if manifest.get("input") != {"size": input_stat.st_size, "mtime_ns": input_stat.st_mtime_ns}:
+        return False
+
+    for suffix in OUTPUT_SUFFIXES:
+        output_file = os.path.join(output_dir, f"{book_id}{suffix}")
+        if not os.path.exists(output_file) or os.path.getsize(output_file) != manifest["outputs"].get(suffix):
+            return False
+
+    return True
+
+
+def _write_manifest(input_file: str, output_dir: str, book_id: str) -> None:
+    input_stat = os.stat(input_file)
+    manifest = {
+        "input": {"size": input_stat.st_size, "mtime_ns": input_stat.st_mtime_ns},
+        "outputs": {suffix: os.path.getsize(os.path.join(output_dir, f"{book_id}{suffix}")) for suffix in OUTPUT_SUFFIXES}
+    }
+
+    manifest_path = _get_manifest_path(output_dir, book_id)
+    with open(manifest_path + '.tmp', 'w') as file:
+        json.dump(manifest, file, indent=4)
+
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def _process_chapter(booknlp, text_dir: str, chapter_name: str, output_dir_book: str, metrics: RunMetrics | None = None) -> None:
+    input_file = os.path.join(text_dir, chapter_name)
+    book_id = chapter_name[:-4]
+    output_dir = os.path.join(output_dir_book, book_id)
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    # A stale manifest must not outlive a partially rewritten chapter
+    if os.path.exists(_get_manifest_path(output_dir, book_id)):
+        os.remove(_get_manifest_path(output_dir, book_id))
+
+    with record_chapter(metrics, "run_ner_coref", book_id) as record:
+        booknlp.process(input_file, output_dir, book_id)
+
+        if metrics is not None:
+            with open(os.path.join(output_dir, f"{book_id}.tokens"), 'rb') as file:
+                record.add(input_bytes=os.path.getsize(input_file), tokens=sum(1 for _ in file) - 1)
+
+    _write_manifest(input_file, output_dir, book_id)
+
+
+def _ner_coref_worker(
+    task_queue: multiprocessing.Queue,
+    connection: Connection,
+    text_dir: str,
+    output_dir_book: str,
+    max_worker_memory_mb: float | None,
+    metrics: RunMetrics | None
+) -> None:
+    """Loads BookNLP once, then processes chapters from `task_queue` until it receives None or exceeds its memory cap"""
 
-def run_ner_coref(text_dir: str, output_dir_book: str) -> None:
     from booknlp.booknlp import BookNLP
 
-    model_params = {
-            "pipeline":"entity,quote,coref", 
-            "model":"big"
-        }
-        
-    booknlp = BookNLP("en", model_params)
+    booknlp = BookNLP("en", MODEL_PARAMS)
+    connection.send(("ready", None))
+
+    while True:
+        chapter_name = task_queue.get()
+        if chapter_name is None:
+            connection.send(("exited", None))
+            return None
+
+        connection.send(("started", chapter_name))
+
+        try:
+            _process_chapter(booknlp, text_dir, chapter_name, output_dir_book, metrics)
+        except Exception:
+            connection.send(("failed", (chapter_name, traceback.format_exc())))
+        else:
+            connection.send(("completed", chapter_name))
+
+        if max_worker_memory_mb is not None and get_memory_usage_mb() > max_worker_memory_mb:
+            connection.send(("recycled", None))
+            return None
+
+
+def _run_ner_coref_workers(
+    text_dir: str,
+    output_dir_book: str,
+    chapter_names: list[str],
+    workers: int,
+    max_worker_memory_mb: float | None,
+    metrics: RunMetrics | None
+) -> None:
+    task_queue = multiprocessing.Queue()
+
+    for chapter_name in chapter_names:
+        task_queue.put(chapter_name)
+    for _ in range(workers):
+        task_queue.put(None)
+
+    # Each worker reports back over its own pipe. Sends are synchronous, and the pipe reaches EOF once the worker is 
+    # gone, so a worker that is killed mid-chapter is always noticed.
+    processes = {}
+    worker_states = {}
+    in_progress = {}
+    failed_chapters = {}
+    num_remaining = len(chapter_names)
+
+    def start_worker() -> None:
+        reader, writer = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(
+            target=_ner_coref_worker,
+            args=(task_queue, writer, text_dir, output_dir_book, max_worker_memory_mb, metrics),
+            daemon=True
+        )
+        process.start()
+        writer.close()
+
+        processes[reader] = process
+        worker_states[reader] = "loading"
+
+    for _ in range(min(workers, len(chapter_names))):
+        start_worker()
+
+    try:
+        while num_remaining:
+            for reader in wait(list(processes)):
+                try:
+                    event, payload = reader.recv()
+                except EOFError:
+                    processes.pop(reader).join()
+                    state = worker_states.pop(reader)
+
+                    if state == "loading":
+                        raise RuntimeError("BookNLP worker exited before loading the model!")
+
+                    chapter_name = in_progress.pop(reader, None)
+                    if chapter_name is not None:
+                        failed_chapters[chapter_name] = "Worker process died"
+                        num_remaining -= 1
+                        print(f"Failed {chapter_name}: worker process died")
+
+                    # Crashed workers (e.g. killed for running out of memory) did not take a sentinel off the queue, and
+                    # are replaced while chapters are still queued rather than in progress on other workers. A chapter
+                    # taken but not reported yet counts as queued, so at worst the replacement takes a sentinel and exits.
+                    if state != "exited" and num_remaining > len(in_progress):
+                        start_worker()
+                    continue
+
+                if event in ("ready", "exited", "recycled"):
+                    worker_states[reader] = event
+                elif event == "started":
+                    in_progress[reader] = payload
+                elif event == "completed":
+                    del in_progress[reader]
+                    num_remaining -= 1
+                    print(f"Completed {payload}")
+                elif event == "failed":
+                    del in_progress[reader]
+                    chapter_name, error = payload
+                    failed_chapters[chapter_name] = error
+                    num_remaining -= 1
+                    print(f"Failed {chapter_name}\n{error}")
+    finally:
+        for process in processes.values():
+            process.terminate()
+
+    if failed_chapters:
+        raise RuntimeError(f"BookNLP failed on {len(failed_chapters)} chapter(s): {', '.join(sorted(failed_chapters))}")
+
+
+def run_ner_coref(
+    text_dir: str,
+    output_dir_book: str,
+    workers: int = 1,
+    max_worker_memory_mb: float | None = None,
+    resume: bool = True,
+    chapters: list[str] | None = None,
+    metrics: RunMetrics | None = None
+) -> None:
+    """Runs BookNLP on every chapter in `text_dir`, or only on `chapters` (names without the .txt extension) if given.
+
+    After a chapter is processed, a `<chapter>.complete.json` manifest recording the sizes of its input and of the
+    `.book`, `.tokens`, `.entities` and `.quotes` outputs is written next to them. With `resume`, chapters whose
+    manifest still matches are skipped, so an interrupted run can simply be restarted.
+
+    With `workers` > 1, that many processes are started, each loading the model once and pulling chapters from a shared
+    queue. A worker whose resident memory exceeds `max_worker_memory_mb` after a chapter is replaced by a fresh one.
+
+    With `metrics`, the stage and every chapter processed are recorded (see `RunMetrics`)."""
 
     if not os.path.isdir(text_dir):
         raise FileNotFoundError('Given input directory not found!')
 
+    chapter_names = []
     for chapter_name in os.listdir(text_dir):
-        
-        input_file = os.path.join(text_dir, chapter_name)
         book_id = chapter_name[:-4]
-        output_dir = os.path.join(output_dir_book, book_id)
 
+        if chapters is not None and book_id not in chapters:
+            continue
+
+        if resume and is_chapter_complete(os.path.join(text_dir, chapter_name), os.path.join(output_dir_book, book_id), book_id):
+            print(f"Skipped {chapter_name}")
+            continue
+
+        chapter_names.append(chapter_name)
 
-        os.makedirs(output_dir, exist_ok=True)
+    with record_stage(metrics, "run_ner_coref"):
+        if workers > 1:
+            _run_ner_coref_workers(text_dir, output_dir_book, chapter_names, workers, max_worker_memory_mb, metrics)
+            return None
 
-        booknlp.process(input_file, output_dir, book_id)  
-        print(f"Completed {chapter_name}")
+        if not chapter_names:
+            return None
+
+        from booknlp.booknlp import BookNLP
+
+        booknlp = BookNLP("en", MODEL_PARAMS)
+
+        for chapter_name in chapter_names:
+            _process_chapter(booknlp, text_dir, chapter_name, output_dir_book, metrics)
+            print(f"Completed {chapter_name}")
 
 
 if __name__ == "__main__":
@@ -48,7 +279,37 @@ if __name__ == "__main__":
         required=False,
         default="output"
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        help="Number of worker processes",
+        required=False,
+        default=1
+    )
+    parser.add_argument(
+        "-m",
+        "--max-worker-memory",
+        type=float,
+        help="Memory cap per worker process in MB",
+        required=False,
+        default=None
+    )
+    parser.add_argument(
+        "--rerun",
+        action="store_true",
+        help="Reprocess chapters that are already complete"
+    )
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        help="JSON-lines file to record the run metrics to",
+        required=False,
+        default=None
+    )
 
     args = parser.parse_args()
 
-    run_ner_coref(args.input, args.output)
+    metrics = RunMetrics(args.metrics) if args.metrics is not None else None
+
+    run_ner_coref(args.input, args.output, args.workers, args.max_worker_memory, not args.rerun, metrics=metrics)
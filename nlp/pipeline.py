@@ -0,0 +1,304 @@
+import hashlib
+import json
+import os
+import shutil
+
+from typing import Callable
+
+from .consolidate_main_char import consolidate_main_char
+from .filter_rules import FilterRules
+from .get_main_char import get_main_char
+from .get_relevant_sentences import get_coref_lookup, get_relevant_sentences_in_book
+from .instrumentation import RunMetrics
+from .ner_coref import OUTPUT_SUFFIXES, run_ner_coref
+from .relations import RELATIONS_FILE, RELATIONS_STORE_DIR, RELATIONS_STORE_HEADER, RELATIONS_STORE_INDEX
+from .sentence_store import RELEVANT_SENTENCES_FILES, SENTIMENT_FILE
+from .sentiment_analysis import analyse_sentiments, collate_relations
+from .sentiment_scorer.base_scorer import BaseScorer
+
+
+def hash_json(obj: any) -> str:
+    """Returns the SHA-256 hash of a JSON-serialisable object"""
+
+    return hashlib.sha256(json.dumps(obj, sort_keys=True).encode()).hexdigest()
+
+
+class BuildManifest():
+    """Records content hashes of the inputs and outputs of every pipeline stage.
+
+    Each stage stores one record per key (a chapter name, or the book name for whole-book stages) holding the hash of
+    its inputs and the hash of every output file. A record is fresh if its input hash is unchanged and its outputs
+    have not been modified or removed since."""
+
+    def __init__(self, manifest_path: str) -> None:
+        self.manifest_path = manifest_path
+
+        manifest = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r') as file:
+                manifest = json.load(file)
+
+        # file_path : {"size": int, "mtime_ns": int, "sha256": str}, so unchanged files are not rehashed on every run
+        self.files = manifest.get("files", {})
+        # stage : key : {"inputs": str, "outputs": {file_path: str}}
+        self.stages = manifest.get("stages", {})
+
+    def hash_file(self, file_path: str) -> str | None:
+        """Returns the SHA-256 hash of a file, or None if it does not exist"""
+
+        if not os.path.exists(file_path):
+            return None
+
+        stat = os.stat(file_path)
+        cached = self.files.get(file_path)
+        if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            return cached["sha256"]
+
+        sha256 = hashlib.sha256()
+        with open(file_path, 'rb') as file:
+            for block in iter(lambda: file.read(2**20), b''):
+                sha256.update(block)
+
+        self.files[file_path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256.hexdigest()}
+
+        return sha256.hexdigest()
+
+    def is_fresh(self, stage: str, key: str, input_hash: str) -> bool:
+        record = self.stages.get(stage, {}).get(key)
+        if record is None or record["inputs"] != input_hash:
+            return False
+
+        return all(self.hash_file(file_path) == output_hash for file_path, output_hash in record["outputs"].items())
+
+    def record(self, stage: str, key: str, input_hash: str, output_paths: list[str]) -> None:
+        self.stages.setdefault(stage, {})[key] = {
+            "inputs": input_hash,
+            "outputs": {file_path: self.hash_file(file_path) for file_path in output_paths}
+        }
+
+    def forget(self, stage: str, key: str) -> None:
+        self.stages.get(stage, {}).pop(key, None)
+
+    def get_keys(self, stage: str) -> list[str]:
+        return list(self.stages.get(stage, {}).keys())
+
+    def get_outputs(self, stage: str, key: str) -> list[str]:
+        return list(self.stages.get(stage, {}).get(key, {"outputs": {}})["outputs"].keys())
+
+    def save(self) -> None:
+        with open(self.manifest_path + '.tmp', 'w') as file:
+            json.dump({"files": self.files, "stages": self.stages}, file, indent=4)
+
+        os.replace(self.manifest_path + '.tmp', self.manifest_path)
+
+
+def run_pipeline(
+    text_dir: str,
+    book: str,
+    ner_coref_data_dir: str,
+    characters_data_dir: str,
+    sentiment_scorer: BaseScorer,
+    filter_func: Callable[[int, str, any], bool] | FilterRules | None = None,
+    filter_args: any = None,
+    deduct_opposing_avg: bool = False,
+    deduct_book_avg: bool = False,
+    delimiter: str = r'(?:\r\n?|\n){6,}',
+    workers: int = 1,
+    sparse: bool = False,
+    relations_format: str = 'pickle',
+    sentences_format: str = 'csv',
+    use_sidecar: bool = False,
+    interactions_format: str = 'dense',
+    window: int | None = 1,
+    decay: float = 1.0,
+    within_paragraph: bool = False,
+    metrics: RunMetrics | None = None
+) -> None:
+    """Runs every stage from `split_chapters` to `collate_relations`, recomputing only what is stale.
+
+    Content hashes are kept in build_manifest.json in `characters_data_dir`. Per-chapter stages (BookNLP, sentence
+    linking and sentiment scoring) only rerun for chapters whose inputs changed. Sentence linking is keyed on the
+    chapter's BookNLP outputs and on the consolidated ids its characters resolve to after filtering, so editing an alias
+    (or the filter) only relinks and rescores the chapters where that character appears. Sentiment scores are keyed on
+    `sentiment_scorer.get_config()`. Relevant sentences are stored in `sentences_format` ('csv' or 'npz'). `use_sidecar` is passed to
+    `get_relevant_sentences_in_book`, `relations_format`, `window`, `decay` and `within_paragraph` to `analyse_sentiments` and
+    `interactions_format` to `collate_relations`. `metrics` is passed to every stage
+    that is rerun (see `RunMetrics`)."""
+
+    from utils.chapter_splitter import get_chapter_index_path, split_chapters
+
+    os.makedirs(characters_data_dir, exist_ok=True)
+    manifest = BuildManifest(os.path.join(characters_data_dir, 'build_manifest.json'))
+
+    book_text_file = os.path.join(text_dir, f"{book}.txt")
+    chapters_text_dir = os.path.join(text_dir, book)
+    aliases_file = os.path.join(characters_data_dir, 'main_characters_aliases.json')
+
+    # 1. Split into chapters
+    inputs_hash = hash_json([manifest.hash_file(book_text_file), delimiter])
+    if manifest.is_fresh("split_chapters", book, inputs_hash):
+        print("Skipped split_chapters")
+    else:
+        for file_path in manifest.get_outputs("split_chapters", book):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+        split_chapters(text_dir, book, delimiter)
+        manifest.record(
+            "split_chapters", book, inputs_hash,
+            [os.path.join(chapters_text_dir, chapter_file) for chapter_file in os.listdir(chapters_text_dir)]
+            + [get_chapter_index_path(text_dir, book)]
+        )
+        manifest.save()
+
+    chapters = sorted(chapter_file[:-4] for chapter_file in os.listdir(chapters_text_dir))
+
+    def get_chapter_file(chapter: str, file_name: str) -> str:
+        return os.path.join(ner_coref_data_dir, chapter, file_name)
+
+    # 2. Named Entity Recognition and Coreference Resolution
+    for chapter in manifest.get_keys("run_ner_coref"):
+        if chapter not in chapters:
+            shutil.rmtree(os.path.join(ner_coref_data_dir, chapter), ignore_errors=True)
+            for stage in ("run_ner_coref", "get_relevant_sentences", "analyse_sentiments_chapter"):
+                manifest.forget(stage, chapter)
+
+    ner_coref_inputs = {chapter: manifest.hash_file(os.path.join(chapters_text_dir, f"{chapter}.txt")) for chapter in chapters}
+    stale_chapters = [chapter for chapter in chapters if not manifest.is_fresh("run_ner_coref", chapter, ner_coref_inputs[chapter])]
+
+    if stale_chapters:
+        run_ner_coref(chapters_text_dir, ner_coref_data_dir, workers=workers, chapters=stale_chapters, metrics=metrics)
+
+        for chapter in stale_chapters:
+            manifest.record(
+                "run_ner_coref", chapter, ner_coref_inputs[chapter],
+                [get_chapter_file(chapter, f"{chapter}{suffix}") for suffix in OUTPUT_SUFFIXES]
+            )
+        manifest.save()
+    print(f"run_ner_coref: {len(stale_chapters)}/{len(chapters)} chapters processed")
+
+    # 3. Searching and Matching Main Characters
+    ner_chapters = sorted(os.listdir(ner_coref_data_dir))
+    inputs_hash = hash_json([[chapter, manifest.hash_file(get_chapter_file(chapter, f"{chapter}.book"))] for chapter in ner_chapters])
+    main_char_outputs = [os.path.join(characters_data_dir, file_name) for file_name in ('main_characters.json', 'chapters_coref.json')]
+
+    if manifest.is_fresh("get_main_char", book, inputs_hash):
+        print("Skipped get_main_char")
+    else:
+        get_main_char(ner_coref_data_dir, characters_data_dir, workers=workers, metrics=metrics)
+        manifest.record("get_main_char", book, inputs_hash, main_char_outputs)
+        manifest.save()
+
+    # 4. Consolidating Main Characters
+    inputs_hash = hash_json([manifest.hash_file(main_char_outputs[0]), manifest.hash_file(aliases_file)])
+    consolidate_outputs = [
+        os.path.join(characters_data_dir, file_name) for file_name in ('main_characters_consolidated.json', 'consolidated_indices.json')
+    ]
+
+    if manifest.is_fresh("consolidate_main_char", book, inputs_hash):
+        print("Skipped consolidate_main_char")
+    else:
+        consolidate_main_char(characters_data_dir)
+        manifest.record("consolidate_main_char", book, inputs_hash, consolidate_outputs)
+        manifest.save()
+
+    # 5. Linking Sentences to Entities
+    with open(main_char_outputs[1], 'r') as file:
+        chapters_coref = json.load(file)
+
+    with open(consolidate_outputs[1], 'r') as file:
+        consolidated_indices = json.load(file)
+
+    linking_inputs = {}
+    for chapter in chapters:
+        coref_lookup = get_coref_lookup(chapter, chapters_coref, consolidated_indices, filter_func, filter_args)
+        linking_inputs[chapter] = hash_json([
+            [manifest.hash_file(get_chapter_file(chapter, f"{chapter}{suffix}")) for suffix in ('.tokens', '.entities', '.quotes')],
+            ner_coref_inputs[chapter],
+            sorted(coref_lookup.items()),
+            sentences_format
+        ])
+
+    stale_chapters = [chapter for chapter in chapters if not manifest.is_fresh("get_relevant_sentences", chapter, linking_inputs[chapter])]
+
+    if stale_chapters:
+        get_relevant_sentences_in_book(
+            ner_coref_data_dir,
+            chapters_text_dir,
+            characters_data_dir,
+            filter_func,
+            filter_args,
+            workers=workers,
+            chapters=stale_chapters,
+            output_format=sentences_format,
+            use_sidecar=use_sidecar,
+            metrics=metrics
+        )
+
+        for chapter in stale_chapters:
+            manifest.record(
+                "get_relevant_sentences", chapter, linking_inputs[chapter],
+                [get_chapter_file(chapter, RELEVANT_SENTENCES_FILES[sentences_format])]
+            )
+        manifest.save()
+    print(f"get_relevant_sentences: {len(stale_chapters)}/{len(chapters)} chapters processed")
+
+    # 6. Sentiment Analysis
+    scorer_hash = hash_json(sentiment_scorer.get_config())
+    scoring_inputs = {chapter: hash_json([scorer_hash, linking_inputs[chapter]]) for chapter in chapters}
+    rescore_chapters = [
+        chapter for chapter in chapters if not manifest.is_fresh("analyse_sentiments_chapter", chapter, scoring_inputs[chapter])
+    ]
+
+    if relations_format == 'store':
+        # chapters.jsonl holds the checksum of every chapter file
+        store_dir = os.path.join(characters_data_dir, RELATIONS_STORE_DIR)
+        relations_files = [os.path.join(store_dir, RELATIONS_STORE_HEADER), os.path.join(store_dir, RELATIONS_STORE_INDEX)]
+    else:
+        relations_files = [os.path.join(characters_data_dir, RELATIONS_FILE)]
+
+    inputs_hash = hash_json([
+        manifest.hash_file(aliases_file),
+        [[chapter, scoring_inputs[chapter]] for chapter in chapters],
+        sparse,
+        relations_format,
+        [window, decay, within_paragraph]
+    ])
+
+    if not rescore_chapters and manifest.is_fresh("analyse_sentiments", book, inputs_hash):
+        print("Skipped analyse_sentiments")
+    else:
+        analyse_sentiments(
+            ner_coref_data_dir, characters_data_dir, sentiment_scorer, rescore_chapters=rescore_chapters, sparse=sparse,
+            relations_format=relations_format, window=window, decay=decay, within_paragraph=within_paragraph, metrics=metrics
+        )
+
+        for chapter in chapters:
+            relevant_sentences_file = get_chapter_file(chapter, RELEVANT_SENTENCES_FILES[sentences_format])
+
+            if sentences_format == 'csv':
+                # analyse_sentiments adds the Sentiment column to relevant_sentences.csv in place
+                manifest.record("get_relevant_sentences", chapter, linking_inputs[chapter], [relevant_sentences_file])
+                manifest.record("analyse_sentiments_chapter", chapter, scoring_inputs[chapter], [relevant_sentences_file])
+            else:
+                manifest.record(
+                    "analyse_sentiments_chapter", chapter, scoring_inputs[chapter],
+                    [relevant_sentences_file, get_chapter_file(chapter, SENTIMENT_FILE)]
+                )
+
+        manifest.record("analyse_sentiments", book, inputs_hash, relations_files)
+        manifest.save()
+    print(f"analyse_sentiments: {len(rescore_chapters)}/{len(chapters)} chapters rescored")
+
+    # 7. Collating Relations
+    inputs_hash = hash_json([
+        [manifest.hash_file(file_path) for file_path in relations_files], manifest.hash_file(aliases_file), deduct_opposing_avg, deduct_book_avg, interactions_format
+    ])
+    interactions_file = os.path.join(characters_data_dir, 'interactions.json' if interactions_format == 'dense' else 'interactions_edges.json')
+
+    if manifest.is_fresh("collate_relations", book, inputs_hash):
+        print("Skipped collate_relations")
+    else:
+        collate_relations(characters_data_dir, deduct_opposing_avg, deduct_book_avg, interactions_format, metrics)
+        manifest.record("collate_relations", book, inputs_hash, [interactions_file])
+        manifest.save()
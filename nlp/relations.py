@@ -0,0 +1,682 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import warnings
+
+import numpy as np
+
+
+RELATIONS_FILE = 'character-relations.pkl'
+RELATIONS_STORE_DIR = 'character-relations'
+# Stores are written here, and only replace the store in RELATIONS_STORE_DIR once complete
+RELATIONS_STORE_PARTIAL_DIR = 'character-relations.partial'
+RELATIONS_STORE_HEADER = 'header.json'
+RELATIONS_STORE_INDEX = 'chapters.jsonl'
+RELATIONS_FORMATS = ('pickle', 'store')
+
+RELATIONS_DTYPE = np.dtype([('char1', '<i4'), ('char2', '<i4'), ('sentiment', '<f8'), ('count', '<f8')])
+
+
+def get_sentence_characters(*columns: tuple[np.ndarray, np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+    """Concatenates ragged `(values, offsets)` character columns (e.g. characters and speaker) into `sentence_idx` and
+    `chars` arrays, holding one entry per appearance of a character in a sentence"""
+
+    sentence_idx = [np.repeat(np.arange(len(offsets) - 1), np.diff(offsets)) for _, offsets in columns]
+    chars = [values for values, _ in columns]
+
+    return np.concatenate(sentence_idx).astype(np.int64), np.concatenate(chars).astype(np.int64)
+
+
+def _pair_sentences(
+    sentence_idx: np.ndarray,
+    bounds: np.ndarray,
+    distance: int,
+    paragraph_ids: np.ndarray | None
+) -> tuple[np.ndarray, np.ndarray]:
+    """Pairs every entry of the incidence with every entry of the sentence `distance` sentences after its own (of the
+    same paragraph if `paragraph_ids` is given), returning the `left` and `right` entry indices"""
+
+    num_sentences = len(bounds) - 1
+
+    # Number of entries in the partner sentence of every entry
+    partner_sentence_idx = sentence_idx + distance
+    is_valid = partner_sentence_idx < num_sentences
+    if paragraph_ids is not None:
+        is_valid[is_valid] &= paragraph_ids[partner_sentence_idx[is_valid]] == paragraph_ids[sentence_idx[is_valid]]
+
+    partner_starts = np.where(is_valid, bounds[np.minimum(partner_sentence_idx, num_sentences - 1)], 0)
+    repeats = np.where(is_valid, bounds[np.minimum(partner_sentence_idx, num_sentences - 1) + 1] - partner_starts, 0)
+
+    left = np.repeat(np.arange(len(sentence_idx)), repeats)
+    right = np.repeat(partner_starts, repeats) + np.arange(len(left)) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+
+    return left, right
+
+
+def get_chapter_relations(
+    sentence_idx: np.ndarray,
+    chars: np.ndarray,
+    sentiments: np.ndarray,
+    num_chars: int,
+    window: int | None = 1,
+    decay: float = 1.0,
+    paragraph_ids: np.ndarray | None = None
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Sums the sentiment and counts the interactions of every ordered pair of distinct characters sharing a sentence,
+    `chars[i]` appearing in sentence `sentence_idx[i]` (see `get_sentence_characters`).
+
+    With a `window` of more than 1 sentence, characters also interact with the characters of the next `window - 1`
+    sentences. A pair of appearances `d` sentences apart counts as `decay**d` interactions and adds `decay**d` times the
+    mean sentiment of its two sentences. With `paragraph_ids` (the paragraph of every sentence), only characters of the
+    same paragraph interact, and a `window` of None pairs them anywhere within the paragraph.
+
+    The characters of the chapter are kept as a sparse sentence × character incidence matrix in CSR form, and every
+    distance up to the window is one vectorized pass pairing the entries of each sentence with those of the sentence
+    that far after it. Returns the arrays `char1`, `char2`, `sentiment` and `count`, holding one entry per pair that
+    interacted."""
+
+    if window is None and paragraph_ids is None:
+        raise ValueError('A window is required unless interactions are limited to paragraphs!')
+
+    if window is not None and window < 1:
+        raise ValueError(f"Invalid window of {window} sentences!")
+
+    # Characters appearing more than once in a sentence (e.g. as both speaker and mention) only count once
+    keys = np.unique(sentence_idx * num_chars + chars)
+    sentence_idx, chars = np.divmod(keys, num_chars)
+
+    if not len(keys):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+
+    num_sentences = len(sentiments)
+    bounds = np.searchsorted(sentence_idx, np.arange(num_sentences + 1), side='left')
+
+    max_distance = num_sentences - 1 if window is None else min(window, num_sentences) - 1
+    if paragraph_ids is not None:
+        paragraph_starts = np.flatnonzero(np.r_[True, paragraph_ids[1:] != paragraph_ids[:-1]])
+        max_distance = min(max_distance, int(np.diff(np.r_[paragraph_starts, num_sentences]).max()) - 1)
+
+    all_pair_keys, all_sentiments, all_counts = [], [], []
+    for distance in range(max_distance + 1):
+        weight = decay**distance
+        if weight == 0:
+            break
+
+        left, right = _pair_sentences(sentence_idx, bounds, distance, paragraph_ids)
+
+        is_pair = chars[left] != chars[right]
+        left, right = left[is_pair], right[is_pair]
+
+        if distance == 0:
+            pair_keys = chars[left] * num_chars + chars[right]
+            pair_sentiments = sentiments[sentence_idx[left]]
+        else:
+            # Pairs across sentences count in both directions
+            pair_keys = np.concatenate((chars[left] * num_chars + chars[right], chars[right] * num_chars + chars[left]))
+            pair_sentiments = np.tile(weight * (sentiments[sentence_idx[left]] + sentiments[sentence_idx[right]]) / 2, 2)
+
+        pair_keys, pair_idx = np.unique(pair_keys, return_inverse=True)
+        all_pair_keys.append(pair_keys)
+        all_sentiments.append(np.bincount(pair_idx, weights=pair_sentiments, minlength=len(pair_keys)))
+        all_counts.append(np.bincount(pair_idx, minlength=len(pair_keys)) * weight)
+
+    pair_keys, pair_idx = np.unique(np.concatenate(all_pair_keys), return_inverse=True)
+    char1, char2 = np.divmod(pair_keys, num_chars)
+
+    sentiment = np.bincount(pair_idx, weights=np.concatenate(all_sentiments), minlength=len(pair_keys))
+    count = np.bincount(pair_idx, weights=np.concatenate(all_counts), minlength=len(pair_keys))
+
+    return char1, char2, sentiment, count
+
+
+class SparseRelations():
+    """Class storing relations between characters as coordinate lists, holding only the pairs that interacted.
+
+    It stands in for the dense `(num_chars, num_chars, 2, num_chapters)` array, where `[c1, c2, 0, chapter]` is the summed
+    sentiment and `[c1, c2, 1, chapter]` the interaction count between characters `c1` and `c2` in a chapter."""
+
+    def __init__(self, num_chars: int, num_chapters: int) -> None:
+        self.shape = (num_chars, num_chars, 2, num_chapters)
+
+        self.char1 = np.zeros(0, dtype=np.int32)
+        self.char2 = np.zeros(0, dtype=np.int32)
+        self.chapter = np.zeros(0, dtype=np.int32)
+        self.sentiment = np.zeros(0, dtype=np.float64)
+        self.count = np.zeros(0, dtype=np.float64)
+
+        self._pending = []
+
+    def add_chapter(self, chapter_num: int, char1: np.ndarray, char2: np.ndarray, sentiment: np.ndarray, count: np.ndarray) -> None:
+        """Method to add the relations of one chapter, as returned by `get_chapter_relations`"""
+
+        self._pending.append((np.full(len(char1), chapter_num), char1, char2, sentiment, count))
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return None
+
+        chapter, char1, char2, sentiment, count = (np.concatenate(arrays) for arrays in zip(*self._pending))
+        self._pending = []
+
+        char1 = np.concatenate((self.char1, char1))
+        char2 = np.concatenate((self.char2, char2))
+        chapter = np.concatenate((self.chapter, chapter))
+
+        num_chars, _, _, num_chapters = self.shape
+        keys, idx = np.unique((char1.astype(np.int64) * num_chars + char2) * num_chapters + chapter, return_inverse=True)
+
+        self.sentiment = np.bincount(idx, weights=np.concatenate((self.sentiment, sentiment)), minlength=len(keys))
+        self.count = np.bincount(idx, weights=np.concatenate((self.count, count)), minlength=len(keys))
+
+        pair_keys, chapter = np.divmod(keys, num_chapters)
+        char1, char2 = np.divmod(pair_keys, num_chars)
+        self.char1, self.char2, self.chapter = char1.astype(np.int32), char2.astype(np.int32), chapter.astype(np.int32)
+
+    def __getstate__(self) -> dict[str, any]:
+        self._flush()
+        return self.__dict__
+
+    @classmethod
+    def from_dense(cls, relations_arr: np.ndarray) -> 'SparseRelations':
+        num_chars, _, _, num_chapters = relations_arr.shape
+        relations = cls(num_chars, num_chapters)
+
+        # np.nonzero returns the coordinates in the same (char1, char2, chapter) order the coordinate lists are kept in
+        char1, char2, chapter = np.nonzero(relations_arr[:, :, 1, :])
+
+        relations.char1, relations.char2, relations.chapter = char1.astype(np.int32), char2.astype(np.int32), chapter.astype(np.int32)
+        relations.sentiment = relations_arr[char1, char2, 0, chapter]
+        relations.count = relations_arr[char1, char2, 1, chapter]
+
+        return relations
+
+    def to_dense(self) -> np.ndarray:
+        self._flush()
+
+        relations_arr = np.zeros(self.shape)
+        relations_arr[self.char1, self.char2, 0, self.chapter] = self.sentiment
+        relations_arr[self.char1, self.char2, 1, self.chapter] = self.count
+
+        return relations_arr
+
+    def sum_chapters(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Method to get the summed sentiment and interaction count of every pair across all chapters as `char1`, `char2`,
+        `sentiment` and `count` arrays"""
+
+        self._flush()
+
+        num_chars = self.shape[0]
+        pair_keys, idx = np.unique(self.char1.astype(np.int64) * num_chars + self.char2, return_inverse=True)
+        char1, char2 = np.divmod(pair_keys, num_chars)
+
+        return (
+            char1,
+            char2,
+            np.bincount(idx, weights=self.sentiment, minlength=len(pair_keys)),
+            np.bincount(idx, weights=self.count, minlength=len(pair_keys))
+        )
+
+
+class RelationsStore():
+    """Class storing relations on disk chapter by chapter, in place of the relations array of character-relations.pkl.
+
+    A store is a directory holding header.json (the number of characters and chapters), one chapter-<chapter_num>.npy
+    per chapter holding an array of `RELATIONS_DTYPE` entries sorted by char1 then char2, and chapters.jsonl, to which a
+    line is appended once the file of a chapter is written. The line records the number of entries, the book-wide
+    sentiment and sentence count of the chapter (as in "chapter" of character-relations.pkl) and a checksum, and the last
+    line of a chapter wins. Chapter files are memory-mapped when read, so a query only loads the chapters and rows it
+    needs, and a run that stops partway leaves the chapters written so far readable.
+
+    Chapter ranges are half-open, as in `RelationsIndex`."""
+
+    def __init__(self, store_dir: str) -> None:
+        header_path = os.path.join(store_dir, RELATIONS_STORE_HEADER)
+
+        if not os.path.exists(header_path):
+            raise FileNotFoundError(f"Missing {RELATIONS_STORE_HEADER} in {store_dir}!")
+
+        with open(header_path, 'r') as file:
+            header = json.load(file)
+
+        self.store_dir = store_dir
+        self.shape = (header["num_chars"], header["num_chars"], 2, header["num_chapters"])
+        self.is_complete = header["complete"]
+
+        # chapter_num : line of chapters.jsonl
+        self.chapters = {}
+        with open(os.path.join(store_dir, RELATIONS_STORE_INDEX), 'r') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Cut short by an interrupted run
+                    continue
+
+                self.chapters[record["chapter"]] = record
+
+    @classmethod
+    def create(cls, store_dir: str, num_chars: int, num_chapters: int) -> 'RelationsStore':
+        """Method to start an empty store in `store_dir`, replacing any store already there"""
+
+        if os.path.exists(store_dir):
+            shutil.rmtree(store_dir)
+
+        os.makedirs(store_dir)
+
+        cls._write_header(store_dir, num_chars, num_chapters, False)
+        open(os.path.join(store_dir, RELATIONS_STORE_INDEX), 'w').close()
+
+        return cls(store_dir)
+
+    @staticmethod
+    def _write_header(store_dir: str, num_chars: int, num_chapters: int, is_complete: bool) -> None:
+        header_path = os.path.join(store_dir, RELATIONS_STORE_HEADER)
+
+        with open(header_path + '.tmp', 'w') as file:
+            json.dump({
+                "format": 1,
+                "num_chars": num_chars,
+                "num_chapters": num_chapters,
+                "dtype": RELATIONS_DTYPE.descr,
+                "complete": is_complete
+            }, file, indent=4)
+
+        os.replace(header_path + '.tmp', header_path)
+
+    def add_chapter(
+        self,
+        chapter_num: int,
+        char1: np.ndarray,
+        char2: np.ndarray,
+        sentiment: np.ndarray,
+        count: np.ndarray,
+        chapter_values: np.ndarray
+    ) -> None:
+        """Method to write the relations of one chapter, as returned by `get_chapter_relations`, and its book-wide
+        sentiment and sentence count, replacing any written before"""
+
+        num_chars = self.shape[0]
+        pair_keys, idx = np.unique(np.asarray(char1, dtype=np.int64) * num_chars + char2, return_inverse=True)
+
+        entries = np.zeros(len(pair_keys), dtype=RELATIONS_DTYPE)
+        entries['char1'], entries['char2'] = np.divmod(pair_keys, num_chars)
+        entries['sentiment'] = np.bincount(idx, weights=sentiment, minlength=len(pair_keys))
+        entries['count'] = np.bincount(idx, weights=count, minlength=len(pair_keys))
+
+        file_name = f"chapter-{chapter_num:05d}.npy"
+        file_path = os.path.join(self.store_dir, file_name)
+
+        # The file is complete before chapters.jsonl points to it
+        with open(file_path + '.tmp', 'wb') as file:
+            np.save(file, entries)
+        os.replace(file_path + '.tmp', file_path)
+
+        record = {
+            "chapter": chapter_num,
+            "file": file_name,
+            "num_entries": len(entries),
+            "sentiment": float(chapter_values[0]),
+            "sentences": float(chapter_values[1]),
+            "sha256": hashlib.sha256(entries.tobytes()).hexdigest()
+        }
+
+        with open(os.path.join(self.store_dir, RELATIONS_STORE_INDEX), 'a') as file:
+            file.write(json.dumps(record) + '\n')
+
+        self.chapters[chapter_num] = record
+
+    def finish(self, store_dir: str | None = None) -> None:
+        """Method to mark the store as complete once every chapter is written, then move it to `store_dir` if given,
+        replacing any store there"""
+
+        num_chars, _, _, num_chapters = self.shape
+        self._write_header(self.store_dir, num_chars, num_chapters, True)
+        self.is_complete = True
+
+        if store_dir is None or os.path.abspath(store_dir) == os.path.abspath(self.store_dir):
+            return None
+
+        if os.path.exists(store_dir):
+            shutil.rmtree(store_dir)
+
+        os.replace(self.store_dir, store_dir)
+        self.store_dir = store_dir
+
+    def get_written_chapters(self) -> list[int]:
+        """Method to get the numbers of the chapters written so far, every chapter once the store is complete"""
+
+        return self._get_chapter_nums(0, None)
+
+    def _get_chapter_nums(self, start_chapter: int, end_chapter: int | None) -> list[int]:
+        end_chapter = self.shape[3] if end_chapter is None else end_chapter
+
+        return sorted(chapter_num for chapter_num in self.chapters if start_chapter <= chapter_num < end_chapter)
+
+    def get_chapter(self, chapter_num: int) -> np.ndarray:
+        """Method to get the memory-mapped entries of a chapter, empty if the chapter is not written"""
+
+        record = self.chapters.get(chapter_num)
+
+        # Empty arrays cannot be memory-mapped
+        if record is None or not record["num_entries"]:
+            return np.zeros(0, dtype=RELATIONS_DTYPE)
+
+        return np.load(os.path.join(self.store_dir, record["file"]), mmap_mode='r')
+
+    def get_chapter_values(self) -> np.ndarray:
+        """Method to get the book-wide sentiment and sentence count of every chapter as a `(2, num_chapters)` array, zero
+        for the chapters not written"""
+
+        chapter_values = np.zeros((2, self.shape[3]))
+        for chapter_num, record in self.chapters.items():
+            chapter_values[:, chapter_num] = record["sentiment"], record["sentences"]
+
+        return chapter_values
+
+    def get_chapters(self, start_chapter: int = 0, end_chapter: int | None = None) -> SparseRelations:
+        """Method to load the relations of a chapter range into a `SparseRelations`"""
+
+        relations = SparseRelations(self.shape[0], self.shape[3])
+
+        for chapter_num in self._get_chapter_nums(start_chapter, end_chapter):
+            entries = self.get_chapter(chapter_num)
+            relations.add_chapter(chapter_num, entries['char1'], entries['char2'], entries['sentiment'], entries['count'])
+
+        return relations
+
+    def get_character(
+        self,
+        char: int,
+        start_chapter: int = 0,
+        end_chapter: int | None = None
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Method to get the summed sentiment and interaction count of `char` towards every character it interacted with
+        within a chapter range, as `char2`, `sentiment` and `count` arrays. Only the rows of `char` are read from each
+        chapter."""
+
+        rows = []
+        for chapter_num in self._get_chapter_nums(start_chapter, end_chapter):
+            entries = self.get_chapter(chapter_num)
+            row_start, row_end = np.searchsorted(entries['char1'], [char, char + 1])
+            rows.append(np.array(entries[row_start:row_end]))
+
+        rows = np.concatenate(rows) if rows else np.zeros(0, dtype=RELATIONS_DTYPE)
+        char2, idx = np.unique(rows['char2'].astype(np.int64), return_inverse=True)
+
+        return (
+            char2,
+            np.bincount(idx, weights=rows['sentiment'], minlength=len(char2)),
+            np.bincount(idx, weights=rows['count'], minlength=len(char2))
+        )
+
+    def sum_chapters(
+        self,
+        start_chapter: int = 0,
+        end_chapter: int | None = None,
+        merge_entries: int = 2**20
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Method to get the summed sentiment and interaction count of every pair over a chapter range as `char1`, `char2`,
+        `sentiment` and `count` arrays, as `SparseRelations.sum_chapters` does.
+
+        Chapters are read in order and merged into the running sums whenever `merge_entries` entries are pending, so
+        memory grows with the number of pairs rather than with the number of chapters."""
+
+        num_chars = self.shape[0]
+
+        pair_keys = np.zeros(0, dtype=np.int64)
+        sentiment = np.zeros(0)
+        count = np.zeros(0)
+
+        pending = []
+        num_pending = 0
+        chapter_nums = self._get_chapter_nums(start_chapter, end_chapter)
+
+        for idx, chapter_num in enumerate(chapter_nums):
+            entries = self.get_chapter(chapter_num)
+            pending.append(entries)
+            num_pending += len(entries)
+
+            if num_pending < merge_entries and idx < len(chapter_nums) - 1:
+                continue
+
+            # Running sums come first, so every pair is still summed in chapter order
+            pending_keys = [chapter_entries['char1'].astype(np.int64) * num_chars + chapter_entries['char2'] for chapter_entries in pending]
+            pending_sentiment = [chapter_entries['sentiment'] for chapter_entries in pending]
+            pending_count = [chapter_entries['count'] for chapter_entries in pending]
+
+            pair_keys, pair_idx = np.unique(np.concatenate([pair_keys, *pending_keys]), return_inverse=True)
+            sentiment = np.bincount(pair_idx, weights=np.concatenate([sentiment, *pending_sentiment]), minlength=len(pair_keys))
+            count = np.bincount(pair_idx, weights=np.concatenate([count, *pending_count]), minlength=len(pair_keys))
+
+            pending = []
+            num_pending = 0
+
+        char1, char2 = np.divmod(pair_keys, num_chars)
+
+        return char1, char2, sentiment, count
+
+
+class RelationsIndex():
+    """Class answering chapter-range queries on relations through cumulative sums along the chapter axis.
+
+    Cumulative sums are kept per pair only at the chapters where the pair interacted, so a pair query takes two binary
+    searches however many chapters it spans, and per-character queries are a lookup. Whole-graph queries sum the entries
+    within the range in one vectorized pass. Chapter ranges are half-open:
+    `start_chapter` is included and `end_chapter` is not (None for up to the last chapter). Sentiments are sums, divide
+    them by the counts for averages."""
+
+    def __init__(self, relations: np.ndarray | SparseRelations | RelationsStore, chapter_values: np.ndarray | None = None) -> None:
+        if isinstance(relations, RelationsStore):
+            relations = relations.get_chapters()
+        elif not isinstance(relations, SparseRelations):
+            relations = SparseRelations.from_dense(relations)
+
+        # Coordinate lists are kept sorted by char1, char2 then chapter
+        relations._flush()
+
+        num_chars, _, _, num_chapters = relations.shape
+        self.num_chars = num_chars
+        self.num_chapters = num_chapters
+
+        entry_pairs = relations.char1.astype(np.int64) * num_chars + relations.char2
+        self.pair_keys, pair_starts = np.unique(entry_pairs, return_index=True)
+
+        # A chapter stride of num_chapters + 1 leaves room for queries up to `num_chapters` without reaching the next pair
+        self._entry_pairs = entry_pairs
+        self._entry_chapters = relations.chapter
+        self._entry_sentiment = relations.sentiment
+        self._entry_count = relations.count
+        self._entry_keys = entry_pairs * (num_chapters + 1) + relations.chapter
+        self._cum_sentiment = self._get_segment_cumsum(relations.sentiment, pair_starts)
+        self._cum_count = self._get_segment_cumsum(relations.count, pair_starts)
+
+        # Per-character cumulative sums are dense, (num_chars, num_chapters + 1)
+        self._char_cum_sentiment = np.zeros((num_chars, num_chapters + 1))
+        self._char_cum_count = np.zeros((num_chars, num_chapters + 1))
+        char_chapters = relations.char1.astype(np.int64) * num_chapters + relations.chapter
+        for cum_arr, weights in ((self._char_cum_sentiment, relations.sentiment), (self._char_cum_count, relations.count)):
+            per_chapter = np.bincount(char_chapters, weights=weights, minlength=num_chars * num_chapters)
+            np.cumsum(per_chapter.reshape(num_chars, num_chapters), axis=1, out=cum_arr[:, 1:])
+
+        # Book-wide sentiment and sentence counts per chapter, as stored in "chapter" of character-relations.pkl
+        self._chapter_cum_values = None
+        if chapter_values is not None:
+            self._chapter_cum_values = np.zeros((2, num_chapters + 1))
+            np.cumsum(chapter_values, axis=1, out=self._chapter_cum_values[:, 1:])
+
+    @staticmethod
+    def _get_segment_cumsum(values: np.ndarray, segment_starts: np.ndarray) -> np.ndarray:
+        cumsum = np.cumsum(values)
+        segment_bases = np.repeat(cumsum[segment_starts] - values[segment_starts], np.diff(np.r_[segment_starts, len(values)]))
+        return cumsum - segment_bases
+
+    @classmethod
+    def load(cls, characters_data_dir: str) -> 'RelationsIndex':
+        """Method to build the index from the relations written by `analyse_sentiments` in `characters_data_dir` (see
+        `load_relations`)"""
+
+        info = load_relations(characters_data_dir)
+
+        return cls(info['relations'], info['chapter'])
+
+    @classmethod
+    def from_pickle(cls, characters_data_dir: str) -> 'RelationsIndex':
+        """Method to build the index from character-relations.pkl in `characters_data_dir`"""
+
+        pkl_fp = os.path.join(characters_data_dir, RELATIONS_FILE)
+
+        if not os.path.exists(pkl_fp):
+            raise FileNotFoundError('Missing character-relations.pkl in given directory!')
+
+        with open(pkl_fp, 'rb') as file:
+            info = pickle.load(file)
+
+        return cls(info['relations'], info['chapter'])
+
+    def _get_range(self, start_chapter: int | np.ndarray, end_chapter: int | np.ndarray | None) -> tuple[np.ndarray, np.ndarray]:
+        start_chapter = np.clip(start_chapter, 0, self.num_chapters)
+        end_chapter = np.clip(self.num_chapters if end_chapter is None else end_chapter, start_chapter, self.num_chapters)
+
+        return start_chapter, end_chapter
+
+    def _get_cum_before(self, pair_keys: np.ndarray, chapters: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Sums over the chapters before `chapters` for every pair in `pair_keys`"""
+
+        pos = np.searchsorted(self._entry_keys, pair_keys * (self.num_chapters + 1) + chapters, side='left') - 1
+
+        if not len(self._entry_keys):
+            return np.zeros(pos.shape), np.zeros(pos.shape)
+
+        clipped = np.maximum(pos, 0)
+        is_found = (pos >= 0) & (self._entry_pairs[clipped] == pair_keys)
+
+        return np.where(is_found, self._cum_sentiment[clipped], 0.0), np.where(is_found, self._cum_count[clipped], 0.0)
+
+    def get_pairs(
+        self,
+        char1: np.ndarray,
+        char2: np.ndarray,
+        start_chapter: int | np.ndarray = 0,
+        end_chapter: int | np.ndarray | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Method to get the summed sentiment and interaction count of `char1[i]` towards `char2[i]` for many pairs at
+        once. The chapter range can be given per pair."""
+
+        pair_keys = np.asarray(char1, dtype=np.int64) * self.num_chars + np.asarray(char2, dtype=np.int64)
+        start_chapter, end_chapter = self._get_range(start_chapter, end_chapter)
+
+        end_sentiment, end_count = self._get_cum_before(pair_keys, end_chapter)
+        start_sentiment, start_count = self._get_cum_before(pair_keys, start_chapter)
+
+        return end_sentiment - start_sentiment, end_count - start_count
+
+    def get_pair(self, char1: int, char2: int, start_chapter: int = 0, end_chapter: int | None = None) -> tuple[float, float]:
+        sentiment, count = self.get_pairs(np.array([char1]), np.array([char2]), start_chapter, end_chapter)
+        return float(sentiment[0]), float(count[0])
+
+    def get_characters(self, start_chapter: int = 0, end_chapter: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """Method to get the summed sentiment and interaction count of every character towards everyone else"""
+
+        start_chapter, end_chapter = self._get_range(start_chapter, end_chapter)
+
+        return (
+            self._char_cum_sentiment[:, end_chapter] - self._char_cum_sentiment[:, start_chapter],
+            self._char_cum_count[:, end_chapter] - self._char_cum_count[:, start_chapter]
+        )
+
+    def get_character(self, char: int, start_chapter: int = 0, end_chapter: int | None = None) -> tuple[float, float]:
+        start_chapter, end_chapter = self._get_range(start_chapter, end_chapter)
+
+        return (
+            float(self._char_cum_sentiment[char, end_chapter] - self._char_cum_sentiment[char, start_chapter]),
+            float(self._char_cum_count[char, end_chapter] - self._char_cum_count[char, start_chapter])
+        )
+
+    def get_book_values(self, start_chapter: int = 0, end_chapter: int | None = None) -> tuple[float, float]:
+        """Method to get the summed sentiment and sentence count of the whole book over a chapter range"""
+
+        if self._chapter_cum_values is None:
+            raise ValueError("RelationsIndex was built without chapter values!")
+
+        start_chapter, end_chapter = self._get_range(start_chapter, end_chapter)
+        values = self._chapter_cum_values[:, end_chapter] - self._chapter_cum_values[:, start_chapter]
+
+        return float(values[0]), float(values[1])
+
+    def get_graph(self, start_chapter: int = 0, end_chapter: int | None = None) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Method to get the `char1`, `char2`, summed `sentiment` and `count` arrays of every pair that interacted within a
+        chapter range"""
+
+        start_chapter, end_chapter = self._get_range(start_chapter, end_chapter)
+
+        # Every pair is needed, so the entries in range are summed directly rather than searched pair by pair
+        is_in_range = (self._entry_chapters >= start_chapter) & (self._entry_chapters < end_chapter)
+        entry_pairs = self._entry_pairs[is_in_range]
+
+        if not len(entry_pairs):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+
+        run_starts = np.flatnonzero(np.r_[True, entry_pairs[1:] != entry_pairs[:-1]])
+        char1, char2 = np.divmod(entry_pairs[run_starts], self.num_chars)
+
+        return (
+            char1,
+            char2,
+            np.add.reduceat(self._entry_sentiment[is_in_range], run_starts),
+            np.add.reduceat(self._entry_count[is_in_range], run_starts)
+        )
+
+    def get_graphs(self, chapter_ranges: list[tuple[int, int | None]]) -> list[tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+        """Method to get the graph of every chapter range, e.g. of every arc"""
+
+        return [self.get_graph(start_chapter, end_chapter) for start_chapter, end_chapter in chapter_ranges]
+
+
+def load_relations(characters_data_dir: str) -> dict[str, any]:
+    """Loads the relations written by `analyse_sentiments` in `characters_data_dir` as a dict with the `relations`, the
+    book-wide sentiment and sentence count of every `chapter` and their `total`, as in character-relations.pkl, and
+    whether the relations are `complete` with the `written_chapters`. Relations written to a store are a
+    `RelationsStore`, whose chapters are only read when queried.
+
+    Complete relations are loaded first, from the store or character-relations.pkl. Otherwise the store of a run that
+    stopped partway is loaded with a warning, holding only the chapters in `written_chapters`."""
+
+    store_dir = os.path.join(characters_data_dir, RELATIONS_STORE_DIR)
+    partial_store_dir = os.path.join(characters_data_dir, RELATIONS_STORE_PARTIAL_DIR)
+    pkl_fp = os.path.join(characters_data_dir, RELATIONS_FILE)
+
+    if os.path.exists(os.path.join(store_dir, RELATIONS_STORE_HEADER)):
+        relations = RelationsStore(store_dir)
+    elif os.path.exists(pkl_fp):
+        with open(pkl_fp, 'rb') as file:
+            info = pickle.load(file)
+
+        num_chapters = info['chapter'].shape[1]
+        return {**info, "complete": True, "written_chapters": list(range(num_chapters))}
+    elif os.path.exists(os.path.join(partial_store_dir, RELATIONS_STORE_HEADER)):
+        relations = RelationsStore(partial_store_dir)
+    else:
+        raise FileNotFoundError('Missing character-relations in given directory!')
+
+    written_chapters = relations.get_written_chapters()
+
+    if not relations.is_complete:
+        warnings.warn(
+            f"The relations in {relations.store_dir} are incomplete, only {len(written_chapters)} of {relations.shape[3]} "
+            "chapters were written!"
+        )
+
+    chapter_values = relations.get_chapter_values()
+
+    return {
+        "relations": relations,
+        "chapter": chapter_values,
+        "total": np.array([
+            chapter_values[0].sum(),
+            chapter_values[1].sum()
+        ]),
+        "complete": relations.is_complete,
+        "written_chapters": written_chapters
+    }
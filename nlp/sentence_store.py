@@ -0,0 +1,174 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+RELEVANT_SENTENCES_FILES = {
+    "csv": 'relevant_sentences.csv',
+    "npz": 'relevant_sentences.npz'
+}
+SENTIMENT_FILE = 'relevant_sentences_sentiment.npy'
+
+LIST_COLUMNS = ('speaker', 'characters', 'proper_nouns_pos')
+
+
+def parse_json_column(column: pd.Series) -> list:
+    """Parses a column of JSON-encoded lists with a single `json.loads` call"""
+
+    return json.loads('[' + ','.join(column.tolist()) + ']')
+
+
+def to_ragged(lists: list[list]) -> tuple[np.ndarray, np.ndarray]:
+    """Flattens a list of lists into a `values` array and an `offsets` array, row `i` being `values[offsets[i]:offsets[i+1]]`"""
+
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    np.cumsum([len(row) for row in lists], out=offsets[1:])
+
+    values = np.array([value for row in lists for value in row], dtype=np.int64)
+    if not len(values) and any(isinstance(value, list) for row in lists for value in row):
+        values = values.reshape(0, 2)
+
+    return values, offsets
+
+
+def from_ragged(values: np.ndarray, offsets: np.ndarray) -> list[list]:
+    """Inverse of `to_ragged`"""
+
+    values = values.tolist()
+    offsets = offsets.tolist()
+
+    return [values[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def get_relevant_sentences_file(chapter_dir: str) -> str | None:
+    """Returns the path of the relevant sentences of a chapter, preferring the columnar format if both exist"""
+
+    for file_name in (RELEVANT_SENTENCES_FILES["npz"], RELEVANT_SENTENCES_FILES["csv"]):
+        file_path = os.path.join(chapter_dir, file_name)
+        if os.path.exists(file_path):
+            return file_path
+
+    return None
+
+
+def write_relevant_sentences(chapter_dir: str, sentence_info: dict[str, list], output_format: str = 'csv') -> None:
+    """Writes the relevant sentences of a chapter as relevant_sentences.csv, or as relevant_sentences.npz with the list
+    columns stored as ragged arrays. Files of the other format and any stored sentiments are removed."""
+
+    if output_format not in RELEVANT_SENTENCES_FILES:
+        raise ValueError(f"Unknown relevant sentences format '{output_format}'!")
+
+    for file_name in (*RELEVANT_SENTENCES_FILES.values(), SENTIMENT_FILE):
+        if os.path.exists(os.path.join(chapter_dir, file_name)):
+            os.remove(os.path.join(chapter_dir, file_name))
+
+    file_path = os.path.join(chapter_dir, RELEVANT_SENTENCES_FILES[output_format])
+
+    if output_format == 'csv':
+        pd.DataFrame.from_dict(sentence_info).to_csv(file_path, index=False)
+        return None
+
+    # Sentences are stored as one string with character offsets
+    words_offsets = np.zeros(len(sentence_info["words"]) + 1, dtype=np.int64)
+    np.cumsum([len(words) for words in sentence_info["words"]], out=words_offsets[1:])
+
+    columns = {
+        "words": np.frombuffer(''.join(sentence_info["words"]).encode('utf-8'), dtype=np.uint8),
+        "words_offsets": words_offsets,
+        "start_token_id": np.asarray(sentence_info["start_token_id"], dtype=np.int64),
+        "end_token_id": np.asarray(sentence_info["end_token_id"], dtype=np.int64),
+        "paragraph_id": np.asarray(sentence_info["paragraph_id"], dtype=np.int64)
+    }
+    for column in LIST_COLUMNS:
+        columns[column], columns[f"{column}_offsets"] = to_ragged(sentence_info[column])
+
+    with open(file_path, 'wb') as file:
+        np.savez(file, **columns)
+
+
+def read_relevant_sentences(chapter_dir: str) -> dict[str, any]:
+    """Reads the relevant sentences of a chapter in either format.
+
+    `words` is a list of sentences, `start_token_id` and `end_token_id` are arrays, and the list columns are
+    `(values, offsets)` ragged arrays (see `to_ragged`). `paragraph_id` is an array, or None for files written before
+    paragraphs were recorded. `Sentiment` is an array, or None if the chapter is not scored."""
+
+    file_path = get_relevant_sentences_file(chapter_dir)
+    if file_path is None:
+        raise FileNotFoundError(f"Missing relevant sentences in {chapter_dir}!")
+
+    if file_path.endswith('.csv'):
+        df = pd.read_csv(file_path)
+
+        relevant_sentences = {
+            "words": df['words'].tolist(),
+            "start_token_id": df['start_token_id'].to_numpy(),
+            "end_token_id": df['end_token_id'].to_numpy(),
+            "paragraph_id": df['paragraph_id'].to_numpy() if 'paragraph_id' in df.columns else None,
+            "Sentiment": df['Sentiment'].to_numpy() if 'Sentiment' in df.columns else None
+        }
+        for column in LIST_COLUMNS:
+            relevant_sentences[column] = to_ragged(parse_json_column(df[column].fillna('[]')))
+
+        return relevant_sentences
+
+    with np.load(file_path) as data:
+        words = data["words"].tobytes().decode('utf-8')
+        words_offsets = data["words_offsets"].tolist()
+
+        relevant_sentences = {
+            "words": [words[start:end] for start, end in zip(words_offsets[:-1], words_offsets[1:])],
+            "start_token_id": data["start_token_id"],
+            "end_token_id": data["end_token_id"],
+            "paragraph_id": data["paragraph_id"] if "paragraph_id" in data.files else None
+        }
+        for column in LIST_COLUMNS:
+            relevant_sentences[column] = (data[column], data[f"{column}_offsets"])
+
+    sentiment_file_path = os.path.join(chapter_dir, SENTIMENT_FILE)
+    relevant_sentences["Sentiment"] = np.load(sentiment_file_path) if os.path.exists(sentiment_file_path) else None
+
+    return relevant_sentences
+
+
+def write_sentiments(chapter_dir: str, sentiments: np.ndarray) -> None:
+    """Stores the sentiment of every relevant sentence of a chapter. In the columnar format only the sentiment file is
+    written, the CSV format is rewritten with a Sentiment column."""
+
+    file_path = get_relevant_sentences_file(chapter_dir)
+    if file_path is None:
+        raise FileNotFoundError(f"Missing relevant sentences in {chapter_dir}!")
+
+    if file_path.endswith('.csv'):
+        df = pd.read_csv(file_path)
+        df['Sentiment'] = sentiments
+        df.to_csv(file_path, index=False)
+        return None
+
+    np.save(os.path.join(chapter_dir, SENTIMENT_FILE), np.asarray(sentiments, dtype=np.float64))
+
+
+def export_relevant_sentences_csv(chapter_dir: str, output_file: str | None = None) -> str:
+    """Exports the relevant sentences of a chapter (with their sentiments if scored) to a CSV file, by default
+    relevant_sentences.csv in `chapter_dir`, and returns its path"""
+
+    relevant_sentences = read_relevant_sentences(chapter_dir)
+
+    sentence_info = {
+        "words": relevant_sentences["words"],
+        "start_token_id": relevant_sentences["start_token_id"],
+        "end_token_id": relevant_sentences["end_token_id"]
+    }
+    if relevant_sentences["paragraph_id"] is not None:
+        sentence_info["paragraph_id"] = relevant_sentences["paragraph_id"]
+    for column in LIST_COLUMNS:
+        sentence_info[column] = [json.dumps(row) for row in from_ragged(*relevant_sentences[column])]
+    if relevant_sentences["Sentiment"] is not None:
+        sentence_info["Sentiment"] = relevant_sentences["Sentiment"]
+
+    output_file = output_file or os.path.join(chapter_dir, RELEVANT_SENTENCES_FILES["csv"])
+    pd.DataFrame.from_dict(sentence_info).to_csv(output_file, index=False)
+
+    return output_file
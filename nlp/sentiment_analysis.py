@@ -1,20 +1,46 @@
 import json
 import os
 import pickle
+import shutil
 
 import numpy as np
-import pandas as pd
 from tqdm import tqdm
 
+from .instrumentation import RunMetrics, record_chapter, record_stage
+from .relations import (
+    RELATIONS_FILE,
+    RELATIONS_FORMATS,
+    RELATIONS_STORE_DIR,
+    RELATIONS_STORE_PARTIAL_DIR,
+    RelationsStore,
+    SparseRelations,
+    get_chapter_relations,
+    get_sentence_characters,
+    load_relations
+)
+from .sentence_store import from_ragged, read_relevant_sentences, write_sentiments
 from .sentiment_scorer.base_scorer import BaseScorer
 
 
 def analyse_sentiments(
     ner_coref_data_dir: str,
     characters_data_dir: str,
-    sentiment_scorer: BaseScorer
+    sentiment_scorer: BaseScorer,
+    rescore_chapters: list[str] | None = None,
+    sparse: bool = False,
+    relations_format: str = 'pickle',
+    window: int | None = 1,
+    decay: float = 1.0,
+    within_paragraph: bool = False,
+    metrics: RunMetrics | None = None
 ) -> None:
-    """Conducts sentence-by-sentence sentiment analysis and creates a file character-relations.pkl that stores the sentiment scores and interaction counts between every pair of characters."""
+    """Conducts sentence-by-sentence sentiment analysis and stores the sentiment scores and interaction counts between every pair of characters.
+
+    By default they are kept in memory and written to character-relations.pkl at the end. With the 'store' `relations_format`, they are written chapter by chapter to a `RelationsStore` as each chapter is scored, which replaces the character-relations directory once every chapter is written (see `create_relations`).
+    If `rescore_chapters` is given, other chapters reuse the sentiments already stored with their relevant sentences.
+    With `sparse`, pickled relations are stored as a `SparseRelations` instead of a dense array, so memory grows with the number of pairs that actually interact rather than with the square of the number of characters.
+    By default characters interact when they share a sentence. With a `window` of more than 1 sentence, characters within `window` sentences of each other interact too, with interactions `d` sentences apart weighted by `decay**d`, and with `within_paragraph` only characters of the same paragraph interact, a `window` of None pairing them anywhere within it (see `get_chapter_relations`).
+    With `metrics`, the stage and every chapter are recorded, with the score cache counters of `sentiment_scorer` (see `RunMetrics`)."""
 
     main_characters_aliases_file_path = os.path.join(characters_data_dir, 'main_characters_aliases.json')
 
@@ -27,40 +53,131 @@ def analyse_sentiments(
     num_chars = len(main_char_list)
     num_chapters = len(os.listdir(ner_coref_data_dir))
 
-    relations_arr = np.zeros((num_chars, num_chars, 2, num_chapters))
+    relations_arr = create_relations(characters_data_dir, num_chars, num_chapters, relations_format, sparse)
 
     chapter_values_arr = np.zeros((2, num_chapters))
 
-    for chapter in tqdm(os.listdir(ner_coref_data_dir)):
-        chapter_num = int(chapter.split('-')[1]) - 1
-        relevant_sentences_file_path = os.path.join(ner_coref_data_dir, chapter, 'relevant_sentences.csv')
-        df = pd.read_csv(relevant_sentences_file_path)
+    with record_stage(metrics, "analyse_sentiments", sentiment_scorer.score_cache):
+        for chapter in tqdm(os.listdir(ner_coref_data_dir)):
+            chapter_num = int(chapter.split('-')[1]) - 1
+            rescore = rescore_chapters is None or chapter in rescore_chapters
+
+            with record_chapter(metrics, "analyse_sentiments", chapter, sentiment_scorer.score_cache) as record:
+                sentiments, relations = analyse_chapter_sentiments(
+                    os.path.join(ner_coref_data_dir, chapter), sentiment_scorer, num_chars, rescore, window, decay, within_paragraph
+                )
+                add_chapter_relations(relations_arr, chapter_values_arr, chapter_num, sentiments, relations)
+
+                record.add(sentences=len(sentiments), scored_sentences=len(sentiments) if rescore else 0, pairs=len(relations[0]))
+
+        write_relations(characters_data_dir, relations_arr, chapter_values_arr)
+
+    print("Completed Sentiment Analysis!")
+
+    if sentiment_scorer.score_cache is not None:
+        stats = sentiment_scorer.score_cache.get_stats()
+        print(f"Score cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.1%} hit rate), {stats['evictions']} evictions")
+
+
+def create_relations(
+    characters_data_dir: str,
+    num_chars: int,
+    num_chapters: int,
+    relations_format: str = 'pickle',
+    sparse: bool = False
+) -> np.ndarray | SparseRelations | RelationsStore:
+    """Creates the relations the chapters are added to by `add_chapter_relations`: a dense array (a `SparseRelations`
+    with `sparse`) for `write_relations` to pickle, or with the 'store' `relations_format`, an empty `RelationsStore` in
+    the character-relations.partial directory of `characters_data_dir`. Relations written by an earlier run are kept
+    until `write_relations` replaces them."""
+
+    if relations_format not in RELATIONS_FORMATS:
+        raise ValueError(f"Unknown relations format '{relations_format}'!")
+
+    if relations_format == 'store':
+        return RelationsStore.create(os.path.join(characters_data_dir, RELATIONS_STORE_PARTIAL_DIR), num_chars, num_chapters)
+
+    return SparseRelations(num_chars, num_chapters) if sparse else np.zeros((num_chars, num_chars, 2, num_chapters))
+
+
+def analyse_chapter_sentiments(
+    chapter_dir: str,
+    sentiment_scorer: BaseScorer,
+    num_chars: int,
+    rescore: bool = True,
+    window: int | None = 1,
+    decay: float = 1.0,
+    within_paragraph: bool = False
+) -> tuple[np.ndarray, tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    """Scores the relevant sentences of a chapter (unless `rescore` is False and they already have sentiments) and
+    returns the sentiments and the relations of the chapter within `window` sentences (see `get_chapter_relations`)"""
+
+    relevant_sentences = read_relevant_sentences(chapter_dir)
+    sentiments = relevant_sentences['Sentiment']
+
+    rescore = rescore or sentiments is None
+
+    if rescore:
+        propn_positions = from_ragged(*relevant_sentences['proper_nouns_pos'])
+        sentiments = np.array(sentiment_scorer.get_batch(relevant_sentences['words'], propn_positions), dtype=np.float64)
 
-        df['Sentiment'] = 0.0
+    sentence_idx, chars = get_sentence_characters(relevant_sentences['characters'], relevant_sentences['speaker'])
 
-        for idx, row in df.iterrows():
-            propn_pos = json.loads(row['proper_nouns_pos'])
-            sentiment = sentiment_scorer.get(row['words'], propn_pos)
+    paragraph_ids = None
+    if within_paragraph:
+        paragraph_ids = relevant_sentences['paragraph_id']
+        if paragraph_ids is None:
+            raise ValueError(f"Missing paragraph ids in the relevant sentences of {chapter_dir}, rerun get_relevant_sentences!")
 
-            df.loc[idx, 'Sentiment'] = sentiment
+    relations = get_chapter_relations(sentence_idx, chars, sentiments, num_chars, window, decay, paragraph_ids)
 
-        chapter_values_arr[0][chapter_num] = df['Sentiment'].sum()
-        chapter_values_arr[1][chapter_num] = idx
+    if rescore:
+        write_sentiments(chapter_dir, sentiments)
 
-        for idx, row in df.iterrows():
-            char_list = set(json.loads(row['characters']) + (json.loads(row['speaker']) if type(row['speaker']) is str else []))
-            if len(char_list) < 2:
-                continue
-        
-            for char1 in char_list:
-                for char2 in char_list:
-                    if char1 == char2:
-                        continue
+    return sentiments, relations
 
-                    relations_arr[char1][char2][0][chapter_num] += df.loc[idx, 'Sentiment']
-                    relations_arr[char1][char2][1][chapter_num] += 1
 
-        df.to_csv(relevant_sentences_file_path, index=False)
+def add_chapter_relations(
+    relations_arr: np.ndarray | SparseRelations | RelationsStore,
+    chapter_values_arr: np.ndarray,
+    chapter_num: int,
+    sentiments: np.ndarray,
+    relations: tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+) -> None:
+    """Adds the output of `analyse_chapter_sentiments` for a chapter to the relations and chapter values"""
+
+    char1, char2, sentiment, count = relations
+
+    chapter_values_arr[0][chapter_num] = sentiments.sum()
+    chapter_values_arr[1][chapter_num] = len(sentiments) - 1
+
+    if isinstance(relations_arr, RelationsStore):
+        relations_arr.add_chapter(chapter_num, char1, char2, sentiment, count, chapter_values_arr[:, chapter_num])
+    elif isinstance(relations_arr, SparseRelations):
+        relations_arr.add_chapter(chapter_num, char1, char2, sentiment, count)
+    else:
+        relations_arr[char1, char2, 0, chapter_num] += sentiment
+        relations_arr[char1, char2, 1, chapter_num] += count
+
+
+def write_relations(
+    characters_data_dir: str,
+    relations_arr: np.ndarray | SparseRelations | RelationsStore,
+    chapter_values_arr: np.ndarray
+) -> None:
+    """Writes character-relations.pkl, or marks a `RelationsStore` complete, as its chapters are already written, and
+    moves it to the character-relations directory. Relations of the other format are then removed."""
+
+    store_dir = os.path.join(characters_data_dir, RELATIONS_STORE_DIR)
+    character_relations_file_path = os.path.join(characters_data_dir, RELATIONS_FILE)
+
+    if isinstance(relations_arr, RelationsStore):
+        relations_arr.finish(store_dir)
+
+        if os.path.exists(character_relations_file_path):
+            os.remove(character_relations_file_path)
+
+        return None
 
     info = {
         "relations" : relations_arr,
@@ -71,56 +188,159 @@ def analyse_sentiments(
         ])
     }
 
-    character_relations_file_path = os.path.join(characters_data_dir, 'character-relations.pkl')
-    with open(character_relations_file_path, 'wb') as file:
+    # The previous file is only replaced once the new one is complete
+    with open(character_relations_file_path + '.tmp', 'wb') as file:
         pickle.dump(info, file)
+    os.replace(character_relations_file_path + '.tmp', character_relations_file_path)
 
-    print("Completed Sentiment Analysis!")
+    if os.path.exists(store_dir):
+        shutil.rmtree(store_dir)
 
 
-def collate_relations(
-    characters_data_dir: str,
+def get_interactions(
+    info: dict[str, any],
     deduct_opposing_avg: bool = False,
     deduct_book_avg: bool = False
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Sums the relations loaded by `load_relations` over all chapters and averages the sentiment of every ordered pair
+    of characters that interacted.
+
+    With `deduct_opposing_avg`, the average sentiment of the second character towards everyone is deducted, and with
+    `deduct_book_avg`, the average sentiment of the whole book. Returns the arrays `char1`, `char2`, `sentiment` and
+    `count` (a float, fractional if interactions were weighted by `decay`), ordered by `char1` then `char2`."""
+
+    arr = info['relations']
+
+    if isinstance(arr, (SparseRelations, RelationsStore)):
+        num_chars = arr.shape[0]
+        char1, char2, sentiment_totals, counts = arr.sum_chapters()
+        char_avgs = np.stack((
+            np.bincount(char1, weights=sentiment_totals, minlength=num_chars),
+            np.bincount(char1, weights=counts, minlength=num_chars)
+        ), axis=1)
+    else:
+        pair_totals = np.sum(arr, axis=3)
+        char_avgs = np.sum(arr, axis=(1, 3))
+
+        char1, char2 = np.nonzero(pair_totals[:, :, 1] > 0)
+        sentiment_totals, counts = pair_totals[char1, char2, 0], pair_totals[char1, char2, 1]
+
+    return average_interactions(char1, char2, sentiment_totals, counts, char_avgs, info['total'], deduct_opposing_avg, deduct_book_avg)
+
+
+def average_interactions(
+    char1: np.ndarray,
+    char2: np.ndarray,
+    sentiment_totals: np.ndarray,
+    counts: np.ndarray,
+    char_totals: np.ndarray,
+    book_totals: np.ndarray,
+    deduct_opposing_avg: bool = False,
+    deduct_book_avg: bool = False
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Averages summed pair sentiments as `get_interactions` does. `char_totals[c]` holds the summed sentiment and count
+    of character `c` towards everyone, and `book_totals` the summed sentiment and sentence count of the book."""
+
+    is_pair = (counts > 0) & (char1 != char2)
+    char1, char2, sentiment_totals, counts = char1[is_pair], char2[is_pair], sentiment_totals[is_pair], counts[is_pair]
+
+    sentiments = sentiment_totals / counts
+
+    if deduct_opposing_avg:
+        sentiments = sentiments - char_totals[char2, 0] / char_totals[char2, 1]
+
+    if deduct_book_avg:
+        sentiments = sentiments - book_totals[0] / book_totals[1]
+
+    return char1, char2, sentiments, counts
+
+
+def _format_json_numbers(values: list[int | float]) -> list[str]:
+    """Formats numbers the way `json.dump` does"""
+
+    return json.dumps(values)[1:-1].split(', ') if len(values) else []
+
+
+def _get_json_counts(counts: np.ndarray) -> list[int | float]:
+    """Interaction counts as they are written to JSON: whole counts as integers, as before interactions could be
+    weighted, and fractional counts (weighted by `decay`) as floats"""
+
+    return [int(count) if count.is_integer() else count for count in counts.tolist()]
+
+
+def _write_dense_interactions(
+    file_path: str,
+    num_chars: int,
+    char1: np.ndarray,
+    char2: np.ndarray,
+    sentiments: np.ndarray,
+    counts: np.ndarray
 ) -> None:
-    main_characters_aliases_file_path = os.path.join(characters_data_dir, 'main_characters_aliases.json')
+    """Writes the interactions as a nested list where `[i][j]` is `[sentiment, count]` (`[0, 0]` if the characters did
+    not interact, null if `i` is `j`), formatted exactly as `json.dump(..., indent=4)` would"""
 
-    if not os.path.exists(main_characters_aliases_file_path):
-        raise FileNotFoundError('Missing main_characters_aliases.json in given directory!')
+    no_interaction = "[\n            0,\n            0\n        ]"
+    rows = [[no_interaction] * num_chars for _ in range(num_chars)]
 
-    with open(main_characters_aliases_file_path, 'r') as file: 
-        main_char_list = json.load(file)
+    for idx in range(num_chars):
+        rows[idx][idx] = "null"
 
-    pkl_fp = os.path.join(characters_data_dir, 'character-relations.pkl')
+    for i, j, sentiment, count in zip(char1.tolist(), char2.tolist(), _format_json_numbers(sentiments.tolist()), _format_json_numbers(_get_json_counts(counts))):
+        rows[i][j] = f"[\n            {sentiment},\n            {count}\n        ]"
 
-    if not os.path.exists(pkl_fp):
-        raise FileNotFoundError('Missing character-relations.pkl in given directory!')
+    with open(file_path, 'w') as file:
+        if not num_chars:
+            file.write("[]")
+            return None
 
-    with open(pkl_fp, 'rb') as file:
-        info = pickle.load(file)
+        file.write("[\n    ")
+        file.write(",\n    ".join("[\n        " + ",\n        ".join(row) + "\n    ]" for row in rows))
+        file.write("\n]")
 
-    arr = info['relations']
 
-    store = [[[0, 0] for _ in range(len(main_char_list))]  for _ in range(len(main_char_list))]
+def collate_relations(
+    characters_data_dir: str,
+    deduct_opposing_avg: bool = False,
+    deduct_book_avg: bool = False,
+    output_format: str = 'dense',
+    metrics: RunMetrics | None = None
+) -> None:
+    """Writes the average sentiment and the number of interactions between every pair of characters (see
+    `get_interactions`).
+
+    With the 'dense' `output_format`, they are written to interactions.json as a nested list where `[i][j]` is
+    `[sentiment, count]` of character `i` towards character `j`. With 'edges', only the pairs that interacted are written,
+    to interactions_edges.json as `{"num_characters": int, "edges": [[i, j, sentiment, count], ...]}`. Counts are written
+    as integers, or as floats where interactions weighted by `decay` make them fractional.
 
-    char_avgs = np.sum(arr, axis=(1, 3))
+    With `metrics`, the stage is recorded (see `RunMetrics`)."""
 
-    book_avg = info['total'][0]/info['total'][1] if deduct_book_avg else False
-    print(book_avg)
+    if output_format not in ('dense', 'edges'):
+        raise ValueError(f"Unknown interactions format '{output_format}'!")
+
+    main_characters_aliases_file_path = os.path.join(characters_data_dir, 'main_characters_aliases.json')
+
+    if not os.path.exists(main_characters_aliases_file_path):
+        raise FileNotFoundError('Missing main_characters_aliases.json in given directory!')
+
+    with open(main_characters_aliases_file_path, 'r') as file: 
+        main_char_list = json.load(file)
 
-    for i in range(len(main_char_list)):
-        for j in range(len(main_char_list)):
-            if i==j: 
-                store[i][j] = None
-                continue
+    with record_stage(metrics, "collate_relations") as record:
+        info = load_relations(characters_data_dir)
 
-            opposing_avg = char_avgs[j][0]/char_avgs[j][1] if deduct_opposing_avg else False
-            interaction_count = int(np.sum(arr[i][j][1]))
+        book_avg = info['total'][0]/info['total'][1] if deduct_book_avg else False
+        print(book_avg)
 
-            store[i][j][0] = np.sum(arr[i][j][0]) / interaction_count - opposing_avg - book_avg if interaction_count else 0
-            store[i][j][1] = interaction_count
+        char1, char2, sentiments, counts = get_interactions(info, deduct_opposing_avg, deduct_book_avg)
+        record.add(pairs=len(char1))
 
-    interactions_fp = os.path.join(characters_data_dir, 'interactions.json')
+        if output_format == 'dense':
+            _write_dense_interactions(os.path.join(characters_data_dir, 'interactions.json'), len(main_char_list), char1, char2, sentiments, counts)
+            return None
 
-    with open(interactions_fp, 'w') as file:
-        json.dump(store, file, indent=4)
+        with open(os.path.join(characters_data_dir, 'interactions_edges.json'), 'w') as file:
+            json.dump({
+                "num_characters": len(main_char_list),
+                "edges": [list(edge) for edge in zip(char1.tolist(), char2.tolist(), sentiments.tolist(), _get_json_counts(counts))]
+            }, file)
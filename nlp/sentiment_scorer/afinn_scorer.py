@@ -1,17 +1,23 @@
 from .base_scorer import BaseScorer
+from .lexicon_scorer import LexiconScorer
+from .score_cache import ScoreCache
 
 
-class AfinnScorer(BaseScorer):
+class AfinnScorer(LexiconScorer):
     """Class for AFINN Scorer"""
 
-    def __init__(self, replace_propn: bool = True) -> None:
-        super().__init__(replace_propn)
-
+    def __init__(self, replace_propn: bool = True, score_cache: ScoreCache | None = None) -> None:
         from afinn import Afinn
 
         self.afinn_scorer = Afinn()
 
+        # Same lexicon as Afinn.score, with the scores halved
+        super().__init__(self.afinn_scorer._dict, 0.5, replace_propn, score_cache)
+
+    def get_config(self) -> dict[str, any]:
+        # The lexicon comes with the scorer, so scores cached by earlier versions stay valid
+        return BaseScorer.get_config(self)
+
     def get_sentiment_score(self, sentence: str) -> float:
         sentiment_score = self.afinn_scorer.score(sentence)/2
         return sentiment_score
-    
\ No newline at end of file
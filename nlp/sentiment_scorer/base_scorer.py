@@ -1,22 +1,50 @@
 import string
 
+from .score_cache import ScoreCache
+
 
 class BaseScorer():
     """Base Class for Sentiment Analysis Scorer"""
 
     placeholders = list(string.ascii_uppercase)
 
-    def __init__(self, replace_propn: bool = True) -> None:
+    def __init__(self, replace_propn: bool = True, score_cache: ScoreCache | None = None) -> None:
         """Initialise Base Scorer"""
 
         self.replace_propn = replace_propn
+        self.score_cache = score_cache
 
         return None
+
+    def get_config(self) -> dict[str, any]:
+        """Method to get the scorer's identity and settings, used to tell whether earlier scores can be reused"""
+
+        return {
+            "scorer": f"{type(self).__module__}.{type(self).__qualname__}",
+            "replace_propn": self.replace_propn
+        }
         
     def replace_proper_nouns(self, sentence: str, propn_pos: list[list[int, int]]) -> str:
-        """Method to replace proper nouns"""
+        """Method to replace proper nouns, the last proper noun getting the first placeholder"""
+
+        propn_pos = sorted(propn_pos, key = lambda x: x[1], reverse = True)
+
+        # Spans that do not overlap are masked by offset, building the sentence once
+        prev_start_pos = len(sentence)
+        for start_pos, end_pos in propn_pos:
+            if not 0 <= start_pos <= end_pos <= prev_start_pos:
+                break
+            prev_start_pos = start_pos
+        else:
+            pieces = []
+            text_end_pos = len(sentence)
+            for idx, (start_pos, end_pos) in enumerate(propn_pos):
+                pieces.append(sentence[end_pos:text_end_pos])
+                pieces.append(BaseScorer.placeholders[idx%26])
+                text_end_pos = start_pos
+            pieces.append(sentence[:text_end_pos])
 
-        propn_pos.sort(key = lambda x: x[1], reverse = True)
+            return ''.join(reversed(pieces))
 
         for idx, (start_pos, end_pos) in enumerate(propn_pos):
             sentence = sentence[:start_pos] + BaseScorer.placeholders[idx%26] + sentence[end_pos:]
@@ -28,6 +56,11 @@ class BaseScorer():
 
         raise NotImplementedError('get_sentiment_score is not implemented for BaseScorer!')
 
+    def get_sentiment_scores(self, sentences: list[str]) -> list[float]:
+        """Method to get sentiment scores of many sentences, override it if the scorer can do better than looping"""
+
+        return [self.get_sentiment_score(sentence) for sentence in sentences]
+
     def get(
         self, 
         sentence: str, 
@@ -38,4 +71,45 @@ class BaseScorer():
         if self.replace_propn and propn_pos: 
             sentence = self.replace_proper_nouns(sentence, propn_pos)
 
+        if self.score_cache is not None:
+            return self.get_cached_sentiment_scores([sentence], commit=False)[0]
+
         return self.get_sentiment_score(sentence)
+
+    def get_batch(
+        self,
+        sentences: list[str],
+        propn_positions: list[list[list[int, int]]] | None = None
+    ) -> list[float]:
+        """Method called by `analyse_sentiments` function to score a whole chapter at once"""
+
+        if self.replace_propn and propn_positions is not None:
+            sentences = [
+                self.replace_proper_nouns(sentence, propn_pos) if propn_pos else sentence 
+                for sentence, propn_pos in zip(sentences, propn_positions)
+            ]
+
+        if self.score_cache is not None:
+            return self.get_cached_sentiment_scores(sentences)
+
+        return self.get_sentiment_scores(sentences)
+
+    def get_cached_sentiment_scores(self, sentences: list[str], commit: bool = True) -> list[float]:
+        """Method to get sentiment scores from `score_cache`, scoring and caching only the sentences it is missing.
+        Without `commit`, when the hits were last used is written later, unless sentences are missing."""
+
+        keys = self.score_cache.get_keys(self.get_config(), sentences)
+        scores = self.score_cache.get_many(keys)
+
+        missing_idx = [idx for idx, score in enumerate(scores) if score is None]
+        if missing_idx:
+            missing_scores = self.get_sentiment_scores([sentences[idx] for idx in missing_idx])
+
+            for idx, score in zip(missing_idx, missing_scores):
+                scores[idx] = score
+
+            self.score_cache.set_many([keys[idx] for idx in missing_idx], missing_scores)
+        elif commit:
+            self.score_cache.commit()
+
+        return scores
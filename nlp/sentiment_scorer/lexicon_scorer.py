@@ -0,0 +1,94 @@
+import hashlib
+import json
+import re
+
+import numpy as np
+
+from .base_scorer import BaseScorer
+from .score_cache import ScoreCache
+
+
+# Joins the sentences of a batch, it is neither whitespace nor a word character so no word or phrase spans it
+SENTENCE_SEPARATOR = '\x00'
+
+WORD_PATTERN = re.compile(r'\w+')
+
+
+class LexiconScorer(BaseScorer):
+    """Class for scorers adding up the scores of the words and phrases of a lexicon found in a sentence, after its
+    whitespace is collapsed and it is lower-cased, then multiplying the sum by `scale`.
+
+    Words and phrases are found as AFINN's regular expression finds them: starting at word boundaries, the longest
+    that ends at a word boundary, without overlaps. A batch is scored in one pass. Its sentences are joined into one
+    text, which is normalised and split into words once, and only the words starting a word or phrase of the lexicon
+    are looked up, with the phrases they start up to the longest of the lexicon. The scores are then added up per
+    sentence."""
+
+    def __init__(
+        self,
+        lexicon: dict[str, float],
+        scale: float = 1.0,
+        replace_propn: bool = True,
+        score_cache: ScoreCache | None = None
+    ) -> None:
+        super().__init__(replace_propn, score_cache)
+
+        # Words and phrases then start at the start of a word and end at the end of one
+        for entry in lexicon:
+            if not re.fullmatch(r'\w(?:.*\w)?', entry, flags = re.DOTALL):
+                raise ValueError(f"Lexicon entry '{entry}' does not start and end with a word character!")
+
+        self.lexicon = lexicon
+        self.scale = scale
+
+        self.first_words = {WORD_PATTERN.match(entry).group() for entry in lexicon}
+        self.max_words = max((len(WORD_PATTERN.findall(entry)) for entry in lexicon), default = 1)
+
+    def get_config(self) -> dict[str, any]:
+        lexicon_hash = hashlib.sha256(json.dumps(sorted(self.lexicon.items())).encode()).hexdigest()
+
+        return {**super().get_config(), "lexicon": lexicon_hash, "scale": self.scale}
+
+    def get_sentiment_score(self, sentence: str) -> float:
+        return self.get_sentiment_scores([sentence])[0]
+
+    def get_sentiment_scores(self, sentences: list[str]) -> list[float]:
+        text = SENTENCE_SEPARATOR.join(sentences)
+
+        if text.count(SENTENCE_SEPARATOR) >= len(sentences):
+            # Separators within a sentence are swapped for another character that is neither whitespace nor a word character
+            text = SENTENCE_SEPARATOR.join(sentence.replace(SENTENCE_SEPARATOR, '\x01') for sentence in sentences)
+
+        text = re.sub(r"\s+", " ", text).lower()
+
+        word_spans = []
+        first_word_idx = []
+        for match in WORD_PATTERN.finditer(text):
+            if match.group() in self.first_words:
+                first_word_idx.append(len(word_spans))
+            word_spans.append(match.span())
+
+        match_starts = []
+        word_scores = []
+        match_end = 0
+        for word_idx in first_word_idx:
+            start = word_spans[word_idx][0]
+            if start < match_end:
+                continue
+
+            # Longest phrase first
+            for last_word_idx in range(min(word_idx + self.max_words, len(word_spans)) - 1, word_idx - 1, -1):
+                score = self.lexicon.get(text[start:word_spans[last_word_idx][1]])
+
+                if score is not None:
+                    match_starts.append(start)
+                    word_scores.append(score)
+                    match_end = word_spans[last_word_idx][1]
+                    break
+
+        separator_pos = [match.start() for match in re.finditer(SENTENCE_SEPARATOR, text)]
+        sentence_idx = np.searchsorted(np.asarray(separator_pos, dtype=np.int64), np.asarray(match_starts, dtype=np.int64), side='right')
+
+        sentiment_scores = np.bincount(sentence_idx, weights=np.asarray(word_scores, dtype=np.float64), minlength=len(sentences))
+
+        return (sentiment_scores*self.scale).tolist()
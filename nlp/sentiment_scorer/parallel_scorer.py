@@ -0,0 +1,63 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from .base_scorer import BaseScorer
+
+
+_worker_scorer = None
+
+
+def _init_worker(scorer: BaseScorer) -> None:
+    global _worker_scorer
+
+    _worker_scorer = scorer
+
+
+def _score_chunk(sentences: list[str]) -> list[float]:
+    return _worker_scorer.get_sentiment_scores(sentences)
+
+
+class ParallelScorer(BaseScorer):
+    """Class that spreads the sentences of a batch over a pool of processes, each holding its own copy of `scorer`.
+    
+    The cache of `scorer`, if any, is consulted in the main process before any work is sent out."""
+
+    def __init__(self, scorer: BaseScorer, workers: int = 2, chunk_size: int = 256) -> None:
+        super().__init__(scorer.replace_propn, scorer.score_cache)
+
+        self.scorer = scorer
+        self.workers = workers
+        self.chunk_size = chunk_size
+
+        self.executor = None
+
+    def get_config(self) -> dict[str, any]:
+        # Scores do not depend on how the work is split up
+        return self.scorer.get_config()
+
+    def get_sentiment_score(self, sentence: str) -> float:
+        return self.scorer.get_sentiment_score(sentence)
+
+    def get_sentiment_scores(self, sentences: list[str]) -> list[float]:
+        if len(sentences) <= self.chunk_size:
+            return self.scorer.get_sentiment_scores(sentences)
+
+        # The scorer (and any model it holds) is pickled once per worker when the pool starts, not once per chunk
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(self.scorer,))
+
+        chunks = [sentences[idx:idx+self.chunk_size] for idx in range(0, len(sentences), self.chunk_size)]
+
+        return [score for chunk_scores in self.executor.map(_score_chunk, chunks) for score in chunk_scores]
+
+    def close(self) -> None:
+        """Method to shut down the worker processes"""
+
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self) -> 'ParallelScorer':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
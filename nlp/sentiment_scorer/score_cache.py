@@ -0,0 +1,125 @@
+import hashlib
+import json
+import math
+import sqlite3
+
+
+class ScoreCache():
+    """SQLite-backed cache of sentiment scores, bounded to `max_entries` with least-recently-used eviction.
+
+    Scores are keyed on the scorer's configuration and the SHA-256 of the sentence after proper noun replacement, so one
+    cache file can be shared by several scorers and books. When hits were last used is kept in memory, and written with
+    the next `set_many` or `commit`, or once `max_pending` hits are waiting."""
+
+    def __init__(self, cache_path: str, max_entries: int = 1_000_000, max_pending: int = 10_000) -> None:
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.max_pending = max_pending
+
+        # key : clock of the hits whose last_used is not written yet
+        self.pending = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.connection = None
+
+    def __getstate__(self) -> dict[str, any]:
+        # Connections cannot be pickled, copies (e.g. in worker processes) reconnect on first use
+        return {**self.__dict__, "connection": None, "pending": {}}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.cache_path)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS scores (key BLOB PRIMARY KEY, score REAL NOT NULL, last_used INTEGER NOT NULL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS scores_last_used ON scores (last_used)")
+
+            self.num_entries, self.clock = self.connection.execute("SELECT COUNT(*), COALESCE(MAX(last_used), 0) FROM scores").fetchone()
+
+        return self.connection
+
+    @staticmethod
+    def get_keys(scorer_config: dict[str, any], sentences: list[str]) -> list[bytes]:
+        """Method to get the cache keys of sentences scored by a scorer with the given configuration"""
+
+        prefix = json.dumps(scorer_config, sort_keys=True).encode() + b'\0'
+
+        return [hashlib.sha256(prefix + sentence.encode()).digest() for sentence in sentences]
+
+    def get_many(self, keys: list[bytes]) -> list[float | None]:
+        """Method to get cached scores, None for keys that are not cached"""
+
+        connection = self._connect()
+        self.clock += 1
+
+        found = {}
+        for idx in range(0, len(keys), 500):
+            chunk = keys[idx:idx+500]
+            found.update(connection.execute(f"SELECT key, score FROM scores WHERE key IN ({','.join('?' * len(chunk))})", chunk))
+
+        self.pending.update(dict.fromkeys(found, self.clock))
+        if len(self.pending) >= self.max_pending:
+            self.commit()
+
+        scores = [found.get(key) for key in keys]
+
+        num_hits = len(keys) - scores.count(None)
+        self.hits += num_hits
+        self.misses += len(keys) - num_hits
+
+        return scores
+
+    def set_many(self, keys: list[bytes], scores: list[float]) -> None:
+        """Method to cache scores, evicting the least recently used ones if the cache grows past `max_entries`"""
+
+        connection = self._connect()
+        self._write_pending(connection)
+
+        rows = {key: score for key, score in zip(keys, scores) if not math.isnan(score)}
+        cursor = connection.executemany(
+            "INSERT OR IGNORE INTO scores VALUES (?, ?, ?)",
+            [(key, float(score), self.clock) for key, score in rows.items()]
+        )
+        self.num_entries += cursor.rowcount
+
+        if self.num_entries > self.max_entries:
+            num_evicted = self.num_entries - self.max_entries
+            connection.execute("DELETE FROM scores WHERE key IN (SELECT key FROM scores ORDER BY last_used LIMIT ?)", (num_evicted,))
+            self.num_entries -= num_evicted
+            self.evictions += num_evicted
+
+        connection.commit()
+
+    def _write_pending(self, connection: sqlite3.Connection) -> None:
+        if self.pending:
+            connection.executemany("UPDATE scores SET last_used = ? WHERE key = ?", [(clock, key) for key, clock in self.pending.items()])
+            self.pending = {}
+
+    def commit(self) -> None:
+        """Method to write when the hits so far were last used"""
+
+        if self.pending:
+            connection = self._connect()
+            self._write_pending(connection)
+            connection.commit()
+
+    def get_stats(self) -> dict[str, int | float]:
+        """Method to get the hit and miss counts since the cache was opened"""
+
+        num_lookups = self.hits + self.misses
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / num_lookups if num_lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": self.num_entries if self.connection is not None else None
+        }
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.commit()
+            self.connection.close()
+            self.connection = None
@@ -0,0 +1,212 @@
+import json
+import os
+import queue
+import threading
+
+from typing import Callable, Iterator
+
+import numpy as np
+
+from .consolidate_main_char import consolidate_main_char, get_alias_index
+from .filter_rules import FilterRules
+from .get_main_char import add_chapter_characters, get_chapter_characters, write_main_char
+from .get_relevant_sentences import get_relevant_sentences_in_chapter
+from .ner_coref import MODEL_PARAMS, _process_chapter, is_chapter_complete
+from .sentiment_analysis import add_chapter_relations, analyse_chapter_sentiments, collate_relations, create_relations, write_relations
+from .sentiment_scorer.base_scorer import BaseScorer
+
+
+# Marks the end of the chapters passed between stages
+_DONE = object()
+
+
+class _StageStopped(Exception):
+    """Raised in a stage when another stage has failed"""
+
+
+class _Stream():
+    """Bounded queue between two stages. Blocking calls give up once `stopped` is set, so a failing stage never leaves
+    the others waiting on a queue that will not move."""
+
+    def __init__(self, maxsize: int, stopped: threading.Event) -> None:
+        self.queue = queue.Queue(maxsize)
+        self.stopped = stopped
+
+    def put(self, item: any) -> None:
+        while True:
+            if self.stopped.is_set():
+                raise _StageStopped()
+            try:
+                self.queue.put(item, timeout=0.1)
+                return None
+            except queue.Full:
+                continue
+
+    def __iter__(self) -> Iterator[any]:
+        while True:
+            if self.stopped.is_set():
+                raise _StageStopped()
+            try:
+                item = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            if item is _DONE:
+                return None
+
+            yield item
+
+
+def stream_pipeline(
+    text_dir: str,
+    book: str,
+    ner_coref_data_dir: str,
+    characters_data_dir: str,
+    sentiment_scorer: BaseScorer,
+    filter_func: Callable[[int, str, any], bool] | FilterRules | None = None,
+    filter_args: any = None,
+    deduct_opposing_avg: bool = False,
+    deduct_book_avg: bool = False,
+    delimiter: str = r'(?:\r\n?|\n){6,}',
+    sparse: bool = False,
+    relations_format: str = 'pickle',
+    sentences_format: str = 'csv',
+    interactions_format: str = 'dense',
+    window: int | None = 1,
+    decay: float = 1.0,
+    within_paragraph: bool = False,
+    queue_size: int = 2,
+    resume: bool = True
+) -> None:
+    """Runs every stage from `split_chapters` to `collate_relations` on a book whose main_characters_aliases.json is
+    already written, streaming chapters from stage to stage instead of running each stage on the whole book.
+
+    BookNLP and sentence linking run on their own threads and sentiment scoring on the calling one, connected by queues
+    holding at most `queue_size` chapters, so while BookNLP processes a chapter the previous ones are already linked and
+    scored, and only a few chapters are in flight at a time. Characters are matched by name as each chapter comes out of BookNLP,
+    in book order, so novel ids are the same as those of `get_main_char`. Relations are accumulated chapter by chapter, and with the 'store'
+    `relations_format` written as each chapter is scored (see `create_relations`). main_characters.json, chapters_coref.json and the
+    consolidated files are written at the end, as by `get_main_char` and `consolidate_main_char`.
+    `window`, `decay` and `within_paragraph` set which characters interact, as in `analyse_sentiments`.
+
+    With `resume`, chapters BookNLP has already completed are not processed again (see `run_ner_coref`). Other stages
+    always rerun; use `run_pipeline` for incremental reruns."""
+
+    from utils.chapter_splitter import split_chapters
+
+    aliases_file = os.path.join(characters_data_dir, 'main_characters_aliases.json')
+
+    if not os.path.exists(aliases_file):
+        raise FileNotFoundError('Missing main_characters_aliases.json in given directory!')
+
+    with open(aliases_file, 'r') as file:
+        characters_aliases = json.load(file)
+
+    alias_index = get_alias_index(characters_aliases)
+    num_chars = len(characters_aliases)
+
+    chapters = [entry["chapter"] for entry in split_chapters(text_dir, book, delimiter)]
+    chapters_text_dir = os.path.join(text_dir, book)
+
+    main_characters = {}
+    chapters_coref = {}
+    consolidated_indices = {}
+
+    relations_arr = create_relations(characters_data_dir, num_chars, len(chapters), relations_format, sparse)
+    chapter_values_arr = np.zeros((2, len(chapters)))
+
+    stopped = threading.Event()
+    ner_stream = _Stream(queue_size, stopped)
+    linked_stream = _Stream(queue_size, stopped)
+    errors = []
+
+    def run_stage(stage: Callable[[], None], output_stream: _Stream | None) -> None:
+        try:
+            stage()
+            if output_stream is not None:
+                output_stream.put(_DONE)
+        except _StageStopped:
+            pass
+        except BaseException as error:
+            errors.append(error)
+            stopped.set()
+
+    def run_ner() -> None:
+        booknlp = None
+
+        for chapter in chapters:
+            chapter_name = f"{chapter}.txt"
+            chapter_dir = os.path.join(ner_coref_data_dir, chapter)
+
+            if resume and is_chapter_complete(os.path.join(chapters_text_dir, chapter_name), chapter_dir, chapter):
+                print(f"Skipped {chapter_name}")
+            else:
+                # The model is only loaded if a chapter needs it
+                if booknlp is None:
+                    from booknlp.booknlp import BookNLP
+
+                    booknlp = BookNLP("en", MODEL_PARAMS)
+
+                _process_chapter(booknlp, chapters_text_dir, chapter_name, ner_coref_data_dir)
+                print(f"Completed {chapter_name}")
+
+            ner_stream.put(chapter)
+
+    def run_linking() -> None:
+        for chapter in ner_stream:
+            characters = get_chapter_characters(ner_coref_data_dir, chapter)
+            add_chapter_characters(main_characters, chapters_coref, chapter, characters)
+
+            for _, name, _ in characters:
+                idx = alias_index.get(name)
+                if idx is not None:
+                    consolidated_indices[str(main_characters[name]['id'])] = idx
+
+            get_relevant_sentences_in_chapter(
+                chapter,
+                ner_coref_data_dir,
+                chapters_text_dir,
+                chapters_coref,
+                consolidated_indices,
+                filter_func,
+                filter_args,
+                verbose=False,
+                output_format=sentences_format
+            )
+            linked_stream.put(chapter)
+
+    def run_scoring() -> None:
+        for chapter in linked_stream:
+            chapter_num = int(chapter.split('-')[1]) - 1
+            sentiments, relations = analyse_chapter_sentiments(
+                os.path.join(ner_coref_data_dir, chapter), sentiment_scorer, num_chars, True, window, decay, within_paragraph
+            )
+            add_chapter_relations(relations_arr, chapter_values_arr, chapter_num, sentiments, relations)
+            print(f"Scored {chapter}")
+
+    threads = [
+        threading.Thread(target=run_stage, args=(run_ner, ner_stream), daemon=True),
+        threading.Thread(target=run_stage, args=(run_linking, linked_stream), daemon=True)
+    ]
+    for thread in threads:
+        thread.start()
+
+    run_stage(run_scoring, None)
+
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+
+    write_main_char(characters_data_dir, main_characters, chapters_coref)
+    consolidate_main_char(characters_data_dir)
+    write_relations(characters_data_dir, relations_arr, chapter_values_arr)
+
+    print("Completed Sentiment Analysis!")
+
+    if sentiment_scorer.score_cache is not None:
+        stats = sentiment_scorer.score_cache.get_stats()
+        print(f"Score cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.1%} hit rate), {stats['evictions']} evictions")
+
+    collate_relations(characters_data_dir, deduct_opposing_avg, deduct_book_avg, interactions_format)
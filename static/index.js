@@ -7,7 +7,7 @@ const fetchJSON = async (url) => {
         return await res.json()
 
     } catch(error) {
-        console.error("Error fetching character_names.json", error)
+        console.error(`Error fetching ${url}`, error)
         return null
 
     }
@@ -15,8 +15,10 @@ const fetchJSON = async (url) => {
 
 class CharacterNetwork {
     constructor() {
+        this.nodesDataSet = null
         this.nodesDataView = null
         this.edgesDataView = null
+        this.layouts = null
 
         this.minInteractions = 0.05
         this.showSentiments = false
@@ -108,6 +110,9 @@ class CharacterNetwork {
     }
 
     createLabelEl = (num_interactions, sentiment_score = null, total = false) => {
+        // Interactions weighted by decay are fractional
+        num_interactions = Number.isInteger(num_interactions) ? num_interactions : num_interactions.toFixed(2)
+
         const labelDivEl = document.createElement('div')
         labelDivEl.innerHTML =  sentiment_score === null ? 
             `<p>${num_interactions}${total ? " total" : ""} interactions</p>` : 
@@ -115,8 +120,95 @@ class CharacterNetwork {
         return labelDivEl
     }
 
-    loadData = async () => {
-        const character_names_arr = await fetchJSON("static/character_names.json")
+    getLayout = () => this.layouts ? this.layouts[String(Number(this.minInteractions))] : undefined
+
+    // Uses the layout precomputed for the current filter if there is one (see export_layouts), physics otherwise
+    applyLayout = () => {
+        const layout = this.getLayout()
+
+        if (layout) {
+            this.nodesDataSet.update(layout.ids.map((id, idx) => ({id: id, x: layout.x[idx], y: layout.y[idx]})))
+        }
+
+        this.graph.setOptions({physics: {enabled: !layout}})
+    }
+
+    // Reads the columns of a graph written by export_frontend_data, from its .bin file if it was exported as binary
+    loadEdgeColumns = async (edges) => {
+        if (!edges.file) return edges
+
+        try {
+            const res = await fetch(`static/${edges.file}`)
+
+            if (!res.ok) throw new Error('Fetch failed!')
+
+            const buffer = await res.arrayBuffer()
+
+            return Object.fromEntries(Object.entries(edges.columns).map(([column, {dtype, offset, length}]) => [
+                column,
+                new (dtype === 'float32' ? Float32Array : Int32Array)(buffer, offset, length)
+            ]))
+
+        } catch(error) {
+            console.error(`Error fetching static/${edges.file}`, error)
+            return null
+
+        }
+    }
+
+    // Edges and node values precomputed by export_frontend_data, for the whole book or the arc named in the `arc` query parameter, or null if they fail to load
+    getGraphData = async (graph_index, character_names_arr) => {
+        const arcName = new URLSearchParams(window.location.search).get('arc')
+        const arc = arcName === null ? undefined : graph_index.arcs[arcName]
+        if (arcName !== null && !arc) console.error(`Unknown arc ${arcName}, showing the whole book`)
+
+        const graph = await fetchJSON(`static/${arc ? arc.file : graph_index.full}`)
+        if (!graph || !graph.edges || !graph.nodes) return null
+
+        const edges = await this.loadEdgeColumns(graph.edges)
+        if (!edges) return null
+
+        const edgesArr = []
+        for (let k = 0; k < graph.num_edges; k++) {
+            const num_interactions = edges.count[k]
+            const sentiment = edges.sentiment[k]
+
+            const edgeObj = {
+                from: edges.from[k],
+                to: edges.to[k],
+                value: num_interactions, // determines thickness
+                length: edges.length[k], // determines edge length
+                weight: num_interactions,
+                percentage_interaction: edges.percentage[k],
+                sentiment: sentiment,
+                title: this.createLabelEl(num_interactions), // for tooltip
+                color: null
+            }
+
+            edgesArr.push(edgeObj)
+            edgesArr.push({
+                ...edgeObj,
+                title: this.createLabelEl(num_interactions, sentiment),
+                color: this.getClr(sentiment)
+            })
+        }
+
+        const nodesArr = character_names_arr.map((name, idx) => ({
+            id: idx,
+            label: name,
+            title: this.createLabelEl(graph.nodes.total[idx], null, true),
+            maxNumInteractions: graph.nodes.max_count[idx],
+            maxPercentageInteractions: graph.nodes.max_percentage[idx]
+        }))
+
+        // Layouts are computed for the whole book
+        if (arc) this.layouts = null
+
+        return [nodesArr, edgesArr]
+    }
+
+    // Edges and node values computed from the dense interactions.json written by collate_relations
+    getInteractionsData = async (character_names_arr) => {
         const interactions_arr = await fetchJSON("static/interactions.json")
     
         const num_interactions_per_char = interactions_arr.map(arr => arr.reduce((sum, el) => el ? sum + el[1] : sum, 0))
@@ -174,12 +266,33 @@ class CharacterNetwork {
                 maxPercentageInteractions: nodesMaxInteractions[idx][1]
             }))
 
-        const nodesDataSet = new vis.DataSet(nodesArr)
+        return [nodesArr, edgesArr]
+    }
+
+    loadData = async () => {
+        const character_names_arr = await fetchJSON("static/character_names.json")
+        const graph_index = await fetchJSON("static/graph_index.json")
+        this.layouts = await fetchJSON("static/layouts.json")
+
+        // Falls back to interactions.json when the graphs have not been exported or fail to load
+        const graphData = graph_index ? await this.getGraphData(graph_index, character_names_arr) : null
+        const [nodesArr, edgesArr] = graphData ?? await this.getInteractionsData(character_names_arr)
+
+        const layout = this.getLayout()
+        if (layout) {
+            layout.ids.forEach((id, idx) => {
+                nodesArr[id].x = layout.x[idx]
+                nodesArr[id].y = layout.y[idx]
+            })
+        }
+        this.options.physics.enabled = !layout
+
+        this.nodesDataSet = new vis.DataSet(nodesArr)
         const edgesDataSet = new vis.DataSet(edgesArr)
 
-        this.nodesDataView = new vis.DataView(nodesDataSet, {
+        this.nodesDataView = new vis.DataView(this.nodesDataSet, {
             filter: (node) => this.minInteractions < 1 ? node.maxPercentageInteractions >= this.minInteractions : node.maxNumInteractions >= this.minInteractions, 
-            fields: ['id', 'label', 'title']
+            fields: ['id', 'label', 'title', 'x', 'y']
         })
 
         this.edgesDataView = new vis.DataView(edgesDataSet, {
@@ -287,6 +400,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
     submitBtnEl.addEventListener('click', () => {
         cnetwork.minInteractions = rangeSliderEl.value
+        cnetwork.applyLayout()
         cnetwork.edgesDataView.refresh()
         cnetwork.nodesDataView.refresh()
     })
@@ -0,0 +1,31 @@
+import os
+
+import pytest
+
+from utils.chapter_splitter import ChapterIndex, split_chapters
+
+
+BOOK = "Chapter One\nTaylor walked.\n\nLisa waved.\n" + "\n" * 7 + "Chapter Two\nBrian left.\n" + "\n" * 6 + "Chapter 3\nEnd.\n"
+
+CHAPTERS = {
+    "Part-1-Chapter_One": "Chapter One\nTaylor walked.\n\nLisa waved.",
+    "Part-2-Chapter_Two": "Chapter Two\nBrian left.",
+    "Part-3-Chapter_3": "Chapter 3\nEnd."
+}
+
+
+@pytest.mark.parametrize('newline', ['\n', '\r\n', '\r'])
+def test_split_chapters_splits_any_line_endings(tmp_path, newline):
+    with open(tmp_path / 'book.txt', 'w', newline='', encoding='utf-8') as file:
+        file.write(BOOK.replace('\n', newline))
+
+    chapters = split_chapters(str(tmp_path), 'book')
+
+    assert [entry["chapter"] for entry in chapters] == list(CHAPTERS)
+
+    with ChapterIndex(str(tmp_path), 'book') as chapter_index:
+        for chapter, text in CHAPTERS.items():
+            with open(os.path.join(tmp_path, 'book', f"{chapter}.txt"), 'r', newline='', encoding='utf-8') as file:
+                assert file.read() == text
+
+            assert chapter_index.get_text(chapter) == text
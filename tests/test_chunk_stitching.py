@@ -0,0 +1,55 @@
+import pandas as pd
+
+from nlp.chunk_stitching import _ChapterStitcher
+
+
+def get_chunk_tables(entities: list[tuple[int, int, int, str, str]]) -> dict[str, pd.DataFrame]:
+    """Tables of a chunk of 4 one-token sentences, 5 characters apart"""
+
+    tokens = pd.DataFrame({
+        "paragraph_ID": [0, 0, 1, 1],
+        "sentence_ID": [0, 1, 2, 3],
+        "token_ID_within_document": [0, 1, 2, 3],
+        "byte_onset": [0, 5, 10, 15],
+        "byte_offset": [4, 9, 14, 19],
+        "syntactic_head_ID": [0, 1, 2, 3]
+    })
+    entities = pd.DataFrame(entities, columns=["COREF", "start_token", "end_token", "prop", "text"])
+    quotes = pd.DataFrame(columns=["quote_start", "quote_end", "mention_start", "mention_end", "char_id"], dtype=int)
+
+    return {"tokens": tokens, "entities": entities, "quotes": quotes}
+
+
+def get_piece(chapter_start: int, chunk_start: int, chunk_end: int) -> dict[str, any]:
+    return {"chapter": 'Part-1-Chapter_1', "chapter_start": chapter_start, "chunk_start": chunk_start, "chunk_end": chunk_end}
+
+
+def test_pieces_of_the_same_chunk_keep_their_coref():
+    # Neither a proper name nor the narrator, so only BookNLP's coref ties the mentions together
+    tables = get_chunk_tables([(7, 1, 1, "PRON", "she"), (8, 2, 2, "NOM", "the man"), (7, 3, 3, "PRON", "she")])
+    book_characters = {7: {"id": 7, "g": None}, 8: {"id": 8, "g": None}}
+
+    stitcher = _ChapterStitcher()
+    stitcher.add_piece('chunk-1', get_piece(0, 0, 10), tables, book_characters)
+    stitcher.add_piece('chunk-1', get_piece(10, 10, 20), tables, book_characters)
+
+    entities = pd.concat(stitcher.tables["entities"], ignore_index=True)
+
+    assert entities["COREF"].tolist() == [0, 1, 0]
+    assert stitcher.characters[0]["count"] == 2
+    assert stitcher.characters[0]["texts"]["pronoun"] == ["she", "she"]
+
+
+def test_pieces_of_different_chunks_are_merged_by_name_only():
+    first_tables = get_chunk_tables([(0, 1, 1, "PRON", "she"), (1, 1, 1, "PROP", "Taylor")])
+    second_tables = get_chunk_tables([(0, 3, 3, "PRON", "she"), (1, 3, 3, "PROP", "Taylor")])
+    book_characters = {0: {"id": 0, "g": None}, 1: {"id": 1, "g": None}}
+
+    stitcher = _ChapterStitcher()
+    stitcher.add_piece('chunk-1', get_piece(0, 0, 10), first_tables, book_characters)
+    stitcher.add_piece('chunk-2', get_piece(10, 10, 20), second_tables, book_characters)
+
+    entities = pd.concat(stitcher.tables["entities"], ignore_index=True)
+
+    # The same coref id in another chunk is another character, unless it shares a proper name
+    assert entities["COREF"].tolist() == [0, 1, 2, 1]
@@ -0,0 +1,71 @@
+import importlib
+import json
+import os
+
+import pytest
+
+from nlp.instrumentation import RunMetrics
+
+
+# `nlp.get_main_char` is also the name of the function exported by nlp
+get_main_char = importlib.import_module('nlp.get_main_char')
+
+
+CHARACTERS = [
+    {"id": 0, "count": 12, "mentions": {"proper": [{"c": 10, "n": "Taylor"}], "common": [], "pronoun": []}},
+    # Brackets, braces and escaped quotes inside strings are not part of the structure
+    {"id": 1, "count": 3, "mentions": {"proper": [{"c": 3, "n": "Lisa [\"Tattletale\"] {}\\"}], "common": [], "pronoun": []}}
+]
+
+
+def write_book(path, book: dict[str, any], file_name: str = 'chapter.book') -> str:
+    book_file = str(path / file_name)
+    with open(book_file, 'w') as file:
+        json.dump(book, file)
+
+    return book_file
+
+
+@pytest.mark.parametrize('read_size', [1, 7, 1 << 20])
+def test_load_book_characters_stops_at_the_end_of_characters(tmp_path, monkeypatch, read_size):
+    monkeypatch.setattr(get_main_char, '_READ_SIZE', read_size)
+
+    book_file = write_book(tmp_path, {"characters": CHARACTERS, "quotes": []})
+    # Anything after the characters section is never read
+    with open(book_file, 'a') as file:
+        file.write('not json')
+
+    assert get_main_char.load_book_characters(book_file) == CHARACTERS
+
+
+def test_load_book_characters_parses_the_whole_file_if_characters_is_not_first(tmp_path):
+    book_file = write_book(tmp_path, {"quotes": [], "characters": CHARACTERS})
+
+    assert get_main_char.load_book_characters(book_file) == CHARACTERS
+
+
+def write_chapter(dir_path, chapter: str, names: list[str]) -> None:
+    os.makedirs(dir_path / chapter)
+    characters = [{"id": idx, "count": 1, "mentions": {"proper": [{"c": 1, "n": name}]}} for idx, name in enumerate(names)]
+    write_book(dir_path / chapter, {"characters": characters}, f"{chapter}.book")
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_get_main_char_merges_chapters_in_book_order(tmp_path, workers):
+    ner_coref_data_dir = tmp_path / 'ner_coref'
+    for chapter_num in range(1, 12):
+        write_chapter(ner_coref_data_dir, f"Part-{chapter_num}-Chapter_{chapter_num}", [f"Character {chapter_num}"])
+
+    metrics_file = tmp_path / 'metrics.jsonl'
+    get_main_char.get_main_char(str(ner_coref_data_dir), str(tmp_path), workers, RunMetrics(str(metrics_file)))
+
+    with open(tmp_path / 'main_characters.json', 'r') as file:
+        main_characters = json.load(file)
+
+    # Part-10 and Part-11 come after Part-9, not after Part-1
+    assert [main_characters[f"Character {chapter_num}"]["id"] for chapter_num in range(1, 12)] == list(range(11))
+
+    with open(metrics_file, 'r') as file:
+        records = [json.loads(line) for line in file]
+
+    assert sum(record["event"] == 'chapter' for record in records) == 11
@@ -0,0 +1,54 @@
+import json
+import os
+
+import pytest
+
+from nlp.booknlp_loader import LINKING_COLUMNS, load_entities, load_quotes, load_tokens
+from nlp.get_relevant_sentences import get_coref_lookup, link_sentences
+
+
+# Chapters whose expected sentences were captured from the original row-by-row linker. `synthetic` is written by
+# benchmarks/synthetic_book.py, and `edge_cases` has entities spanning sentences and quotes that overlap or never close.
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures', 'link_sentences')
+FIXTURES = {"synthetic": 'Part-1-Chapter_1', "edge_cases": 'Part-1-Chap_0'}
+
+FILTERS = {
+    "all": lambda novel_id, chapter, filter_args: True,
+    "even": lambda novel_id, chapter, filter_args: novel_id % 2 == 0
+}
+
+
+@pytest.mark.parametrize('filter_name', list(FILTERS))
+@pytest.mark.parametrize('fixture', list(FIXTURES))
+def test_link_sentences_matches_original_linker(fixture, filter_name):
+    chapter_dir = os.path.join(FIXTURES_DIR, fixture)
+    chapter = FIXTURES[fixture]
+
+    with open(os.path.join(chapter_dir, 'chapters_coref.json'), 'r') as file:
+        chapters_coref = json.load(file)
+
+    with open(os.path.join(chapter_dir, 'consolidated_indices.json'), 'r') as file:
+        consolidated_indices = json.load(file)
+
+    with open(os.path.join(chapter_dir, f"{chapter}.txt"), 'r', encoding='utf-8') as file:
+        chapter_text = file.read()
+
+    with open(os.path.join(chapter_dir, 'expected.json'), 'r', encoding='utf-8') as file:
+        expected = json.load(file)[filter_name]
+
+    sentence_info = link_sentences(
+        load_tokens(chapter_dir, chapter, LINKING_COLUMNS["tokens"]),
+        load_entities(chapter_dir, chapter, LINKING_COLUMNS["entities"]),
+        load_quotes(chapter_dir, chapter, LINKING_COLUMNS["quotes"]),
+        chapter_text,
+        get_coref_lookup(chapter, chapters_coref, consolidated_indices, FILTERS[filter_name])
+    )
+
+    assert sentence_info["words"] == expected["words"]
+    assert sentence_info["start_token_id"] == expected["start_token_id"]
+    assert sentence_info["end_token_id"] == expected["end_token_id"]
+    assert sentence_info["proper_nouns_pos"] == expected["proper_nouns_pos"]
+
+    # The original linker collected characters and speakers in sets
+    assert [sorted(chars) for chars in sentence_info["characters"]] == expected["characters"]
+    assert [sorted(speaker) for speaker in sentence_info["speaker"]] == expected["speaker"]
@@ -0,0 +1,120 @@
+import os
+
+import numpy as np
+import pytest
+
+from nlp.relations import RELATIONS_FILE, RELATIONS_STORE_INDEX, RELATIONS_STORE_PARTIAL_DIR, RelationsStore, get_chapter_relations, load_relations
+from nlp.sentiment_analysis import add_chapter_relations, create_relations, write_relations
+
+
+NUM_CHARS = 6
+NUM_CHAPTERS = 5
+
+
+def get_book_relations(seed: int = 0) -> list[tuple[np.ndarray, tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]]:
+    """Sentiments and relations of random chapters, as returned by `analyse_chapter_sentiments`"""
+
+    rng = np.random.default_rng(seed)
+    chapters = []
+
+    for _ in range(NUM_CHAPTERS):
+        num_sentences = int(rng.integers(1, 30))
+        sentence_idx = np.sort(rng.integers(0, num_sentences, 40))
+        chars = rng.integers(0, NUM_CHARS, 40)
+        # The last sentiment is the chapter-wide one, as in analyse_chapter_sentiments
+        sentiments = rng.normal(size=num_sentences + 1)
+
+        chapters.append((sentiments, get_chapter_relations(sentence_idx, chars, sentiments[:-1], NUM_CHARS, window=2, decay=0.5)))
+
+    return chapters
+
+
+def write_book(characters_data_dir, relations_format: str, chapters, num_written: int | None = None) -> None:
+    characters_data_dir.mkdir(exist_ok=True)
+    relations_arr = create_relations(str(characters_data_dir), NUM_CHARS, NUM_CHAPTERS, relations_format)
+    chapter_values_arr = np.zeros((2, NUM_CHAPTERS))
+
+    for chapter_num, (sentiments, relations) in enumerate(chapters[:num_written]):
+        add_chapter_relations(relations_arr, chapter_values_arr, chapter_num, sentiments, relations)
+
+    if num_written is None:
+        write_relations(str(characters_data_dir), relations_arr, chapter_values_arr)
+
+
+@pytest.fixture
+def book(tmp_path):
+    chapters = get_book_relations()
+    write_book(tmp_path / 'pickle', 'pickle', chapters)
+    write_book(tmp_path / 'store', 'store', chapters)
+
+    return load_relations(str(tmp_path / 'pickle')), load_relations(str(tmp_path / 'store'))
+
+
+@pytest.mark.parametrize('start_chapter, end_chapter', [(0, None), (1, 4), (2, 3), (3, 3)])
+def test_relations_store_matches_pickle(book, start_chapter, end_chapter):
+    pickle_info, store_info = book
+    store = store_info['relations']
+    dense = pickle_info['relations'][..., start_chapter:end_chapter].sum(axis=3)
+
+    assert store_info['complete'] and store_info['written_chapters'] == list(range(NUM_CHAPTERS))
+    np.testing.assert_allclose(store_info['chapter'], pickle_info['chapter'])
+    np.testing.assert_allclose(store_info['total'], pickle_info['total'])
+
+    for char in range(NUM_CHARS):
+        char2, sentiment, count = store.get_character(char, start_chapter, end_chapter)
+        expected_char2 = np.flatnonzero(dense[char, :, 1])
+
+        np.testing.assert_array_equal(char2, expected_char2)
+        np.testing.assert_allclose(sentiment, dense[char, expected_char2, 0])
+        np.testing.assert_allclose(count, dense[char, expected_char2, 1])
+
+    # Merged after every chapter and all at once
+    for merge_entries in (1, 2**20):
+        char1, char2, sentiment, count = store.sum_chapters(start_chapter, end_chapter, merge_entries)
+        expected_char1, expected_char2 = np.nonzero(dense[..., 1])
+
+        np.testing.assert_array_equal(char1, expected_char1)
+        np.testing.assert_array_equal(char2, expected_char2)
+        np.testing.assert_allclose(sentiment, dense[expected_char1, expected_char2, 0])
+        np.testing.assert_allclose(count, dense[expected_char1, expected_char2, 1])
+
+
+def test_partially_written_store_is_loaded_with_its_chapters(tmp_path, book):
+    pickle_info, _ = book
+    chapters = get_book_relations()
+
+    write_book(tmp_path / 'partial', 'store', chapters, num_written=3)
+
+    # An interrupted run can leave a line cut short
+    with open(tmp_path / 'partial' / RELATIONS_STORE_PARTIAL_DIR / RELATIONS_STORE_INDEX, 'a') as file:
+        file.write('{"chapter": 3, "fi')
+
+    with pytest.warns(UserWarning, match='incomplete, only 3 of 5 chapters'):
+        info = load_relations(str(tmp_path / 'partial'))
+
+    assert not info['complete'] and info['written_chapters'] == [0, 1, 2]
+    np.testing.assert_allclose(info['chapter'][:, :3], pickle_info['chapter'][:, :3])
+    np.testing.assert_array_equal(info['chapter'][:, 3:], 0)
+
+    # Reopened, the store holds the chapters written before it stopped
+    store = RelationsStore(str(tmp_path / 'partial' / RELATIONS_STORE_PARTIAL_DIR))
+    relations = store.get_chapters().to_dense()
+    np.testing.assert_allclose(relations[..., :3], pickle_info['relations'][..., :3])
+    np.testing.assert_array_equal(relations[..., 3:], 0)
+
+
+def test_relations_are_only_replaced_once_written(tmp_path):
+    chapters = get_book_relations()
+    write_book(tmp_path, 'pickle', chapters)
+
+    # A store that stops partway leaves the pickle in place, and it is still loaded
+    write_book(tmp_path, 'store', chapters, num_written=2)
+
+    assert os.path.exists(tmp_path / RELATIONS_FILE)
+    assert load_relations(str(tmp_path))['complete']
+
+    write_book(tmp_path, 'store', chapters)
+
+    assert not os.path.exists(tmp_path / RELATIONS_FILE)
+    assert not os.path.exists(tmp_path / RELATIONS_STORE_PARTIAL_DIR)
+    assert isinstance(load_relations(str(tmp_path))['relations'], RelationsStore)
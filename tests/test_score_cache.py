@@ -0,0 +1,77 @@
+import pytest
+
+from nlp.sentiment_scorer.lexicon_scorer import LexiconScorer
+from nlp.sentiment_scorer.score_cache import ScoreCache
+
+
+LEXICON = {"good": 2.0, "bad": -2.0, "not good": -1.0}
+
+
+@pytest.fixture
+def score_cache(tmp_path):
+    score_cache = ScoreCache(str(tmp_path / 'scores.sqlite'), max_entries=3)
+    yield score_cache
+    score_cache.close()
+
+
+def get_cached_keys(score_cache: ScoreCache) -> list[bytes]:
+    return [key for key, in score_cache._connect().execute("SELECT key FROM scores ORDER BY last_used, key")]
+
+
+def test_score_cache_counts_hits_and_misses(score_cache):
+    scorer = LexiconScorer(LEXICON, score_cache=score_cache)
+
+    assert scorer.get_batch(["good", "bad"]) == [2.0, -2.0]
+    assert scorer.get_batch(["good", "not good"]) == [2.0, -1.0]
+    assert scorer.get("bad") == -2.0
+
+    stats = score_cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 3, 3)
+    assert stats["hit_rate"] == pytest.approx(0.4)
+
+
+def test_score_cache_evicts_the_least_recently_used(score_cache):
+    scorer = LexiconScorer(LEXICON, score_cache=score_cache)
+    first, _, third, fourth = ScoreCache.get_keys(scorer.get_config(), ["good", "bad", "not good", "good bad"])
+
+    scorer.get_batch(["good"])
+    scorer.get_batch(["bad"])
+    scorer.get_batch(["not good"])
+    # A hit makes "good" the most recently used, so "bad" is evicted
+    scorer.get_batch(["good"])
+    scorer.get_batch(["good bad"])
+
+    assert set(get_cached_keys(score_cache)) == {first, third, fourth}
+    assert score_cache.get_stats()["evictions"] == 1
+
+
+def test_score_cache_is_not_shared_by_scorers_with_another_config(score_cache):
+    LexiconScorer(LEXICON, score_cache=score_cache).get_batch(["good"])
+
+    for scorer in (LexiconScorer(LEXICON, scale=0.5, score_cache=score_cache), LexiconScorer({"good": 1.0}, score_cache=score_cache)):
+        assert scorer.get_batch(["good"]) == [scorer.get_sentiment_score("good")]
+
+    assert score_cache.get_stats()["hits"] == 0
+
+
+def test_score_cache_commits_once_per_batch(score_cache):
+    scorer = LexiconScorer(LEXICON, score_cache=score_cache)
+    scorer.get_batch(["good", "bad"])
+
+    statements = []
+    score_cache._connect().set_trace_callback(statements.append)
+
+    # Hits only, then hits and misses
+    scorer.get_batch(["good", "bad"])
+    assert statements.count('COMMIT') == 1
+
+    scorer.get_batch(["good", "not good"])
+    assert statements.count('COMMIT') == 2
+
+    # Sentences scored one at a time are written in batches
+    for _ in range(5):
+        scorer.get("good")
+    assert statements.count('COMMIT') == 2
+
+    score_cache.close()
+    assert statements.count('COMMIT') == 3
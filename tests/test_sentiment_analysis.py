@@ -0,0 +1,87 @@
+import json
+
+import numpy as np
+import pytest
+
+from nlp.relations import get_chapter_relations
+from nlp.sentiment_analysis import _get_json_counts, _write_dense_interactions, add_chapter_relations, collate_relations, create_relations, write_relations
+
+
+RELATIONS_OPTIONS = [('store', False), ('pickle', False), ('pickle', True)]
+
+
+def write_chapter(characters_data_dir, sentence_idx, chars, sentiments, num_chars, relations_format, sparse, **kwargs):
+    """Writes the relations of a single chapter as `analyse_sentiments` does"""
+
+    with open(characters_data_dir / 'main_characters_aliases.json', 'w') as file:
+        json.dump([[f"Character {idx}"] for idx in range(num_chars)], file)
+
+    relations_arr = create_relations(str(characters_data_dir), num_chars, 1, relations_format, sparse)
+    chapter_values_arr = np.zeros((2, 1))
+
+    sentiments = np.array(sentiments, dtype=np.float64)
+    relations = get_chapter_relations(np.array(sentence_idx), np.array(chars), sentiments, num_chars, **kwargs)
+
+    add_chapter_relations(relations_arr, chapter_values_arr, 0, sentiments, relations)
+    write_relations(str(characters_data_dir), relations_arr, chapter_values_arr)
+
+
+@pytest.mark.parametrize('relations_format, sparse', RELATIONS_OPTIONS)
+def test_collate_relations_keeps_fractional_counts(tmp_path, relations_format, sparse):
+    # Sentence 0 has characters 0 and 1, sentence 1 character 1 and sentence 2 character 2
+    write_chapter(tmp_path, [0, 0, 1, 2], [0, 1, 1, 2], [1.0, 0.0, 2.0], 3, relations_format, sparse, window=2, decay=0.5)
+
+    collate_relations(str(tmp_path))
+
+    with open(tmp_path / 'interactions.json', 'r') as file:
+        interactions = json.load(file)
+
+    # 0 and 1 share sentence 0 (1 interaction, sentiment 1.0) and are 1 sentence apart (0.5 interaction, 0.5 * 0.5)
+    assert interactions[0][1] == pytest.approx([1.25 / 1.5, 1.5])
+    assert interactions[1][0] == pytest.approx([1.25 / 1.5, 1.5])
+
+    # 1 and 2 are only 1 sentence apart, 0.5 interaction with a sentiment of 0.5 * (0.0 + 2.0) / 2
+    assert interactions[1][2] == pytest.approx([1.0, 0.5])
+    assert interactions[2][1] == pytest.approx([1.0, 0.5])
+
+    # 0 and 2 are 2 sentences apart, beyond the window
+    assert interactions[0][2] == [0, 0]
+
+    collate_relations(str(tmp_path), output_format = 'edges')
+
+    with open(tmp_path / 'interactions_edges.json', 'r') as file:
+        edges = json.load(file)["edges"]
+
+    assert [edge[:2] for edge in edges] == [[0, 1], [1, 0], [1, 2], [2, 1]]
+    assert [edge[3] for edge in edges] == [1.5, 1.5, 0.5, 0.5]
+
+
+@pytest.mark.parametrize('relations_format, sparse', RELATIONS_OPTIONS)
+def test_collate_relations_writes_whole_counts_as_integers(tmp_path, relations_format, sparse):
+    write_chapter(tmp_path, [0, 0, 1, 1], [0, 1, 0, 1], [1.0, -1.0], 2, relations_format, sparse)
+
+    collate_relations(str(tmp_path))
+
+    with open(tmp_path / 'interactions.json', 'r') as file:
+        text = file.read()
+
+    assert json.loads(text) == [[None, [0.0, 2]], [[0.0, 2], None]]
+    assert '2.0' not in text
+
+
+@pytest.mark.parametrize('num_chars', [0, 1, 2, 7])
+def test_write_dense_interactions_matches_json_dump(tmp_path, num_chars):
+    rng = np.random.default_rng(num_chars)
+    char1, char2 = np.nonzero((rng.random((num_chars, num_chars)) < 0.6) & ~np.eye(num_chars, dtype=bool))
+    sentiments = rng.normal(scale=10.0, size=len(char1)) * rng.choice([1.0, 1e-8, 1e8], size=len(char1))
+    # Whole and fractional counts
+    counts = np.where(rng.random(len(char1)) < 0.5, rng.integers(1, 100, len(char1)), rng.random(len(char1)) * 10)
+
+    _write_dense_interactions(str(tmp_path / 'interactions.json'), num_chars, char1, char2, sentiments, counts)
+
+    interactions = [[None if i == j else [0, 0] for j in range(num_chars)] for i in range(num_chars)]
+    for i, j, sentiment, count in zip(char1.tolist(), char2.tolist(), sentiments.tolist(), _get_json_counts(counts)):
+        interactions[i][j] = [sentiment, count]
+
+    with open(tmp_path / 'interactions.json', 'r') as file:
+        assert file.read() == json.dumps(interactions, indent=4)
@@ -0,0 +1,45 @@
+import pytest
+
+from afinn import Afinn
+
+from nlp.sentiment_scorer.afinn_scorer import AfinnScorer
+from nlp.sentiment_scorer.lexicon_scorer import LexiconScorer
+
+
+SENTENCES = [
+    # Phrases, overlapping phrases and the words they are made of
+    "This does not work, and I can't stand it.",
+    "That was no fun, not good at all, kind of a cover-up.",
+    "Not good. Good! not  working\tat all",
+    "She was self-confident, once-in-a-lifetime good, bad luck though.",
+    "It's the best damn thing, fed up with\nall of it.",
+    # Punctuation and case
+    "GOOD...bad!!!love?hate;(happy)",
+    "\"Great,\" she said -- 'terrible'.",
+    "good-bad love_hate 'happy' ¡excelente! naïve",
+    # Nothing to score
+    "",
+    " ",
+    "...",
+    "Taylor walked to the door.",
+    # Separators used to join a batch
+    "good\x00bad\x00\x00love",
+    "\x01happy\x01"
+]
+
+
+def get_afinn_scores(sentences: list[str]) -> list[float]:
+    afinn = Afinn()
+
+    return [afinn.score(sentence) / 2 for sentence in sentences]
+
+
+@pytest.mark.parametrize('scorer_class', [AfinnScorer, lambda: LexiconScorer(Afinn()._dict, 0.5)])
+def test_lexicon_scorer_matches_afinn(scorer_class):
+    scorer = scorer_class()
+    expected = get_afinn_scores(SENTENCES)
+
+    # A batch and every sentence on its own
+    assert scorer.get_sentiment_scores(SENTENCES) == pytest.approx(expected)
+    assert [LexiconScorer.get_sentiment_score(scorer, sentence) for sentence in SENTENCES] == pytest.approx(expected)
+    assert scorer.get_sentiment_scores([]) == []
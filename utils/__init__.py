@@ -0,0 +1,2 @@
+from .chapter_splitter import ChapterIndex, split_chapters
+from .chunker import chunk_book, get_chunks_dir
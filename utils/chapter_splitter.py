@@ -1,37 +1,158 @@
 import argparse
+import json
+import mmap
 import os
 import re
 
-from typing import Pattern
+from typing import Iterator, Pattern
+
+
+def get_chapter_index_path(text_dir: str, book_name: str) -> str:
+    return os.path.join(text_dir, f"{book_name}.chapters.json")
+
+
+def _compile_delimiter(delimiter: str | Pattern) -> re.Pattern:
+    """Compiles the delimiter into a bytes pattern so it can be matched against the memory-mapped file"""
+
+    if isinstance(delimiter, re.Pattern):
+        if isinstance(delimiter.pattern, bytes):
+            return delimiter
+        return re.compile(delimiter.pattern.encode('utf-8'), delimiter.flags & ~re.UNICODE)
+
+    return re.compile(delimiter.encode('utf-8') if isinstance(delimiter, str) else delimiter)
+
+
+def _iter_sections(buffer: mmap.mmap | bytes, delimiter: re.Pattern) -> Iterator[tuple[int, int]]:
+    """Yields the byte range of every section between matches of `delimiter`"""
+
+    start = 0
+    for match in delimiter.finditer(buffer):
+        yield start, match.start()
+        start = match.end()
+
+    yield start, len(buffer)
+
+
+def _normalise_newlines(text: str) -> str:
+    return text.replace('\r\n', '\n').replace('\r', '\n')
 
 
 def split_chapters(
     text_dir: str,
     book_name: str,
-    delimiter: Pattern = r'\n{6,}'
-):
+    delimiter: Pattern = r'(?:\r\n?|\n){6,}',
+    write_files: bool = True
+) -> list[dict[str, any]]:
+    """Splits `<book_name>.txt` into chapters at every match of `delimiter` and writes them to `text_dir/<book_name>/`.
+
+    The book is memory-mapped and scanned section by section, so only one chapter is held in memory at a time. The
+    delimiter is matched against the raw bytes of the file, so line breaks are matched as stored. The default, 6 or
+    more line breaks, matches Windows (`\\r\\n`) and old Mac (`\\r`) line breaks too, as reading the book as text would.
+    A chapter index with the title and byte offsets of every chapter is written to `<book_name>.chapters.json` in
+    `text_dir` and returned, see `ChapterIndex`. With `write_files` False, only the index is written."""
+
     text_path = os.path.join(text_dir, f"{book_name}.txt")
 
-    os.makedirs(os.path.join(text_dir, book_name), exist_ok=True)
+    if write_files:
+        os.makedirs(os.path.join(text_dir, book_name), exist_ok=True)
+
+    delimiter = _compile_delimiter(delimiter)
+    chapters = []
+
+    with open(text_path, 'rb') as file:
+        stat = os.fstat(file.fileno())
+        # Empty files cannot be memory-mapped
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b''
+
+        try:
+            for index, (start, end) in enumerate(_iter_sections(buffer, delimiter)):
+                section = buffer[start:end].decode('utf-8')
+                stripped = section.strip()
+
+                # Byte offsets of the chapter text without its surrounding whitespace
+                start += len(section[:len(section) - len(section.lstrip())].encode('utf-8'))
+                end = start + len(stripped.encode('utf-8'))
+
+                text = _normalise_newlines(stripped)
+                title = text.split('\n', 1)[0]
+
+                chapter_title = re.sub(r'[^\w\-_]', '_', title)[:50]
+                chapter = f"Part-{index+1}-{chapter_title}"
+                chapters.append({"chapter": chapter, "title": title, "start": start, "end": end})
 
-    with open(text_path, 'r') as file:
-        content = file.read()
+                if not write_files:
+                    continue
 
-    sections = re.split(delimiter, content)
+                output_file = f"{chapter}.txt"
+                output_path = os.path.join(text_dir, book_name, output_file)
 
-    for index, section in enumerate(sections):
-        lines = section.strip().split('\n')
-        if not lines: 
-            continue
-        
-        chapter_title = re.sub(r'[^\w\-_]', '_', lines[0])[:50]
-        output_file = f"Part-{index+1}-{chapter_title}.txt"
-        output_path = os.path.join('text', book_name, output_file)
+                with open(output_path, 'w', encoding='utf-8') as output:
+                    output.write(text)
 
-        with open(output_path, 'w') as output:
-            output.write(section.strip())
+                print(f"Created {output_file}.")
+        finally:
+            if isinstance(buffer, mmap.mmap):
+                buffer.close()
 
-        print(f"Created {output_file}.")
+    chapter_index = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "chapters": chapters}
+
+    with open(get_chapter_index_path(text_dir, book_name), 'w') as file:
+        json.dump(chapter_index, file, indent=4)
+
+    return chapters
+
+
+class ChapterIndex():
+    """Class reading chapter text straight out of the memory-mapped book, using the index written by `split_chapters`.
+
+    The text returned for a chapter is the same as the content of its chapter file."""
+
+    def __init__(self, text_dir: str, book_name: str) -> None:
+        self.text_path = os.path.join(text_dir, f"{book_name}.txt")
+        index_path = get_chapter_index_path(text_dir, book_name)
+
+        if not os.path.exists(index_path):
+            raise FileNotFoundError(f"Missing {book_name}.chapters.json in given directory! Run split_chapters first.")
+
+        with open(index_path, 'r') as file:
+            chapter_index = json.load(file)
+
+        stat = os.stat(self.text_path)
+        if stat.st_size != chapter_index["size"] or stat.st_mtime_ns != chapter_index["mtime_ns"]:
+            raise ValueError(f"{self.text_path} has changed since its chapter index was written! Rerun split_chapters.")
+
+        self.chapters = chapter_index["chapters"]
+        self.offsets = {entry["chapter"]: (entry["start"], entry["end"]) for entry in self.chapters}
+
+        self.file = None
+        self.buffer = None
+
+    def get_chapter_names(self) -> list[str]:
+        return [entry["chapter"] for entry in self.chapters]
+
+    def get_text(self, chapter: str) -> str:
+        start, end = self.offsets[chapter]
+        if start == end:
+            return ''
+
+        if self.buffer is None:
+            self.file = open(self.text_path, 'rb')
+            self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return _normalise_newlines(self.buffer[start:end].decode('utf-8'))
+
+    def close(self) -> None:
+        if self.buffer is not None:
+            self.buffer.close()
+            self.file.close()
+            self.buffer = None
+            self.file = None
+
+    def __enter__(self) -> 'ChapterIndex':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
 
 
 if __name__ == "__main__":
@@ -48,7 +169,12 @@ if __name__ == "__main__":
         type=str,
         help="Directory of book file"
     )
+    parser.add_argument(
+        "--index-only",
+        action="store_true",
+        help="Only write the chapter index, not the chapter files"
+    )
 
     args = parser.parse_args()
 
-    split_chapters(args.text_dir, args.bookname)
+    split_chapters(args.text_dir, args.bookname, write_files=not args.index_only)
@@ -0,0 +1,209 @@
+import argparse
+import json
+import math
+import os
+import re
+
+from bisect import bisect_left
+
+try:
+    from .chapter_splitter import ChapterIndex
+except ImportError:
+    # Run as a script
+    from chapter_splitter import ChapterIndex
+
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+_PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n\s*")
+
+# Characters joining the pieces of a chunk, read as a paragraph break by BookNLP
+PIECE_SEPARATOR = "\n\n"
+
+
+def get_chunk_index_path(text_dir: str, book_name: str) -> str:
+    return os.path.join(text_dir, f"{book_name}.chunks.json")
+
+
+def get_chunks_dir(text_dir: str, book_name: str) -> str:
+    return os.path.join(text_dir, f"{book_name}_chunks")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimates the number of BookNLP tokens in `text` as its words and punctuation marks"""
+
+    return sum(1 for _ in _TOKEN.finditer(text))
+
+
+def get_token_budget(max_tokens: int, max_memory_mb: float | None = None, memory_per_token_kb: float = 64) -> int:
+    """Returns the largest number of tokens per chunk allowed by `max_tokens` and, if given, by `max_memory_mb` at
+    `memory_per_token_kb` of BookNLP memory per token (best measured on the machine, e.g. from a chapter run with
+    `run_ner_coref`)"""
+
+    if max_memory_mb is None:
+        return max_tokens
+
+    return max(1, min(max_tokens, int(max_memory_mb * 1024 / memory_per_token_kb)))
+
+
+def _get_paragraphs(text: str) -> list[tuple[int, int, int]]:
+    """Returns the `(start, end, num_tokens)` of every paragraph of `text`, paragraphs being separated by blank lines"""
+
+    paragraphs = []
+    start = 0
+
+    for match in _PARAGRAPH_BREAK.finditer(text):
+        if match.start() > start:
+            paragraphs.append((start, match.start(), estimate_tokens(text[start:match.start()])))
+        start = match.end()
+
+    if len(text) > start:
+        paragraphs.append((start, len(text), estimate_tokens(text[start:])))
+
+    return paragraphs
+
+
+def _split_chapter(text: str, budget: int) -> list[tuple[int, int, int]]:
+    """Splits a chapter at paragraph boundaries into about equal pieces of at most `budget` tokens, returning the
+    `(start, end, num_tokens)` of every piece. A paragraph longer than `budget` is a piece of its own."""
+
+    paragraphs = _get_paragraphs(text)
+    total_tokens = sum(num_tokens for _, _, num_tokens in paragraphs)
+
+    if not paragraphs:
+        return [(0, len(text), 0)]
+
+    target = math.ceil(total_tokens / math.ceil(total_tokens / budget)) if total_tokens > budget else budget
+
+    pieces = []
+    piece_start, piece_end, piece_tokens = paragraphs[0]
+
+    for start, end, num_tokens in paragraphs[1:]:
+        if piece_tokens + num_tokens > target:
+            pieces.append((piece_start, piece_end, piece_tokens))
+            piece_start, piece_tokens = start, 0
+
+        piece_end = end
+        piece_tokens += num_tokens
+
+    pieces.append((piece_start, piece_end, piece_tokens))
+
+    return pieces
+
+
+def _get_byte_offsets(raw_text: str, offsets: list[int]) -> list[int]:
+    """Maps character offsets in the text of a chapter (with normalised newlines) to byte offsets in its raw text"""
+
+    # Every \r\n before an offset was shortened to one character
+    crlf_offsets = [match.start() - idx for idx, match in enumerate(re.finditer('\r\n', raw_text))]
+
+    return [len(raw_text[:offset + bisect_left(crlf_offsets, offset)].encode('utf-8')) for offset in offsets]
+
+
+def chunk_book(
+    text_dir: str,
+    book_name: str,
+    max_tokens: int = 50000,
+    max_memory_mb: float | None = None,
+    memory_per_token_kb: float = 64
+) -> list[dict[str, any]]:
+    """Splits or merges the chapters of a book into chunks for BookNLP, as large as the token budget allows (see
+    `get_token_budget`), and writes them to `text_dir/<book_name>_chunks/`.
+
+    Chapters longer than the budget are split at paragraph boundaries into about equal pieces, and consecutive
+    chapters or pieces are packed into the same chunk while they fit, so BookNLP runs on fewer, larger texts. The
+    chapters are read through `ChapterIndex`, so `split_chapters` must have been run first. An index of the chunks is
+    written to `<book_name>.chunks.json` in `text_dir` and returned: every chunk lists its pieces, with the character
+    offsets of each piece in the chunk (`chunk_start`, `chunk_end`) and in its chapter (`chapter_start`,
+    `chapter_end`), and its byte offsets in the book (`start`, `end`). `stitch_chunks` uses it to map the BookNLP
+    outputs of the chunks back to the chapters."""
+
+    budget = get_token_budget(max_tokens, max_memory_mb, memory_per_token_kb)
+    chunks_dir = get_chunks_dir(text_dir, book_name)
+    os.makedirs(chunks_dir, exist_ok=True)
+
+    for file_name in os.listdir(chunks_dir):
+        os.remove(os.path.join(chunks_dir, file_name))
+
+    chunks = []
+    chunk_pieces, chunk_texts, chunk_tokens = [], [], 0
+
+    def write_chunk() -> None:
+        chunk = f"Chunk-{len(chunks)+1}"
+        with open(os.path.join(chunks_dir, f"{chunk}.txt"), 'w', encoding='utf-8') as file:
+            file.write(PIECE_SEPARATOR.join(chunk_texts))
+
+        chunks.append({"chunk": chunk, "num_tokens": chunk_tokens, "pieces": chunk_pieces})
+
+    with ChapterIndex(text_dir, book_name) as chapter_index:
+        with open(chapter_index.text_path, 'rb') as book_file:
+            for entry in chapter_index.chapters:
+                text = chapter_index.get_text(entry["chapter"])
+                pieces = _split_chapter(text, budget)
+
+                book_file.seek(entry["start"])
+                raw_text = book_file.read(entry["end"] - entry["start"]).decode('utf-8')
+                byte_offsets = _get_byte_offsets(raw_text, [offset for start, end, _ in pieces for offset in (start, end)])
+
+                for idx, (start, end, num_tokens) in enumerate(pieces):
+                    if chunk_pieces and chunk_tokens + num_tokens > budget:
+                        write_chunk()
+                        chunk_pieces, chunk_texts, chunk_tokens = [], [], 0
+
+                    chunk_start = sum(len(piece_text) + len(PIECE_SEPARATOR) for piece_text in chunk_texts)
+                    chunk_pieces.append({
+                        "chapter": entry["chapter"],
+                        "chapter_start": start,
+                        "chapter_end": end,
+                        "chunk_start": chunk_start,
+                        "chunk_end": chunk_start + end - start,
+                        "start": entry["start"] + byte_offsets[2 * idx],
+                        "end": entry["start"] + byte_offsets[2 * idx + 1]
+                    })
+                    chunk_texts.append(text[start:end])
+                    chunk_tokens += num_tokens
+
+    if chunk_pieces:
+        write_chunk()
+
+    with open(get_chunk_index_path(text_dir, book_name), 'w') as file:
+        json.dump({"max_tokens": budget, "chunks": chunks}, file, indent=4)
+
+    print(f"Created {len(chunks)} chunks.")
+
+    return chunks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chunker")
+
+    # Arguments
+    parser.add_argument(
+        "bookname",
+        type=str,
+        help="Name of book .txt file",
+    )
+    parser.add_argument(
+        "text_dir",
+        type=str,
+        help="Directory of book file"
+    )
+    parser.add_argument(
+        "-t",
+        "--max-tokens",
+        type=int,
+        help="Maximum number of tokens per chunk",
+        required=False,
+        default=50000
+    )
+    parser.add_argument(
+        "-m",
+        "--max-memory",
+        type=float,
+        help="Memory budget of BookNLP in MB",
+        required=False,
+        default=None
+    )
+
+    args = parser.parse_args()
+
+    chunk_book(args.text_dir, args.bookname, args.max_tokens, args.max_memory)